@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ChatSession, Message
+from .models import ChatSession, Message, ArchivedSession
 
 @admin.register(ChatSession)
 class ChatSessionAdmin(admin.ModelAdmin):
@@ -11,4 +11,10 @@ class ChatSessionAdmin(admin.ModelAdmin):
 class MessageAdmin(admin.ModelAdmin):
     list_display = ('session', 'content', 'is_from_user', 'created_at')
     list_filter = ('is_from_user', 'created_at')
-    search_fields = ('content', 'session__user__username') 
\ No newline at end of file
+    search_fields = ('content', 'session__user__username') 
+
+@admin.register(ArchivedSession)
+class ArchivedSessionAdmin(admin.ModelAdmin):
+    list_display = ('session', 'codec', 'message_count', 'last_sequence', 'archived_at')
+    list_filter = ('codec', 'archived_at')
+    exclude = ('payload',)
@@ -0,0 +1,108 @@
+import json
+import logging
+import zlib
+
+from django.db import transaction
+
+from .models import ArchivedSession, Message
+from .serializers import MessageSerializer
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; zlib keeps archives working without it
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ZSTD_LEVEL = 10
+
+
+def compress(data):
+    """Compress an archive payload, returning `(codec, blob)`."""
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return 'zlib', zlib.compress(data, 9)
+
+
+def decompress(codec, blob):
+    """Decompress an archive payload written by `compress`."""
+    blob = bytes(blob)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed archives")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    if codec == 'zlib':
+        return zlib.decompress(blob)
+    raise ValueError(f"Unknown archive codec: {codec}")
+
+
+def read_archive(archive):
+    """Return the archived messages of a session, oldest first."""
+    return json.loads(decompress(archive.codec, archive.payload))
+
+
+def search_text(messages):
+    """The searchable projection of archived messages: their content, one message per line."""
+    return '\n'.join(message['content'] for message in messages)
+
+
+def archive_session(session_id, chunk_size=1000):
+    """
+    Move the messages of a session from the hot table into its archive.
+
+    The archive row is written first, then the archived rows are deleted in
+    chunks of `chunk_size`, each in its own short transaction so no lock is
+    held for long. Messages arriving meanwhile keep higher sequence numbers
+    and stay in the hot table. The archive keeps the text of its messages in
+    `search_text`, so message search still finds them (see api.search). If the job dies half way, the leftover rows are
+    merged again on the next run, so archiving is safe to repeat.
+
+    Returns the number of messages moved.
+    """
+    rows = list(Message.objects.filter(session_id=session_id).order_by('sequence'))
+    if not rows:
+        return 0
+
+    with transaction.atomic():
+        archive = ArchivedSession.objects.select_for_update().filter(session_id=session_id).first()
+        messages = {message['sequence']: message for message in read_archive(archive)} if archive else {}
+        for row in rows:
+            messages[row.sequence] = dict(MessageSerializer(row).data)
+        ordered = [messages[sequence] for sequence in sorted(messages)]
+        codec, payload = compress(json.dumps(ordered, separators=(',', ':')).encode())
+        ArchivedSession.objects.update_or_create(
+            session_id=session_id,
+            defaults={
+                'codec': codec,
+                'payload': payload,
+                'search_text': search_text(ordered),
+                'message_count': len(ordered),
+                'last_sequence': ordered[-1]['sequence'],
+            }
+        )
+
+    ids = [row.id for row in rows]
+    for start in range(0, len(ids), chunk_size):
+        with transaction.atomic():
+            Message.objects.filter(id__in=ids[start:start + chunk_size]).delete()
+    logger.info(f"Archived {len(rows)} messages of chat session {session_id} ({codec}, {len(payload)} bytes)")
+    return len(rows)
+
+
+def get_session_messages(session):
+    """
+    Return every message of a session, oldest first, as serialized dicts.
+    Archived messages are read back transparently and merged with any newer
+    messages still in the hot table. Sessions loaded with
+    prefetch_related('messages') and select_related('archive') are served
+    without further queries.
+    """
+    rows = sorted(session.messages.all(), key=lambda message: message.sequence)
+    hot = [dict(data) for data in MessageSerializer(rows, many=True).data]
+    try:
+        archive = session.archive
+    except ArchivedSession.DoesNotExist:
+        return hot
+    messages = {message['sequence']: message for message in read_archive(archive)}
+    messages.update((message['sequence'], message) for message in hot)
+    return [messages[sequence] for sequence in sorted(messages)]
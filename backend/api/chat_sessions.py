@@ -0,0 +1,89 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import ChatSession
+
+User = get_user_model()
+
+
+def sessions_key(user_id):
+    return f"chat_sessions_{user_id}"
+
+
+def get_session_index(user_id):
+    """
+    The user's chat sessions as `(id, scope, is_active)` tuples, newest first.
+    Cached in the cache shared by the workers until one of the user's sessions
+    is created, changed or deleted (see signals), so finding the session of a connection or page view
+    doesn't query.
+    """
+    key = sessions_key(user_id)
+    index = cache.get(key)
+    if index is None:
+        index = list(
+            ChatSession.objects.filter(user_id=user_id)
+            .order_by('-created_at', '-id')
+            .values_list('id', 'scope', 'is_active')
+        )
+        cache.set(key, index, settings.CHAT_SESSION_CACHE_TIMEOUT)
+    return index
+
+
+def get_active_session_id(user_id, scope=''):
+    """
+    Id of the user's active chat session in `scope` (the newest one), or None.
+    An empty scope is the general chat.
+    """
+    for session_id, session_scope, is_active in get_session_index(user_id):
+        if is_active and session_scope == scope:
+            return session_id
+    return None
+
+
+def resolve_session(user_id, session_id=None, scope=''):
+    """
+    Id of the session a client asked for: `session_id`, which must be one of
+    the user's sessions, or else the active session of `scope`. Returns None
+    when the scope has no session yet. Raises ChatSession.DoesNotExist for a
+    session id that isn't the user's.
+
+    A session id missing from the index is looked up in the database before
+    being refused, in case it was created after the index was read.
+    """
+    if session_id in (None, ''):
+        return get_active_session_id(user_id, scope)
+    try:
+        session_id = int(session_id)
+    except (TypeError, ValueError):
+        raise ChatSession.DoesNotExist(f"Invalid chat session id: {session_id}")
+    if not any(session_id == indexed for indexed, _, _ in get_session_index(user_id)):
+        if not ChatSession.objects.filter(pk=session_id, user_id=user_id).exists():
+            raise ChatSession.DoesNotExist(f"No chat session {session_id} for user {user_id}")
+        forget_sessions(user_id)
+    return session_id
+
+
+def ensure_active_session(user_id, scope=''):
+    """
+    Id of the user's active chat session in `scope`, creating it if there is
+    none. Sessions are created here on the first message rather than when a
+    client connects, so opening the chat costs no writes. The user row is
+    locked while checking, so concurrent first messages share one session.
+    """
+    session_id = get_active_session_id(user_id, scope)
+    if session_id is not None:
+        return session_id
+    with transaction.atomic():
+        list(User.objects.select_for_update().filter(pk=user_id).values_list('pk'))
+        session_id = ChatSession.objects.filter(
+            user_id=user_id, scope=scope, is_active=True
+        ).values_list('id', flat=True).first()
+        if session_id is None:
+            session_id = ChatSession.objects.create(user_id=user_id, scope=scope).id
+    return session_id
+
+
+def forget_sessions(user_id):
+    cache.delete(sessions_key(user_id))
@@ -0,0 +1,64 @@
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+
+class Validators:
+    """
+    ETag and Last-Modified of a chat API response.
+
+    Both are derived from the session rows alone: `updated_at` moves whenever
+    a session is edited or gets a message (allocating a sequence number
+    touches it), and `last_sequence` counts the messages. Checking whether a
+    client's copy is current therefore reads one row, or one aggregate for the
+    session list, and never the messages themselves.
+    """
+    def __init__(self, etag, last_modified):
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @classmethod
+    async def for_session(cls, queryset, pk):
+        """Validators of one session, or None if it isn't in the queryset."""
+        try:
+            row = await queryset.filter(pk=pk).values_list('updated_at', 'last_sequence').afirst()
+        except (TypeError, ValueError):
+            return None
+        if row is None:
+            return None
+        updated_at, last_sequence = row
+        return cls(f'"s{pk}-{last_sequence}-{updated_at.timestamp():.6f}"', int(updated_at.timestamp()))
+
+    @classmethod
+    async def for_sessions(cls, queryset, user_id):
+        """
+        Validators of a user's session list. The count catches deleted
+        sessions, which leave neither the latest update nor the sequence total
+        behind.
+        """
+        state = await queryset.order_by().aaggregate(
+            count=Count('pk'), latest=Max('updated_at'), messages=Sum('last_sequence')
+        )
+        latest = state['latest'].timestamp() if state['latest'] else 0
+        return cls(
+            f'"u{user_id}-{state["count"]}-{state["messages"] or 0}-{latest:.6f}"',
+            int(latest) or None
+        )
+
+    def not_modified(self, request):
+        """Return a 304 response if the client's copy is current, else None."""
+        response = get_conditional_response(request, etag=self.etag, last_modified=self.last_modified)
+        return self.apply(response) if response is not None else None
+
+    def apply(self, response):
+        """
+        Set the validators and a private, always-revalidate cache policy:
+        browsers keep the body and revalidate it on every load, shared caches
+        don't store it at all.
+        """
+        response['ETag'] = self.etag
+        if self.last_modified:
+            response['Last-Modified'] = http_date(self.last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Authorization', 'Cookie'])
+        return response
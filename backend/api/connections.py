@@ -0,0 +1,314 @@
+import asyncio
+import logging
+import random
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .presence import get_presence_registry
+
+logger = logging.getLogger(__name__)
+
+# Close codes for connections the worker closes on its own
+IDLE_TIMEOUT_CODE = 4004
+EVICTED_CODE = 4005
+# Close code for a worker shutting down; the application-range counterpart of
+# 1012 (Service Restart), which daphne doesn't let applications send
+SERVICE_RESTART_CODE = 4012
+# Close code for connects turned away because the admission queue is full
+SERVER_BUSY_CODE = 4013
+
+
+class AdmissionGate:
+    """
+    Token bucket smoothing the connects a worker processes per second.
+
+    After a restart every client reconnects at once, and each connect costs
+    a rate-limit lookup, a token check and a session query. Connects beyond
+    `rate` per second (after a burst of `burst`) wait for their turn instead
+    of being rejected, so the work is spread over the following seconds.
+    A connect that would wait longer than `max_wait` seconds is refused.
+    A rate of 0 admits everything at once.
+    """
+    def __init__(self, rate=0, burst=0, max_wait=30):
+        self.rate = rate
+        self.burst = burst or rate
+        self.max_wait = max_wait
+        # Goes negative as connects reserve tokens ahead of time
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def backlog(self):
+        """Seconds a connect arriving now would wait."""
+        if not self.rate:
+            return 0
+        self._refill()
+        return max(0, 1 - self.tokens) / self.rate
+
+    def load(self):
+        """How full the admission queue is, from 0 to 1."""
+        return min(self.backlog() / self.max_wait, 1) if self.max_wait else 0
+
+    async def admit(self):
+        """Wait for this connect's turn; returns False if the wait would exceed max_wait."""
+        if not self.rate:
+            return True
+        wait = self.backlog()
+        if wait > self.max_wait:
+            return False
+        self.tokens -= 1
+        if wait:
+            await asyncio.sleep(wait)
+        return True
+
+
+class ConnectionState:
+    """
+    What a chat connection keeps between frames.
+
+    Most connections are idle learners with the chat open, so the state is
+    kept to ids and a username snapshot in a slotted object instead of
+    holding User and ChatSession model instances per socket.
+    """
+    __slots__ = (
+        'user_id', 'username', 'session_id', 'scope', 'device', 'connected_at',
+        'last_activity', 'last_sent_sequence', 'presence_registered',
+        'auth_type', 'token_expires_at', 'refresh_requested', 'keepalive',
+    )
+
+    def __init__(self, user_id, username, session_id, device='web', scope=''):
+        self.user_id = user_id
+        self.username = username
+        # None until the first message creates the session of the scope
+        self.session_id = session_id
+        self.scope = scope
+        self.device = device
+        self.connected_at = self.last_activity = time.time()
+        self.last_sent_sequence = 0
+        self.presence_registered = False
+        self.auth_type = None
+        self.token_expires_at = None
+        self.refresh_requested = False
+        # Set once the client sends a ping or pong of its own
+        self.keepalive = False
+
+    def presence_info(self):
+        return {
+            'device': self.device,
+            'worker': settings.WORKER_ID,
+            'connected_at': self.connected_at,
+            'last_activity': self.last_activity,
+        }
+
+
+class ConnectionRegistry:
+    """
+    The open WebSocket connections of this worker.
+
+    A single reaper task per worker pings connections that have been quiet
+    for `ping_interval` seconds and closes the ones that stayed silent for
+    `idle_timeout` seconds, so half-open sockets behind proxies and NAT don't
+    linger in groups and memory until TCP gives up. Clients that never took
+    part in the keepalive (sent a ping or pong) can't tell a quiet user from
+    a dead socket, so they get `silent_timeout` seconds without any frame
+    instead before they are closed. When `max_connections` is
+    reached, the connection that has been idle the longest is evicted to make
+    room for a new one. The same task closes connections whose token has
+    expired and heartbeats the presence entries of all the worker's
+    connections in one batch.
+
+    Its AdmissionGate paces new connects, and `reconnect_policy` tells
+    clients how long to wait before reconnecting, based on that gate's queue.
+    On shutdown, `drain` empties the worker: clients are told to reconnect
+    elsewhere after a random delay, and connections are closed once the
+    answers they are waiting for have been generated and saved.
+
+    Consumers must expose `channel_name`, `state` (a ConnectionState),
+    `turns` (their TurnScheduler or None), `send_ping()`, `send_frame(frame)`,
+    `check_token_refresh(now)` (returning False once it closed an expired
+    connection) and `close_with_error(code, reason)`.
+    """
+    def __init__(self, ping_interval=25, idle_timeout=75, silent_timeout=900, max_connections=0,
+                 reconnect_jitter=10, admission=None):
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+        self.silent_timeout = silent_timeout
+        self.max_connections = max_connections
+        self.reconnect_jitter = reconnect_jitter
+        self.admission = admission or AdmissionGate()
+        self.connections = {}
+        self.counters = {
+            'pings_sent': 0, 'reaped_idle': 0, 'evicted': 0, 'token_expired': 0,
+            'stream_chunks': 0, 'stream_frames': 0,
+        }
+        self._reaper = None
+        self._last_heartbeat = 0
+        self.draining = False
+
+    def __len__(self):
+        return len(self.connections)
+
+    async def add(self, consumer):
+        """Track a connection, evicting the longest idle one when the worker is full."""
+        if self.max_connections and len(self.connections) >= self.max_connections:
+            oldest = min(self.connections.values(), key=lambda c: c.state.last_activity)
+            self.discard(oldest)
+            self.counters['evicted'] += 1
+            logger.info(f"[WebSocket] Evicting idle connection {oldest.channel_name}: worker is full")
+            await self.close(oldest, EVICTED_CODE, "Server is at capacity, idle connection closed")
+        self.connections[consumer.channel_name] = consumer
+        self._ensure_reaper()
+
+    def discard(self, consumer):
+        self.connections.pop(consumer.channel_name, None)
+
+    def _ensure_reaper(self):
+        # The reaper belongs to the loop it was started on; start a new one
+        # if that loop is gone or the reaper exited after the last connection.
+        loop = asyncio.get_running_loop()
+        if self._reaper is None or self._reaper.done() or self._reaper.get_loop() is not loop:
+            self._reaper = loop.create_task(self.reap())
+
+    async def reap(self):
+        presence = get_presence_registry()
+        tick = min(self.ping_interval, presence.heartbeat_interval)
+        while self.connections:
+            await asyncio.sleep(tick)
+            now = time.time()
+            await self.check(now)
+            # Heartbeat now if waiting for the next tick would exceed the interval
+            if now + tick - self._last_heartbeat > presence.heartbeat_interval:
+                await self.heartbeat()
+                self._last_heartbeat = now
+
+    async def check(self, now):
+        """Ping quiet connections and close expired ones and the ones idle past the timeout."""
+        for consumer in list(self.connections.values()):
+            if not await consumer.check_token_refresh(now):
+                self.discard(consumer)
+                self.counters['token_expired'] += 1
+                continue
+            idle = now - consumer.state.last_activity
+            timeout = self.idle_timeout if consumer.state.keepalive else max(self.idle_timeout, self.silent_timeout)
+            if idle >= timeout:
+                self.discard(consumer)
+                self.counters['reaped_idle'] += 1
+                await self.close(consumer, IDLE_TIMEOUT_CODE, "Connection idle for too long")
+            elif idle >= self.ping_interval:
+                try:
+                    await consumer.send_ping()
+                    self.counters['pings_sent'] += 1
+                except Exception as e:
+                    logger.warning(f"[WebSocket] Failed to ping {consumer.channel_name}: {str(e)}")
+
+    async def heartbeat(self):
+        """
+        Refresh the presence entries of all registered connections. The
+        heartbeat adds back entries that were pruned, so connections that
+        closed while it ran are unregistered again afterwards.
+        """
+        entries = [
+            (consumer.state.user_id, channel_name, consumer.state.presence_info())
+            for channel_name, consumer in self.connections.items()
+            if consumer.state.presence_registered
+        ]
+        if not entries:
+            return
+        presence = get_presence_registry()
+        try:
+            await sync_to_async(presence.heartbeat_many, thread_sensitive=False)(entries)
+            for user_id, channel_name, _ in entries:
+                if channel_name not in self.connections:
+                    await sync_to_async(presence.unregister, thread_sensitive=False)(user_id, channel_name)
+        except Exception as e:
+            logger.warning(f"[WebSocket] Presence heartbeat failed: {str(e)}")
+
+    async def close(self, consumer, code, reason):
+        try:
+            await consumer.close_with_error(code, reason)
+        except Exception as e:
+            logger.warning(f"[WebSocket] Failed to close {consumer.channel_name}: {str(e)}")
+
+    def reconnect_policy(self):
+        """
+        When clients should reconnect after losing their connection: at a
+        random point of the window, which starts once the connects already
+        queued for admission are through. `load` is how full that queue is.
+        """
+        backlog = self.admission.backlog()
+        return {
+            'min_delay_ms': int(backlog * 1000),
+            'max_delay_ms': int((backlog + self.reconnect_jitter) * 1000),
+            'load': round(self.admission.load(), 2),
+        }
+
+    def reconnect_frame(self):
+        """Tell a client to reconnect after a random delay, spreading the reconnects out."""
+        policy = self.reconnect_policy()
+        return {
+            'type': 'reconnect',
+            'delay_ms': random.randint(policy['min_delay_ms'], policy['max_delay_ms']),
+            'reconnect': policy,
+        }
+
+    async def drain(self, timeout, jitter):
+        """
+        Close every connection of the worker before it shuts down.
+
+        All clients get a `reconnect` frame with a delay picked within `jitter`
+        seconds, so they come back spread out instead of all at once. Idle
+        connections are closed right away; the others once their outstanding
+        turns are answered, or when `timeout` seconds have passed.
+        """
+        self.draining = True
+        self.reconnect_jitter = jitter
+        deadline = time.monotonic() + timeout
+        logger.info(f"[WebSocket] Draining {len(self.connections)} connections")
+        for consumer in list(self.connections.values()):
+            try:
+                await consumer.send_frame(self.reconnect_frame())
+            except Exception as e:
+                logger.warning(f"[WebSocket] Failed to send reconnect hint to {consumer.channel_name}: {str(e)}")
+
+        while True:
+            for consumer in list(self.connections.values()):
+                if consumer.turns is None or not len(consumer.turns):
+                    self.discard(consumer)
+                    await self.close(consumer, SERVICE_RESTART_CODE, "Server restarting")
+            if not self.connections or time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(0.1)
+
+        if self.connections:
+            logger.warning(f"[WebSocket] Drain deadline passed with {len(self.connections)} turns still running")
+        for consumer in list(self.connections.values()):
+            self.discard(consumer)
+            await self.close(consumer, SERVICE_RESTART_CODE, "Server restarting")
+
+    def record_stream(self, buffer):
+        """Count the chunks received and frames sent for one streamed answer."""
+        self.counters['stream_chunks'] += buffer.chunks_received
+        self.counters['stream_frames'] += buffer.frames_sent
+
+    def stats(self):
+        return {'connections': len(self.connections), **self.counters}
+
+
+connection_registry = ConnectionRegistry(
+    ping_interval=settings.WEBSOCKET_PING_INTERVAL,
+    idle_timeout=settings.WEBSOCKET_IDLE_TIMEOUT,
+    silent_timeout=settings.WEBSOCKET_SILENT_TIMEOUT,
+    max_connections=settings.WEBSOCKET_MAX_CONNECTIONS_PER_WORKER,
+    reconnect_jitter=settings.WEBSOCKET_RECONNECT_JITTER,
+    admission=AdmissionGate(
+        rate=settings.WEBSOCKET_ADMISSION_RATE,
+        burst=settings.WEBSOCKET_ADMISSION_BURST,
+        max_wait=settings.WEBSOCKET_ADMISSION_MAX_WAIT,
+    ),
+)
@@ -1,25 +1,45 @@
-import json
 import logging
+import time
 import uuid
+from urllib.parse import unquote
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from .models import ChatSession, Message
+from .models import ChatSession
 from datetime import datetime, timezone
 import jwt
 from django.conf import settings
-from django.core.cache import cache
+from django.core import signing
 from django.utils import timezone as django_timezone
-from .flowise_client import FlowiseClient
+from .chat_sessions import ensure_active_session, resolve_session
+from .history_cache import get_messages_since
+from .ratelimit import check_rate_limit
+from .events import message_frame, user_group
+from .presence import get_presence_registry
+from .connections import SERVER_BUSY_CODE, SERVICE_RESTART_CODE, ConnectionState, connection_registry
+from .turns import Turn, TurnScheduler, answer_turn, save_message
+from .outbound import StreamBuffer
+from .tickets import read_ticket
+from .wire import FrameDecodeError, json_codec, negotiate
 
 # Configure logger
 logger = logging.getLogger(__name__)
 
-# Rate limiting settings
-RATE_LIMIT_WINDOW = 60  # 1 minute window
-MAX_CONNECTIONS_PER_WINDOW = 5  # Maximum connections per minute per IP
+# Close code sent when a user already has the maximum number of open connections
+TOO_MANY_CONNECTIONS_CODE = 4003
+
+# Close code for a connection asking for a chat session that isn't the user's;
+# 4004 is taken by the idle timeout of api.connections
+UNKNOWN_SESSION_CODE = 4040
+
+# Error code for messages rejected because the connection has too many turns outstanding
+TURN_QUEUE_FULL_CODE = 4029
+
+# Clients are asked to send a `refresh_token` frame this many seconds before their token expires
+TOKEN_REFRESH_MARGIN = 300
 
 User = get_user_model()
 
@@ -30,11 +50,13 @@ class ChatConsumer(AsyncWebsocketConsumer):
     """
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.chat_session = None
-        self.user = None
-        self.is_connected = False
-        self.last_token_refresh = None
+        # Set once the connection is authenticated
+        self.state = None
         self.connection_accepted = False
+        # Frame encoding, picked from the subprotocols the client offers
+        self.codec = json_codec
+        # Created with the first message, so idle connections don't carry one
+        self.turns = None
 
     async def connect(self):
         """
@@ -43,12 +65,15 @@ class ChatConsumer(AsyncWebsocketConsumer):
         1. Extracts and verifies the token from query string
         2. Determines authentication type (JWT or OAuth2)
         3. Authenticates the user
-        4. Creates/retrieves a chat session
+        4. Finds the chat session: the one named by `session_id`, or the
+           active session of `scope` (the general chat without one). A scope
+           without a session gets it with the first message
         5. Sets up the WebSocket connection
         """
         # Only keep connection established log
         try:
-            await self.accept()
+            self.codec = negotiate(self.scope.get('subprotocols', []))
+            await self.accept(subprotocol=self.codec.subprotocol)
             self.connection_accepted = True
             logger.info("[WebSocket] Connection accepted successfully.")
         except Exception as e:
@@ -60,6 +85,17 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return
 
         try:
+            # A worker shutting down sends new clients on to another one
+            if connection_registry.draining:
+                await self.send_frame(connection_registry.reconnect_frame())
+                await self.close_with_error(SERVICE_RESTART_CODE, "Server restarting")
+                return
+
+            # Smooth reconnect storms: wait for a slot before doing any work
+            if not await connection_registry.admission.admit():
+                await self.close_with_error(SERVER_BUSY_CODE, "Server busy. Please reconnect later.")
+                return
+
             client_ip = self.scope.get('client', ('0.0.0.0', 0))[0]
             if not await self.check_rate_limit(client_ip):
                 logger.warning("[WebSocket] Rate limit exceeded for IP: %s", client_ip)
@@ -69,51 +105,66 @@ class ChatConsumer(AsyncWebsocketConsumer):
             query_string = self.scope['query_string'].decode()
             token = None
             auth_type = None
+            device = 'web'
+            session_id = None
+            scope = ''
             for param in query_string.split('&'):
                 if param.startswith('token='):
                     token = param.split('=')[1]
                 elif param.startswith('auth_type='):
                     auth_type = param.split('=')[1]
+                elif param.startswith('device='):
+                    device = param.split('=')[1][:32] or device
+                elif param.startswith('session_id='):
+                    session_id = param.split('=')[1]
+                elif param.startswith('scope='):
+                    scope = unquote(param.split('=', 1)[1])[:255]
 
             if not token or not auth_type:
                 logger.warning("[WebSocket] No token or auth_type provided.")
                 await self.close_with_error(4001, "No token or auth_type provided")
                 return
 
-            user = None
-            if auth_type == 'jwt':
-                user = await self.verify_jwt_token(token)
-                if not user:
-                    logger.warning("[WebSocket] Invalid JWT token provided.")
-                    await self.close_with_error(4001, "Invalid JWT token provided")
-                    return
-            elif auth_type == 'oauth2':
-                user = await self.verify_oauth2_token(token)
-                if not user:
-                    logger.warning("[WebSocket] Invalid OAuth2 token provided.")
-                    await self.close_with_error(4001, "Invalid OAuth2 token provided")
-                    return
-            else:
-                logger.warning(f"[WebSocket] Invalid auth_type: {auth_type}")
-                await self.close_with_error(4001, f"Invalid auth_type: {auth_type}")
+            user, expires_at, error = await self.authenticate(token, auth_type)
+            if error:
+                logger.warning(f"[WebSocket] {error}.")
+                await self.close_with_error(4001, error)
                 return
 
-            self.user = user
-            self.last_token_refresh = django_timezone.now()
-            self.is_connected = True
+            # A ticket names the scope and session it was issued for
+            if auth_type == 'ticket':
+                ticket = read_ticket(token)
+                session_id, scope = ticket.session_id, ticket.scope
+            try:
+                session_id, last_sequence = await self.get_chat_session(user.id, session_id, scope)
+            except ChatSession.DoesNotExist as e:
+                logger.warning(f"[WebSocket] {str(e)}")
+                await self.close_with_error(UNKNOWN_SESSION_CODE, "Unknown chat session")
+                return
+            state = ConnectionState(user.id, user.username, session_id, device, scope)
+            state.auth_type = auth_type
+            state.token_expires_at = expires_at
+
+            if not await self.register_presence(state):
+                logger.warning(f"[WebSocket] Connection limit reached for user {state.user_id}")
+                await self.close_with_error(TOO_MANY_CONNECTIONS_CODE, "Too many open connections")
+                return
+            self.state = state
+            await connection_registry.add(self)
 
             await self.channel_layer.group_add(
-                f"user_{self.user.id}",
+                user_group(state.user_id),
                 self.channel_name
             )
 
-            self.chat_session = await self.get_or_create_chat_session()
-
             try:
-                await self.send(text_data=json.dumps({
+                await self.send_frame({
                     "type": "user_info",
-                    "username": self.user.username
-                }))
+                    "username": state.username,
+                    "last_sequence": last_sequence,
+                    "token_expires_at": expires_at,
+                    "reconnect": connection_registry.reconnect_policy()
+                })
             except Exception as e:
                 logger.error(f"[WebSocket] Failed to send user_info message: {str(e)}")
 
@@ -126,7 +177,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     'message': f"Connection error: {str(e)}",
                     'timestamp': datetime.now(timezone.utc).isoformat()
                 }
-                await self.send(text_data=json.dumps(error_data))
+                await self.send_frame(error_data)
             except Exception as send_error:
                 logger.error(f"[WebSocket] Failed to send error message: {str(send_error)}")
             finally:
@@ -135,6 +186,58 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 except Exception as close_error:
                     logger.error(f"[WebSocket] Failed to close connection: {str(close_error)}")
 
+    async def register_presence(self, state):
+        """
+        Register this connection in the presence registry.
+        Returns False when the user already has the maximum number of open
+        connections. If the registry is unreachable the connection is let
+        through; the event bus then falls back to the user group. Heartbeats
+        are sent for all connections of the worker by the connection registry.
+        """
+        registry = get_presence_registry()
+        try:
+            registered = await sync_to_async(registry.register, thread_sensitive=False)(
+                state.user_id, self.channel_name, state.presence_info()
+            )
+        except Exception as e:
+            logger.error(f"[WebSocket] Failed to register presence: {str(e)}")
+            return True
+        state.presence_registered = registered
+        return registered
+
+    async def unregister_presence(self):
+        if not self.state.presence_registered:
+            return
+        self.state.presence_registered = False
+        registry = get_presence_registry()
+        try:
+            await sync_to_async(registry.unregister, thread_sensitive=False)(self.state.user_id, self.channel_name)
+        except Exception as e:
+            logger.warning(f"[WebSocket] Failed to unregister presence: {str(e)}")
+
+    async def send_ping(self):
+        """Ask the client for a pong so a half-open connection shows up as idle."""
+        await self.send_frame({
+            'type': 'ping',
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        })
+
+    async def resume(self, last_sequence):
+        """
+        Replay the messages the client missed since `last_sequence`.
+        Messages come from the hot history buffer, so the cost of a reconnect
+        depends on how much was missed rather than on the history size.
+        """
+        messages, truncated = await self.get_messages_since(last_sequence)
+        if messages:
+            self.state.last_sent_sequence = max(self.state.last_sent_sequence, messages[-1]['sequence'])
+        await self.send_frame({
+            'type': 'history',
+            'messages': messages,
+            'truncated': truncated,
+            'last_sequence': messages[-1]['sequence'] if messages else last_sequence
+        })
+
     async def close_with_error(self, code, reason):
         """Helper method to close connection with error message."""
         try:
@@ -144,9 +247,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     'type': 'error',
                     'code': code,
                     'message': reason,
-                    'timestamp': datetime.now(timezone.utc).isoformat()
+                    'timestamp': datetime.now(timezone.utc).isoformat(),
+                    'reconnect': connection_registry.reconnect_policy()
                 }
-                await self.send(text_data=json.dumps(error_data))
+                await self.send_frame(error_data)
         except Exception as e:
             logger.warning(f"Could not send error message before closing: {str(e)}")
         finally:
@@ -158,22 +262,33 @@ class ChatConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def check_rate_limit(self, client_ip):
         """Check if the client has exceeded rate limits."""
-        cache_key = f"ws_rate_limit_{client_ip}"
-        current_time = django_timezone.now()
-        
-        # Get current connection count
-        connection_count = cache.get(cache_key, 0)
-        
-        if connection_count >= MAX_CONNECTIONS_PER_WINDOW:
-            return False
-            
-        # Increment connection count
-        cache.set(cache_key, connection_count + 1, RATE_LIMIT_WINDOW)
-        return True
+        return check_rate_limit(client_ip)
+
+    async def authenticate(self, token, auth_type):
+        """
+        Verify a token of the given auth type.
+        Returns (user, expires_at, None) on success and (None, None, error) otherwise.
+        """
+        if auth_type == 'jwt':
+            verified = await self.verify_jwt_token(token)
+            if not verified:
+                return None, None, "Invalid JWT token provided"
+        elif auth_type == 'oauth2':
+            verified = await self.verify_oauth2_token(token)
+            if not verified:
+                return None, None, "Invalid OAuth2 token provided"
+        elif auth_type == 'ticket':
+            verified = await self.verify_ticket(token)
+            if not verified:
+                return None, None, "Invalid or expired ticket provided"
+        else:
+            return None, None, f"Invalid auth_type: {auth_type}"
+        user, expires_at = verified
+        return user, expires_at, None
 
     @database_sync_to_async
     def verify_jwt_token(self, token):
-        """Verify JWT token and get user."""
+        """Verify JWT token and get the user and the token expiry timestamp."""
         try:
             # Decode the token
             access_token = AccessToken(token)
@@ -186,14 +301,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
             user_id = access_token['user_id']
             
             # Get the user
-            return User.objects.get(id=user_id)
+            return User.objects.get(id=user_id), int(access_token['exp'])
         except (InvalidToken, TokenError, User.DoesNotExist) as e:
             logger.warning(f"JWT token verification failed: {str(e)}")
             return None
 
     @database_sync_to_async
     def verify_oauth2_token(self, token):
-        """Verify OAuth2 token and get user."""
+        """Verify OAuth2 token and get the user and the token expiry timestamp."""
         try:
             logger.info(f"OAuth2 verification: Attempting to decode token: {token[:20]}...")
             # Decode token
@@ -217,138 +332,331 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 return None
                 
             # Get the user
-            return User.objects.get(id=user_id)
+            return User.objects.get(id=user_id), int(payload['exp'])
         except (jwt.InvalidTokenError, User.DoesNotExist) as e:
             logger.warning(f"OAuth2 token verification failed: {str(e)}")
             return None
 
-    async def check_token_refresh(self):
-        """Check if token needs to be refreshed."""
-        if not self.last_token_refresh or not self.connection_accepted:
-            return
-            
-        # Check if token is about to expire (within 5 minutes)
-        if (django_timezone.now() - self.last_token_refresh).total_seconds() > 300:
+    @database_sync_to_async
+    def verify_ticket(self, token):
+        """
+        Verify a signed WebSocket ticket and get the user and the connection expiry.
+        A ticket is only good for connecting for a short while; the connection
+        it opens then lasts as long as one opened with an access token.
+        """
+        try:
+            ticket = read_ticket(token)
+            lifetime = settings.SIMPLE_JWT['ACCESS_TOKEN_LIFETIME'].total_seconds()
+            return User.objects.get(id=ticket.user_id), int(ticket.issued_at + lifetime)
+        except (signing.BadSignature, User.DoesNotExist) as e:
+            logger.warning(f"Ticket verification failed: {str(e)}")
+            return None
+
+    async def check_token_refresh(self, now=None):
+        """
+        Enforce the expiry of the connection's token.
+        Closes the connection once the token has expired and returns False;
+        shortly before that, asks the client once to send a `refresh_token`
+        frame. Called for every message and by the worker's reaper for idle
+        connections.
+        """
+        if not self.state or not self.connection_accepted:
+            return False
+        now = now or time.time()
+        expires_at = self.state.token_expires_at
+        if expires_at is None:
+            return True
+        if now >= expires_at:
+            logger.info(f"[WebSocket] Token of user {self.state.user_id} expired, closing connection")
+            await self.close_with_error(4001, "Token expired")
+            return False
+
+        if now >= expires_at - TOKEN_REFRESH_MARGIN and not self.state.refresh_requested:
+            self.state.refresh_requested = True
             try:
-                await self.send(text_data=json.dumps({
+                await self.send_frame({
                     'type': 'token_refresh_required',
                     'message': 'Your session is about to expire. Please refresh your token.',
+                    'expires_at': expires_at,
                     'timestamp': datetime.now(timezone.utc).isoformat()
-                }))
+                })
             except Exception as e:
                 logger.warning(f"Could not send token refresh message: {str(e)}")
+        return True
+
+    async def refresh_token(self, token, auth_type):
+        """
+        Replace the connection's token with a new one for the same user.
+        An invalid token is answered with an error frame; the connection stays
+        open on the current token until that one expires.
+        """
+        user, expires_at, error = await self.authenticate(token, auth_type or self.state.auth_type)
+        if not error and user.id != self.state.user_id:
+            error = "Token belongs to another user"
+        if error:
+            logger.warning(f"[WebSocket] Token refresh rejected for user {self.state.user_id}: {error}")
+            await self.send_frame({
+                'type': 'error',
+                'code': 4001,
+                'message': error,
+                'timestamp': datetime.now(timezone.utc).isoformat()
+            })
+            return
+        self.state.auth_type = auth_type or self.state.auth_type
+        self.state.token_expires_at = expires_at
+        self.state.refresh_requested = False
+        await self.send_frame({
+            'type': 'token_refreshed',
+            'expires_at': expires_at
+        })
 
-    async def receive(self, text_data):
+    async def send_frame(self, frame):
+        """Encode a frame with the connection's codec and send it."""
+        if self.codec.binary:
+            await self.send(bytes_data=self.codec.encode(frame))
+        else:
+            await self.send(text_data=self.codec.encode(frame))
+
+    async def receive(self, text_data=None, bytes_data=None):
         """
         Handle incoming WebSocket messages.
         """
-        if not self.is_connected or not self.user or not self.connection_accepted:
+        if not self.state or not self.connection_accepted:
             await self.close_with_error(4001, "Not connected or no user")
             return
             
+        self.state.last_activity = time.time()
         try:
-            # Check token refresh before processing message
-            await self.check_token_refresh()
+            text_data_json = self.codec.decode(text_data, bytes_data)
+            message_type = text_data_json.get('type')
+
+            # Keepalive frames only need to count as activity, and opt the
+            # client in to being closed once it goes quiet
+            if message_type in ('ping', 'pong'):
+                self.state.keepalive = True
+            if message_type == 'pong':
+                return
+            if message_type == 'ping':
+                await self.send_frame({
+                    'type': 'pong',
+                    'timestamp': datetime.now(timezone.utc).isoformat()
+                })
+                return
+
+            if message_type == 'refresh_token':
+                token = text_data_json.get('token')
+                if not isinstance(token, str) or not token:
+                    await self.close_with_error(4001, "Invalid message format")
+                    return
+                await self.refresh_token(token, text_data_json.get('auth_type'))
+                return
+
+            # Check token expiry before processing message
+            if not await self.check_token_refresh():
+                return
             
-            text_data_json = json.loads(text_data)
-            logger.info(f"Received message from {self.user.username}: {text_data_json}")
+            logger.info(f"Received message from {self.state.username}: {text_data_json}")
             
-            message_type = text_data_json.get('type')
             content = text_data_json.get('content')
             message_id = text_data_json.get('id', str(uuid.uuid4()))
+
+            if message_type == 'resume':
+                try:
+                    last_sequence = max(int(text_data_json.get('last_sequence') or 0), 0)
+                except (TypeError, ValueError):
+                    await self.close_with_error(4001, "Invalid resume sequence")
+                    return
+                await self.resume(last_sequence)
+                return
+
+            if message_type == 'cancel':
+                dropped = self.turns.cancel() if self.turns else []
+                await self.send_frame({
+                    'type': 'cancelled',
+                    'ids': [id for turn in dropped for id in turn.ids]
+                })
+                return
             
             if message_type != 'message' or not content:
                 await self.close_with_error(4001, "Invalid message format")
                 return
-            
+
+            if self.turns is None:
+                self.turns = TurnScheduler(
+                    self.process_turn,
+                    max_outstanding=settings.CHAT_MAX_OUTSTANDING_TURNS,
+                    debounce=settings.CHAT_DEBOUNCE_MS / 1000
+                )
+            if connection_registry.draining:
+                # Not saved: the client sends it again once reconnected
+                await self.send_frame({
+                    'type': 'error',
+                    'code': SERVICE_RESTART_CODE,
+                    'id': message_id,
+                    'message': 'Server is restarting. Please send your message again after reconnecting.',
+                    'timestamp': datetime.now(timezone.utc).isoformat()
+                })
+                return
+            received_at = time.monotonic()
+            if self.turns.full(received_at):
+                await self.send_queue_full(message_id)
+                return
+
             # Save user message to database
-            await self.save_message(content, is_from_user=True)
+            user_message = await self.save_message(content, is_from_user=True)
             logger.info(f"Saved user message: {content[:50]}...")
-            
-            # Use Flowise to get a response
-            flowise_client = FlowiseClient()
-            try:
-                logger.info(f"About to call flowise_client.send_message: {content}")
-                session_id = str(self.chat_session.id) if self.chat_session else None
-                flowise_response = await flowise_client.send_message(content, session_id=session_id)
+            await self.send_frame({
+                'type': 'ack',
+                'id': message_id,
+                'sequence': user_message.sequence
+            })
+            self.state.last_sent_sequence = max(self.state.last_sent_sequence, user_message.sequence)
+
+            # The answer is generated in the background so this connection
+            # keeps handling frames meanwhile
+            if not self.turns.submit(Turn(message_id, content, user_message.sequence, received_at)):
+                await self.send_queue_full(message_id)
                 
-                logger.info(f"flowise_client.send_message returned: {flowise_response}")
-                if isinstance(flowise_response, dict) and "text" in flowise_response:
-                    response_content = flowise_response["text"]
-                    logger.info(f"if: response_content: {response_content}")
-                else:
-                    response_content = str(flowise_response)
-                    logger.info(f"else: response_content: {response_content}")
-            except Exception as e:
-                logger.error(f"Error calling Flowise: {str(e)}")
-                response_content = "Sorry, there was an error getting a response from the AI.Try again later."
-            
-            # Save Flowise response to database
-            await self.save_message(response_content, is_from_user=False)
-            logger.info(f"Saved Flowise response: {response_content}")
+        except FrameDecodeError:
+            await self.close_with_error(4001, f"Invalid {self.codec.name} format")
+        except Exception as e:
+            logger.error(f"Error in receive: {str(e)}", exc_info=True)
+            await self.close_with_error(4001, f"Message processing error: {str(e)}")
+
+    async def send_queue_full(self, message_id):
+        """Tell the client its message won't be answered: too many turns are outstanding."""
+        await self.send_frame({
+            'type': 'error',
+            'code': TURN_QUEUE_FULL_CODE,
+            'id': message_id,
+            'message': 'Too many messages waiting for an answer. Please wait for a reply.',
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        })
+
+    async def process_turn(self, turn):
+        """
+        Generate, store and send the answer to a turn of one or more user
+        messages. Run by the connection's TurnScheduler, one turn at a time in
+        order; merged messages are sent to Flowise as one question.
+        """
+        try:
+            # The messages still waiting behind this turn stay out of its prompt
+            pending = [sequence for queued in self.turns.pending for sequence in queued.sequences]
+            stream = self.stream_buffer(turn) if settings.CHAT_STREAM_ANSWERS else None
+            try:
+                response_message = await answer_turn(
+                    turn,
+                    self.state.session_id,
+                    self.state.user_id,
+                    exclude=pending,
+                    stream=stream,
+                    origin=self.channel_name
+                )
+            finally:
+                if stream is not None:
+                    connection_registry.record_stream(stream)
             
+            # The client may have left while the answer was generated; it
+            # picks the saved answer up when it resumes
+            if not self.connection_accepted:
+                return
+
             # Send response back to user directly through WebSocket
-            response_data = {
-                'type': 'message',
-                'id': str(uuid.uuid4()),
-                'content': response_content,
-                'isUser': False,
-                'timestamp': datetime.now(timezone.utc).isoformat()
-            }
+            response_data = message_frame(response_message)
             logger.info(f"Sending response: {response_data}")
-            await self.send(text_data=json.dumps(response_data))
-                
-        except json.JSONDecodeError:
-            await self.close_with_error(4001, "Invalid JSON format")
+            await self.send_message_frame(response_data)
         except Exception as e:
-            logger.error(f"Error in receive: {str(e)}", exc_info=True)
+            logger.error(f"Error in process_turn: {str(e)}", exc_info=True)
             await self.close_with_error(4001, f"Message processing error: {str(e)}")
 
-    async def chat_message(self, event):
-        """Handle chat messages."""
-        try:
-            if not self.is_connected or not self.user or not self.connection_accepted:
-                logger.warning("Received chat_message event while not connected, no user, or connection not accepted")
+    def stream_buffer(self, turn):
+        """
+        Buffer for the streamed answer to a turn. Chunks reach the client as
+        `stream` frames; the complete answer still follows as a regular
+        message frame.
+        """
+        reply_to = turn.ids[-1]
+
+        async def send_chunk(text):
+            if not self.connection_accepted:
                 return
+            await self.send_frame({'type': 'stream', 'id': reply_to, 'content': text})
+
+        return StreamBuffer.from_settings(send_chunk)
 
-            # Extract message data from event
-            content = event.get('content', '')
-            if not content or not content.strip():
-                logger.info("Skipping empty chat message event.")
+    async def send_message_frame(self, frame):
+        """Send a message frame and remember it so bus events don't repeat it."""
+        await self.send_frame(frame)
+        self.state.last_sent_sequence = max(self.state.last_sent_sequence, frame['sequence'])
+
+    async def chat_events(self, event):
+        """
+        Handle a batch of chat events from the event bus.
+        Events this connection already delivered itself, events for other
+        sessions and frames older than the last one sent are skipped.
+        """
+        try:
+            if not self.state or not self.connection_accepted:
+                logger.warning("Received chat_events while not connected, no user, or connection not accepted")
                 return
-            message_data = {
-                'type': 'message',
-                'id': str(uuid.uuid4()),
-                'content': content,
-                'isUser': event.get('isUser', False),
-                'timestamp': datetime.now(timezone.utc).isoformat()
-            }
-            logger.info(f"Processing chat message event: {message_data}")
-            # Send message to WebSocket
-            await self.send(text_data=json.dumps(message_data))
+
+            for entry in event.get('events', []):
+                frame = entry['frame']
+                if entry.get('origin') == self.channel_name:
+                    continue
+                if frame['session_id'] != self.state.session_id:
+                    continue
+                if frame['sequence'] <= self.state.last_sent_sequence:
+                    continue
+                await self.send_message_frame(frame)
         except Exception as e:
-            logger.error(f"Error in chat_message: {str(e)}", exc_info=True)
+            logger.error(f"Error in chat_events: {str(e)}", exc_info=True)
             if self.connection_accepted:
                 await self.close(code=4001)
 
     @database_sync_to_async
-    def get_or_create_chat_session(self):
-        """Get or create a chat session for the user."""
-        chat_session, created = ChatSession.objects.get_or_create(
-            user=self.user,
-            defaults={'is_active': True}
-        )
-        return chat_session
+    def get_chat_session(self, user_id, session_id=None, scope=''):
+        """
+        Return the id and last sequence of the connection's chat session,
+        resolved through the user's cached session index. (None, 0) when the
+        scope has no session yet; nothing is created until the first message.
+        Raises ChatSession.DoesNotExist for a session that isn't the user's.
+        """
+        session_id = resolve_session(user_id, session_id, scope)
+        if session_id is None:
+            return None, 0
+        last_sequence = ChatSession.objects.filter(pk=session_id).values_list('last_sequence', flat=True).first()
+        if last_sequence is None:
+            raise ChatSession.DoesNotExist(f"Chat session {session_id} was deleted")
+        return session_id, last_sequence
+
+    @database_sync_to_async
+    def get_messages_since(self, last_sequence):
+        """Get the messages of the chat session after a sequence number."""
+        if self.state.session_id is None:
+            return [], False
+        return get_messages_since(self.state.session_id, last_sequence)
 
     @database_sync_to_async
     def save_message(self, content, is_from_user):
-        """Save a message to the database."""
-        return Message.objects.create(
-            session=self.chat_session,
-            content=content,
-            is_from_user=is_from_user
+        """
+        Save a message of this connection's session, tagged with its channel.
+        The first message in a scope without a session creates it.
+        """
+        if self.state.session_id is None:
+            self.state.session_id = ensure_active_session(self.state.user_id, self.state.scope)
+        return save_message(
+            self.state.session_id, self.state.user_id, content, is_from_user, origin=self.channel_name
         )
 
     async def disconnect(self, close_code):
         logger.info(f"[WebSocket] Disconnected. Close code: {close_code}")
+        connection_registry.discard(self)
+        # Nothing more is sent on this socket. The turns outstanding, whose
+        # messages were saved and acked, are still answered in the background;
+        # the client gets the answers when it resumes
+        self.connection_accepted = False
+        if self.state:
+            await self.unregister_presence()
+            await self.channel_layer.group_discard(user_group(self.state.user_id), self.channel_name)
         await super().disconnect(close_code)
\ No newline at end of file
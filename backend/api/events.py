@@ -0,0 +1,107 @@
+import asyncio
+import logging
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from .presence import get_presence_registry
+
+logger = logging.getLogger(__name__)
+
+
+def user_group(user_id):
+    """Name of the channel-layer group every connection of a user joins."""
+    return f"user_{user_id}"
+
+
+def message_frame(message):
+    """
+    Build the client frame for a chat message.
+    This is the single schema used for messages on the socket, whether sent
+    directly by a consumer or fanned out through the event bus.
+    """
+    return {
+        'type': 'message',
+        'id': message.id,
+        'session_id': message.session_id,
+        'sequence': message.sequence,
+        'content': message.content,
+        'isUser': message.is_from_user,
+        'timestamp': message.created_at.isoformat(),
+    }
+
+
+class EventBus:
+    """
+    Batches outgoing chat events per user.
+
+    Events queued within `window` seconds of each other for the same user go
+    out as one `chat.events` message, so a burst of saves costs one
+    channel-layer round trip per connection instead of one per message. The
+    batch is sent straight to the user's live connections from the presence
+    registry; if the registry can't be read it goes to the user group. Batches
+    live on the
+    event loop that queued them; if that loop shuts down before the window
+    closes (a short-lived loop created by async_to_sync), the batch is sent
+    right away instead of being lost.
+    """
+    def __init__(self, window):
+        self.window = window
+        self._batches = {}
+
+    async def enqueue(self, user_id, entry):
+        key = (asyncio.get_running_loop(), user_id)
+        batch = self._batches.get(key)
+        if batch is not None:
+            batch.append(entry)
+            return
+        self._batches[key] = [entry]
+        asyncio.ensure_future(self._flush_later(key))
+
+    async def _flush_later(self, key):
+        try:
+            await asyncio.sleep(self.window)
+        except asyncio.CancelledError:
+            pass
+        await self._flush(key)
+
+    async def _flush(self, key):
+        entries = self._batches.pop(key, [])
+        if not entries:
+            return
+        _, user_id = key
+        message = {'type': 'chat.events', 'events': entries}
+        layer = get_channel_layer()
+        try:
+            registry = get_presence_registry()
+            connections = await sync_to_async(registry.live_connections, thread_sensitive=False)(user_id)
+        except Exception as e:
+            logger.warning(f"Presence lookup failed for user {user_id}, sending to group: {str(e)}")
+            connections = None
+        try:
+            if connections is None:
+                await layer.group_send(user_group(user_id), message)
+            else:
+                await asyncio.gather(*(layer.send(channel, message) for channel in connections))
+        except Exception as e:
+            logger.error(f"Failed to publish {len(entries)} events to user {user_id}: {str(e)}")
+
+
+event_bus = EventBus(window=settings.CHAT_EVENTS_BATCH_WINDOW_MS / 1000)
+
+
+def publish(user_id, frame, origin=None):
+    """
+    Publish a frame to a user's connections once the current transaction commits.
+    `origin` is the channel name of the connection that already delivered the
+    frame itself; that connection skips it when the batch arrives.
+    """
+    entry = {'frame': frame, 'origin': origin}
+    transaction.on_commit(lambda: async_to_sync(event_bus.enqueue)(user_id, entry))
+
+
+def publish_message(message, origin=None):
+    """Publish a newly saved message to every connection of its owner."""
+    publish(message.session.user_id, message_frame(message), origin=origin)
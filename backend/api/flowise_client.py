@@ -1,8 +1,9 @@
 import os
+import json
 import aiohttp
 import asyncio
 from django.conf import settings
-from typing import Dict, Any, Optional
+from typing import AsyncIterator, Dict, Any, List, Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,20 +11,64 @@ logger = logging.getLogger(__name__)
 class FlowiseClient:
     """
     Client for interacting with Flowise API for LLM orchestration.
+    One instance can be shared by all connections of a worker: requests go
+    through a single pooled HTTP session per event loop.
     """
     def __init__(self):
         self.base_url = os.getenv('FLOWISE_URL', 'http://flowise:3000')
         self.flow_id = os.getenv('FLOWISE_FLOW_ID')
         self.timeout = int(os.getenv('FLOWISE_TIMEOUT', 60))
         self.max_retries = int(os.getenv('FLOWISE_MAX_RETRIES', 10))
+        self._session = None
+        self._session_loop = None
 
-    async def send_message(self, message: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+    def get_session(self) -> aiohttp.ClientSession:
+        """Return the HTTP session of the running event loop, creating it if needed."""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._close_stale_session(loop)
+            self._session = aiohttp.ClientSession()
+            self._session_loop = loop
+        return self._session
+
+    def _close_stale_session(self, loop):
+        """Close the session of a previous event loop, on that loop if it still runs."""
+        session, session_loop = self._session, self._session_loop
+        self._session = None
+        if session is None or session.closed:
+            return
+        if session_loop is not None and session_loop.is_running():
+            asyncio.run_coroutine_threadsafe(session.close(), session_loop)
+        else:
+            # Nothing runs on the old loop any more; the connector releases
+            # its connections without it
+            loop.create_task(self._close_session(session))
+
+    @staticmethod
+    async def _close_session(session):
+        try:
+            await session.close()
+        except Exception as e:
+            logger.warning(f"Could not close previous Flowise session: {str(e)}")
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def send_message(
+        self,
+        message: str,
+        session_id: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> Dict[str, Any]:
         """
         Send a message to Flowise and get the response.
         
         Args:
             message: The message to send
             session_id: Optional session ID for conversation continuity
+            history: Optional recent turns as {"role", "content"} dicts
             
         Returns:
             Dict containing the response from Flowise
@@ -34,26 +79,27 @@ class FlowiseClient:
             "question": message,
             "sessionId": session_id
         }
+        if history:
+            payload["history"] = history
 
         logger.info(f"FlowiseClient: Sending payload to Flowise: {payload}")
 
         # Tries up to max_retries times in case of errors.
         for attempt in range(self.max_retries):
             try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(
-                        url,
-                        json=payload,
-                        timeout=self.timeout
-                    ) as response:
-                        if response.status == 200:
-                            # If the response is successful, return the JSON response.
-                            logger.info(f"Flowise API response: {await response.json()}")
-                            return await response.json()
-                        
-                        else:
-                            error_text = await response.text()
-                            raise Exception(f"Flowise API error: {error_text}")
+                async with self.get_session().post(
+                    url,
+                    json=payload,
+                    timeout=self.timeout
+                ) as response:
+                    if response.status == 200:
+                        # If the response is successful, return the JSON response.
+                        logger.info(f"Flowise API response: {await response.json()}")
+                        return await response.json()
+                    
+                    else:
+                        error_text = await response.text()
+                        raise Exception(f"Flowise API error: {error_text}")
             except asyncio.TimeoutError:
                 if attempt == self.max_retries - 1:
                     raise Exception("Flowise API timeout after all retries")
@@ -63,6 +109,62 @@ class FlowiseClient:
                     raise Exception(f"Flowise API error: {str(e)}")
                 await asyncio.sleep(1)  # Wait before retrying
 
+    async def stream_message(
+        self,
+        message: str,
+        session_id: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Send a message to Flowise and yield the answer as it is generated.
+
+        Uses the streaming prediction API, which replies with server-sent
+        events. Unlike send_message this is not retried: part of the answer
+        may already have been yielded when an error occurs.
+
+        Args:
+            message: The message to send
+            session_id: Optional session ID for conversation continuity
+            history: Optional recent turns as {"role", "content"} dicts
+
+        Yields:
+            The text chunks of the answer, in order
+        """
+        url = f"{self.base_url}/api/v1/prediction/{self.flow_id}"
+
+        payload = {
+            "question": message,
+            "sessionId": session_id,
+            "streaming": True
+        }
+        if history:
+            payload["history"] = history
+
+        logger.info(f"FlowiseClient: Streaming payload to Flowise: {payload}")
+
+        async with self.get_session().post(
+            url,
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=None, sock_read=self.timeout)
+        ) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                raise Exception(f"Flowise API error: {error_text}")
+            async for line in response.content:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                try:
+                    event = json.loads(line[5:])
+                except ValueError:
+                    continue
+                if event.get("event") == "token":
+                    yield event.get("data", "")
+                elif event.get("event") == "error":
+                    raise Exception(f"Flowise API error: {event.get('data')}")
+                elif event.get("event") == "end":
+                    return
+
     async def check_health(self) -> bool:
         """
         Check if Flowise is healthy and accessible.
@@ -71,11 +173,10 @@ class FlowiseClient:
             bool: True if healthy, False otherwise
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    f"{self.base_url}/api/v1/health",
-                    timeout=5
-                ) as response:
-                    return response.status == 200
+            async with self.get_session().get(
+                f"{self.base_url}/api/v1/health",
+                timeout=5
+            ) as response:
+                return response.status == 200
         except:
             return False 
\ No newline at end of file
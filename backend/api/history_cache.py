@@ -0,0 +1,269 @@
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from redis.exceptions import RedisError
+
+from .archive import get_session_messages
+from .models import ChatSession, Message
+from .redis_client import get_redis_connection
+from .serializers import MessageSerializer
+
+logger = logging.getLogger(__name__)
+
+
+class BaseHistoryBuffer(ABC):
+    """
+    Capped per-session buffer holding the most recent messages of a chat session.
+
+    A buffer is either warm (it holds the complete tail of the session) or
+    missing. Appends only go to warm buffers so a buffer can never hold a
+    tail with holes in it; a miss is filled from the database by the caller.
+    """
+    def __init__(self, max_messages=50, timeout=3600, **kwargs):
+        self.max_messages = max_messages
+        self.timeout = timeout
+
+    @abstractmethod
+    def append(self, session_id, message):
+        """Append a message to the session buffer if it is warm."""
+
+    @abstractmethod
+    def get(self, session_id, limit=None):
+        """Return up to `limit` most recent messages, or None on a miss."""
+
+    @abstractmethod
+    def warm(self, session_id, messages):
+        """Replace the session buffer with the given messages (oldest first)."""
+
+    @abstractmethod
+    def clear(self, session_id):
+        """Drop the session buffer."""
+
+
+class RedisHistoryBuffer(BaseHistoryBuffer):
+    """History buffer stored as one capped Redis list per session."""
+    key_prefix = 'hot_history'
+
+    def __init__(self, location, **kwargs):
+        super().__init__(**kwargs)
+        self.location = location
+
+    @property
+    def redis(self):
+        return get_redis_connection(self.location)
+
+    def key(self, session_id):
+        return f"{self.key_prefix}:{session_id}"
+
+    def append(self, session_id, message):
+        key = self.key(session_id)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.rpushx(key, json.dumps(message))
+            pipe.ltrim(key, -self.max_messages, -1)
+            pipe.expire(key, self.timeout)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Hot history append failed for session {session_id}: {str(e)}")
+
+    def get(self, session_id, limit=None):
+        key = self.key(session_id)
+        limit = min(limit or self.max_messages, self.max_messages)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.lrange(key, -limit, -1)
+            pipe.expire(key, self.timeout)
+            items, exists = pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Hot history read failed for session {session_id}: {str(e)}")
+            return None
+        if not exists:
+            return None
+        return [json.loads(item) for item in items]
+
+    def warm(self, session_id, messages):
+        if not messages:
+            return
+        key = self.key(session_id)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.delete(key)
+            pipe.rpush(key, *[json.dumps(message) for message in messages])
+            pipe.ltrim(key, -self.max_messages, -1)
+            pipe.expire(key, self.timeout)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Hot history warm failed for session {session_id}: {str(e)}")
+
+    def clear(self, session_id):
+        try:
+            self.redis.delete(self.key(session_id))
+        except RedisError as e:
+            logger.warning(f"Hot history clear failed for session {session_id}: {str(e)}")
+
+
+class InMemoryHistoryBuffer(BaseHistoryBuffer):
+    """Process-local history buffer for tests and single-process development."""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def _live_buffer(self, session_id):
+        entry = self._buffers.get(session_id)
+        if entry is None:
+            return None
+        buffer, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._buffers[session_id]
+            return None
+        return buffer
+
+    def append(self, session_id, message):
+        with self._lock:
+            buffer = self._live_buffer(session_id)
+            if buffer is not None:
+                buffer.append(message)
+                self._buffers[session_id] = (buffer, time.monotonic() + self.timeout)
+
+    def get(self, session_id, limit=None):
+        limit = min(limit or self.max_messages, self.max_messages)
+        with self._lock:
+            buffer = self._live_buffer(session_id)
+            if buffer is None:
+                return None
+            self._buffers[session_id] = (buffer, time.monotonic() + self.timeout)
+            return list(buffer)[-limit:]
+
+    def warm(self, session_id, messages):
+        if not messages:
+            return
+        with self._lock:
+            buffer = deque(messages, maxlen=self.max_messages)
+            self._buffers[session_id] = (buffer, time.monotonic() + self.timeout)
+
+    def clear(self, session_id):
+        with self._lock:
+            self._buffers.pop(session_id, None)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_history_buffer():
+    """Return the process-wide history buffer configured by HOT_HISTORY."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                config = dict(settings.HOT_HISTORY)
+                backend = import_string(config.pop('BACKEND'))
+                _buffer = backend(**{key.lower(): value for key, value in config.items()})
+    return _buffer
+
+
+def serialize_message(message):
+    """Serialize a message the same way the history API does."""
+    return dict(MessageSerializer(message).data)
+
+
+def cache_message(message):
+    """Append a newly saved message to its session's hot history."""
+    get_history_buffer().append(message.session_id, serialize_message(message))
+
+
+def load_tail(session_id, limit):
+    """
+    Load the `limit` most recent messages of a session from the database,
+    oldest first. When the hot table doesn't reach back to the first message
+    the older ones may be archived, and the tail is completed from the archive.
+    """
+    rows = list(Message.objects.filter(session_id=session_id).order_by('-sequence')[:limit])
+    if len(rows) < limit and (not rows or rows[-1].sequence > 1):
+        return get_session_messages(ChatSession(id=session_id))[-limit:]
+    return [serialize_message(message) for message in reversed(rows)]
+
+
+def get_recent_messages(session_id, limit=None):
+    """
+    Return the most recent messages of a session, oldest first.
+
+    Served from the hot history buffer when it is warm; on a miss the tail is
+    loaded from the database and used to warm the buffer. Requests for more
+    messages than the buffer holds always go to the database.
+
+    A message committed while the tail was being read isn't appended (the
+    buffer was still missing), so the buffer is dropped again if the session
+    has moved past the tail it was warmed with. Messages committed after the
+    warm-up are appended as usual.
+    """
+    buffer = get_history_buffer()
+    limit = limit or buffer.max_messages
+    if limit > buffer.max_messages:
+        return load_tail(session_id, limit)
+
+    cached = buffer.get(session_id, limit)
+    if cached is not None:
+        return cached
+
+    messages = load_tail(session_id, buffer.max_messages)
+    buffer.warm(session_id, messages)
+    if messages:
+        latest_sequence = ChatSession.objects.filter(pk=session_id).values_list('last_sequence', flat=True).first()
+        if latest_sequence is not None and latest_sequence > messages[-1]['sequence']:
+            buffer.clear(session_id)
+    return messages[-limit:]
+
+
+def get_messages_since(session_id, after_sequence):
+    """
+    Return the messages a client missed after `after_sequence`, oldest first.
+
+    Returns a `(messages, truncated)` tuple. The replay never exceeds the hot
+    history window; when the client missed more than that, the most recent
+    window is returned with `truncated` set so the client can page the gap
+    from the history API.
+    """
+    buffer = get_history_buffer()
+    latest_sequence = ChatSession.objects.filter(pk=session_id).values_list('last_sequence', flat=True).first()
+    if not latest_sequence or latest_sequence <= after_sequence:
+        return [], False
+
+    messages = get_recent_messages(session_id)
+    if not messages or messages[-1]['sequence'] < latest_sequence:
+        # The buffer lags behind the database; rebuild it from the source.
+        buffer.clear(session_id)
+        messages = get_recent_messages(session_id)
+
+    missed = [message for message in messages if message['sequence'] > after_sequence]
+    truncated = bool(missed) and missed[0]['sequence'] > after_sequence + 1
+    return missed, truncated
+
+
+def get_prompt_history(session_id, limit, exclude=()):
+    """
+    Return the recent turns of a session in Flowise's `history` format.
+    Messages whose sequence is in `exclude` (the question being answered and
+    any queued behind it) are left out.
+    """
+    if not limit:
+        return []
+    exclude = set(exclude)
+    messages = [
+        message for message in get_recent_messages(session_id, limit + len(exclude))
+        if message['sequence'] not in exclude
+    ]
+    return [
+        {
+            'role': 'userMessage' if message['is_from_user'] else 'apiMessage',
+            'content': message['content'],
+        }
+        for message in messages[-limit:]
+    ]
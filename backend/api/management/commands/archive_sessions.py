@@ -0,0 +1,72 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from api.archive import archive_session
+from api.models import ChatSession
+
+
+class Command(BaseCommand):
+    help = "Move messages of inactive chat sessions into compressed cold storage."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+            help='Archive sessions with no activity for this many days.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Number of sessions selected per batch.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Number of message rows deleted per transaction.'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=0.0,
+            help='Seconds to pause between batches to limit load on the database.'
+        )
+        parser.add_argument(
+            '--vacuum', action='store_true',
+            help='Run VACUUM ANALYZE on the message table afterwards (PostgreSQL only).'
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        started = time.monotonic()
+        sessions_archived = 0
+        messages_archived = 0
+        last_id = 0
+
+        while True:
+            # Keyset pagination over session ids keeps each batch query cheap
+            batch = list(
+                ChatSession.objects
+                .filter(id__gt=last_id, updated_at__lt=cutoff, messages__isnull=False)
+                .order_by('id')
+                .values_list('id', flat=True)
+                .distinct()[:options['batch_size']]
+            )
+            if not batch:
+                break
+            for session_id in batch:
+                moved = archive_session(session_id, chunk_size=options['chunk_size'])
+                if moved:
+                    sessions_archived += 1
+                    messages_archived += moved
+            last_id = batch[-1]
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        if options['vacuum'] and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM (ANALYZE) api_message')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {messages_archived} messages from {sessions_archived} sessions "
+            f"inactive since {cutoff:%Y-%m-%d} in {time.monotonic() - started:.2f}s"
+        ))
@@ -1,3 +1,5 @@
+import gzip
+
 from channels.middleware import BaseMiddleware
 from channels.auth import AuthMiddlewareStack
 from django.contrib.auth.models import AnonymousUser
@@ -6,8 +8,15 @@ from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from django.contrib.auth import get_user_model
 from django.utils.deprecation import MiddlewareMixin
 from oauth2_provider.models import AccessToken as OAuth2AccessToken
-from asgiref.sync import sync_to_async
+from asgiref.sync import sync_to_async, iscoroutinefunction, markcoroutinefunction
 from channels.db import database_sync_to_async
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
 
 User = get_user_model()
 
@@ -79,4 +88,102 @@ class AllowIframeEmbeddingMiddleware(MiddlewareMixin):
     """
     def process_response(self, request, response):
         response['X-Frame-Options'] = 'ALLOW-FROM http://local.openedx.io'
-        return response 
\ No newline at end of file
+        return response
+
+# Only API JSON is compressed. Pages (the OAuth callback page carries the
+# tokens it received) and the endpoints handing out credentials never are,
+# whatever their size, keeping secrets out of reach of compression side channels
+COMPRESSIBLE_TYPES = ('application/json',)
+COMPRESSED_PATH_PREFIX = '/api/'
+CREDENTIAL_PATHS = ('/api/auth/', '/api/oauth/', '/api/xblock/websocket-token/')
+
+# Bodies above this size are compressed in a worker thread rather than on the event loop
+OFFLOAD_BYTES = 64 * 1024
+
+def accepted_encoding(header):
+    """
+    Pick the content coding for an Accept-Encoding header: the accepted one
+    with the highest q-value, brotli winning ties. None if neither is accepted.
+    """
+    weights = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+    wildcard = weights.get('*', 0.0)
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best = max(candidates, key=lambda coding: weights.get(coding, wildcard))
+    return best if weights.get(best, wildcard) > 0 else None
+
+def compress(body, coding):
+    if coding == 'br':
+        return brotli.compress(body, mode=brotli.MODE_TEXT, quality=settings.API_COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=settings.API_COMPRESSION_GZIP_LEVEL, mtime=0)
+
+class CompressionMiddleware:
+    """
+    Compress API responses with brotli or gzip, as negotiated with the client.
+
+    Only complete JSON responses of the API of at least
+    API_COMPRESSION_MIN_BYTES are compressed, except those of the endpoints
+    issuing tokens and tickets (see CREDENTIAL_PATHS). Streaming responses (the SSE chat endpoint, file downloads)
+    pass through untouched: compressing them would hold events back in the
+    compressor, and static files already come precompressed from whitenoise.
+    Under ASGI, large bodies are compressed in a worker thread so a big
+    history response doesn't stall the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        coding = self.negotiate(request, response)
+        if coding:
+            self.compress_response(response, coding)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        coding = self.negotiate(request, response)
+        if coding and len(response.content) > OFFLOAD_BYTES:
+            await sync_to_async(self.compress_response, thread_sensitive=False)(response, coding)
+        elif coding:
+            self.compress_response(response, coding)
+        return response
+
+    def negotiate(self, request, response):
+        """Return the coding to compress the response with, or None."""
+        if not settings.API_COMPRESSION or response.streaming or response.has_header('Content-Encoding'):
+            return None
+        if not request.path.startswith(COMPRESSED_PATH_PREFIX) or request.path.startswith(CREDENTIAL_PATHS):
+            return None
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if content_type not in COMPRESSIBLE_TYPES or len(response.content) < settings.API_COMPRESSION_MIN_BYTES:
+            return None
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return accepted_encoding(request.headers.get('Accept-Encoding', ''))
+
+    def compress_response(self, response, coding):
+        compressed = compress(response.content, coding)
+        if len(compressed) >= len(response.content):
+            return
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = coding
+        # The representation changed: only a weak ETag still holds
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag 
\ No newline at end of file
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:20
+
+from django.db import migrations, models
+
+
+def backfill_sequences(apps, schema_editor):
+    """
+    Number existing messages per session in creation order.
+    Two set-based UPDATEs rather than one per message, so large tables are
+    backfilled in one pass each (UPDATE ... FROM needs PostgreSQL or
+    SQLite 3.33+).
+    """
+    quote = schema_editor.quote_name
+    session_table = quote(apps.get_model("api", "ChatSession")._meta.db_table)
+    message_table = quote(apps.get_model("api", "Message")._meta.db_table)
+    schema_editor.execute(
+        f"UPDATE {message_table} SET sequence = numbered.sequence "
+        f"FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY created_at, id) AS sequence "
+        f"FROM {message_table}) AS numbered "
+        f"WHERE {message_table}.id = numbered.id"
+    )
+    schema_editor.execute(
+        f"UPDATE {session_table} SET last_sequence = totals.last_sequence "
+        f"FROM (SELECT session_id, MAX(sequence) AS last_sequence FROM {message_table} "
+        f"GROUP BY session_id) AS totals "
+        f"WHERE {session_table}.id = totals.session_id"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatsession",
+            name="last_sequence",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="message",
+            name="sequence",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_sequences, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="message",
+            constraint=models.UniqueConstraint(
+                fields=("session", "sequence"), name="unique_message_sequence"
+            ),
+        ),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations
+
+# Full-text search index over Message.content.
+# PostgreSQL: GIN expression index on to_tsvector, maintained by the index itself.
+# It is built CONCURRENTLY so chat inserts carry on while it builds, which
+# can't run in a transaction: the migration is non-atomic. A build that fails
+# leaves an INVALID index behind; drop it before migrating again.
+# SQLite: external-content FTS5 table kept in sync by triggers.
+
+POSTGRES_FORWARD = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS api_message_content_search "
+    "ON api_message USING gin (to_tsvector('english', content))",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX CONCURRENTLY IF EXISTS api_message_content_search",
+]
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS api_message_fts "
+    "USING fts5(content, content='api_message', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS api_message_fts_insert AFTER INSERT ON api_message BEGIN "
+    "INSERT INTO api_message_fts(rowid, content) VALUES (new.id, new.content); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS api_message_fts_delete AFTER DELETE ON api_message BEGIN "
+    "INSERT INTO api_message_fts(api_message_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS api_message_fts_update AFTER UPDATE OF content ON api_message BEGIN "
+    "INSERT INTO api_message_fts(api_message_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO api_message_fts(rowid, content) VALUES (new.id, new.content); "
+    "END",
+    "INSERT INTO api_message_fts(api_message_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS api_message_fts_update",
+    "DROP TRIGGER IF EXISTS api_message_fts_delete",
+    "DROP TRIGGER IF EXISTS api_message_fts_insert",
+    "DROP TABLE IF EXISTS api_message_fts",
+]
+
+
+def run_for_vendor(postgres_statements, sqlite_statements):
+    def operation(apps, schema_editor):
+        statements = {
+            "postgresql": postgres_statements,
+            "sqlite": sqlite_statements,
+        }.get(schema_editor.connection.vendor, [])
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("api", "0002_message_sequence"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_FORWARD, SQLITE_FORWARD),
+            run_for_vendor(POSTGRES_BACKWARD, SQLITE_BACKWARD),
+        ),
+    ]
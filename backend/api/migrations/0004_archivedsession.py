@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0003_message_search_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedSession",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("codec", models.CharField(max_length=16)),
+                ("payload", models.BinaryField()),
+                ("message_count", models.PositiveIntegerField(default=0)),
+                ("last_sequence", models.PositiveIntegerField(default=0)),
+                ("archived_at", models.DateTimeField(auto_now=True)),
+                (
+                    "session",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archive",
+                        to="api.chatsession",
+                    ),
+                ),
+            ],
+        ),
+    ]
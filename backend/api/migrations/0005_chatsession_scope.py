@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_archivedsession"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatsession",
+            name="scope",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name="chatsession",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(
+                    ("is_active", True), models.Q(("scope", ""), _negated=True)
+                ),
+                fields=("user", "scope"),
+                name="unique_active_session_scope",
+            ),
+        ),
+    ]
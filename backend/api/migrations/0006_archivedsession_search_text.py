@@ -0,0 +1,84 @@
+from django.db import migrations, models
+
+from api.archive import read_archive, search_text
+
+# Full-text search index over ArchivedSession.search_text, the text of the
+# messages archiving removed from api_message and its index (0003).
+# PostgreSQL: GIN expression index on to_tsvector, built CONCURRENTLY like
+# 0003's, so the migration is non-atomic.
+# SQLite: external-content FTS5 table kept in sync by triggers.
+
+POSTGRES_FORWARD = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS api_archivedsession_search "
+    "ON api_archivedsession USING gin (to_tsvector('english', search_text))",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX CONCURRENTLY IF EXISTS api_archivedsession_search",
+]
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS api_archivedsession_fts "
+    "USING fts5(search_text, content='api_archivedsession', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS api_archivedsession_fts_insert AFTER INSERT ON api_archivedsession BEGIN "
+    "INSERT INTO api_archivedsession_fts(rowid, search_text) VALUES (new.id, new.search_text); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS api_archivedsession_fts_delete AFTER DELETE ON api_archivedsession BEGIN "
+    "INSERT INTO api_archivedsession_fts(api_archivedsession_fts, rowid, search_text) "
+    "VALUES ('delete', old.id, old.search_text); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS api_archivedsession_fts_update "
+    "AFTER UPDATE OF search_text ON api_archivedsession BEGIN "
+    "INSERT INTO api_archivedsession_fts(api_archivedsession_fts, rowid, search_text) "
+    "VALUES ('delete', old.id, old.search_text); "
+    "INSERT INTO api_archivedsession_fts(rowid, search_text) VALUES (new.id, new.search_text); "
+    "END",
+    "INSERT INTO api_archivedsession_fts(api_archivedsession_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS api_archivedsession_fts_update",
+    "DROP TRIGGER IF EXISTS api_archivedsession_fts_delete",
+    "DROP TRIGGER IF EXISTS api_archivedsession_fts_insert",
+    "DROP TABLE IF EXISTS api_archivedsession_fts",
+]
+
+
+def run_for_vendor(postgres_statements, sqlite_statements):
+    def operation(apps, schema_editor):
+        statements = {
+            "postgresql": postgres_statements,
+            "sqlite": sqlite_statements,
+        }.get(schema_editor.connection.vendor, [])
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+def fill_search_text(apps, schema_editor):
+    ArchivedSession = apps.get_model("api", "ArchivedSession")
+    for archive in ArchivedSession.objects.filter(search_text='').iterator(chunk_size=100):
+        archive.search_text = search_text(read_archive(archive))
+        archive.save(update_fields=["search_text"])
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("api", "0005_chatsession_scope"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="archivedsession",
+            name="search_text",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_FORWARD, SQLITE_FORWARD),
+            run_for_vendor(POSTGRES_BACKWARD, SQLITE_BACKWARD),
+        ),
+    ]
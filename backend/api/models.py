@@ -1,5 +1,7 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -11,12 +13,36 @@ class ChatSession(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    last_sequence = models.PositiveIntegerField(default=0)
+    # What the conversation belongs to, e.g. the usage id of an XBlock; a
+    # user has at most one active session per scope. Empty for the general chat
+    scope = models.CharField(max_length=255, blank=True, default='')
 
     def __str__(self):
         return f"Chat Session {self.id}"
 
+    @classmethod
+    def next_sequence(cls, session_id):
+        """
+        Allocate the next message sequence number of a session.
+        The counter row stays locked until the surrounding transaction ends,
+        so concurrent writers to the same session get consecutive numbers.
+        """
+        cls.objects.filter(pk=session_id).update(
+            last_sequence=F('last_sequence') + 1,
+            updated_at=timezone.now()
+        )
+        return cls.objects.filter(pk=session_id).values_list('last_sequence', flat=True).get()
+
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'scope'],
+                condition=Q(is_active=True) & ~Q(scope=''),
+                name='unique_active_session_scope'
+            ),
+        ]
 
 class Message(models.Model):
     """Model for chat messages."""
@@ -24,9 +50,37 @@ class Message(models.Model):
     content = models.TextField()
     is_from_user = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    sequence = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"Message {self.id} from {'user' if self.is_from_user else 'assistant'}"
 
+    def save(self, *args, **kwargs):
+        """Assign the next per-session sequence number to new messages."""
+        if self._state.adding and not self.sequence:
+            with transaction.atomic():
+                self.sequence = ChatSession.next_sequence(self.session_id)
+                super().save(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+
     class Meta:
-        ordering = ['created_at'] 
\ No newline at end of file
+        ordering = ['created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'sequence'], name='unique_message_sequence'),
+        ] 
+
+class ArchivedSession(models.Model):
+    """Compressed cold-storage copy of the messages of an inactive chat session."""
+    session = models.OneToOneField(ChatSession, on_delete=models.CASCADE, related_name='archive')
+    codec = models.CharField(max_length=16)
+    payload = models.BinaryField()
+    # Text of the archived messages, full-text indexed (migration 0006) so
+    # archived conversations stay searchable
+    search_text = models.TextField(blank=True, default='')
+    message_count = models.PositiveIntegerField(default=0)
+    last_sequence = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Archive of Chat Session {self.session_id}"
@@ -0,0 +1,80 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.oauth2.models import OAuth2AuthorizationCode, OAuth2Token
+
+# Matches the grace period oauth_token_view allows on expired codes
+CODE_GRACE_PERIOD = timedelta(minutes=1)
+
+
+class Command(BaseCommand):
+    help = "Delete expired OAuth2 tokens and used or expired authorization codes in small batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of rows deleted per transaction.'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=0.05,
+            help='Seconds to pause between batches so live traffic keeps priority.'
+        )
+        parser.add_argument(
+            '--every', type=int, default=0,
+            help='Keep running and purge every N seconds (0 runs once).'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            self.purge(options['batch_size'], options['sleep'])
+            if not options['every']:
+                break
+            time.sleep(options['every'])
+
+    def purge(self, batch_size, sleep):
+        started = time.monotonic()
+        now = timezone.now()
+        removed = {
+            'expired tokens': self.delete_in_batches(
+                OAuth2Token.objects.filter(expires_at__lt=now), batch_size, sleep
+            ),
+            'expired codes': self.delete_in_batches(
+                OAuth2AuthorizationCode.objects.filter(expires_at__lt=now - CODE_GRACE_PERIOD), batch_size, sleep
+            ),
+            'used codes': self.delete_in_batches(
+                OAuth2AuthorizationCode.objects.filter(used=True), batch_size, sleep
+            ),
+        }
+        summary = ', '.join(f"{count} {label}" for label, count in removed.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {summary} in {time.monotonic() - started:.2f}s"
+        ))
+        return removed
+
+    def delete_in_batches(self, queryset, batch_size, sleep):
+        """
+        Delete matching rows one short transaction at a time.
+        Rows locked by a concurrent request are skipped and picked up by a
+        later run, so the purge never waits on live traffic.
+        """
+        total = 0
+        while True:
+            with transaction.atomic():
+                ids = list(
+                    queryset.select_for_update(skip_locked=True)
+                    .order_by('pk')
+                    .values_list('pk', flat=True)[:batch_size]
+                )
+                if not ids:
+                    break
+                deleted, _ = queryset.model.objects.filter(pk__in=ids).delete()
+            total += deleted
+            if len(ids) < batch_size:
+                break
+            if sleep:
+                time.sleep(sleep)
+        return total
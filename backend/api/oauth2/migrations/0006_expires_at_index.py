@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oauth2", "0005_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="oauth2authorizationcode",
+            name="expires_at",
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name="oauth2token",
+            name="expires_at",
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
@@ -19,7 +19,7 @@ class OAuth2Client(models.Model):
 
 class OAuth2AuthorizationCode(models.Model):
     code = models.CharField(max_length=255, unique=True)
-    expires_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     used = models.BooleanField(default=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -36,7 +36,7 @@ class OAuth2AuthorizationCode(models.Model):
 class OAuth2Token(models.Model):
     access_token = models.CharField(max_length=255, unique=True)
     refresh_token = models.CharField(max_length=255, unique=True, null=True)
-    expires_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
 
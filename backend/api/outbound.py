@@ -0,0 +1,84 @@
+import asyncio
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class StreamBuffer:
+    """
+    Coalesces the chunks of a streamed answer into few frames or events.
+
+    An LLM streams an answer a token at a time; one frame per token would
+    cost more CPU in the worker and the browser than the answer itself.
+    Chunks are buffered and handed to `send` (an async callable taking the
+    joined text) at most every `flush_interval` seconds, or as soon as
+    `flush_bytes` characters are waiting. Chunks arriving while a send is in
+    progress go out together in the next frame.
+
+    This only bounds the number of frames, not how far a slow client falls
+    behind: neither the channel layer nor the SSE response wait for the
+    client to read what was sent, so outbound data is buffered by the server.
+    """
+    def __init__(self, send, flush_interval=0.02, flush_bytes=512):
+        self.send = send
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.chunks = []
+        self.size = 0
+        self.chunks_received = 0
+        self.frames_sent = 0
+        self.closed = False
+        self._full = asyncio.Event()
+        self._flusher = None
+
+    @classmethod
+    def from_settings(cls, send):
+        return cls(
+            send,
+            flush_interval=settings.CHAT_STREAM_FLUSH_MS / 1000,
+            flush_bytes=settings.CHAT_STREAM_FLUSH_BYTES
+        )
+
+    def add(self, chunk):
+        self.chunks_received += 1
+        if self.closed or not chunk:
+            return
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        if self.size >= self.flush_bytes:
+            self._full.set()
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._flush())
+
+    async def _flush(self):
+        while self.chunks and not self.closed:
+            if not self._full.is_set():
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._full.clear()
+            if self.closed:
+                return
+            text = ''.join(self.chunks)
+            self.chunks.clear()
+            self.size = 0
+            await self.send(text)
+            self.frames_sent += 1
+
+    async def finish(self):
+        """
+        Stop streaming once a send in progress is done. Chunks still buffered
+        are dropped: the final answer frame follows with the complete text.
+        """
+        self.closed = True
+        self._full.set()
+        if self._flusher is not None and not self._flusher.done():
+            try:
+                await self._flusher
+            except Exception as e:
+                logger.warning(f"Could not send streamed chunk: {str(e)}")
+        self.chunks.clear()
+        self.size = 0
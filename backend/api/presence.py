@@ -0,0 +1,230 @@
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .redis_client import get_redis_connection
+
+
+class BasePresenceRegistry(ABC):
+    """
+    Registry of the live WebSocket connections of every user.
+
+    Each connection is registered with its channel name as connection id,
+    plus the device, worker and last activity time. Connections heartbeat
+    periodically; entries whose heartbeat is older than `timeout` seconds are
+    treated as dead and pruned, so crashed workers don't leave ghosts behind.
+    """
+    def __init__(self, timeout=90, heartbeat_interval=30, max_connections_per_user=0, **kwargs):
+        self.timeout = timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.max_connections_per_user = max_connections_per_user
+
+    @abstractmethod
+    def register(self, user_id, connection_id, info):
+        """Register a connection; returns False when the user is at the connection cap."""
+
+    @abstractmethod
+    def heartbeat(self, user_id, connection_id, info):
+        """
+        Mark a registered connection as alive and update its info. An entry
+        pruned meanwhile (after a worker stall or a Redis restart) is added
+        back: the connection is still open. The cap only applies to register.
+        """
+
+    def heartbeat_many(self, entries):
+        """Heartbeat several (user_id, connection_id, info) entries at once."""
+        for user_id, connection_id, info in entries:
+            self.heartbeat(user_id, connection_id, info)
+
+    @abstractmethod
+    def unregister(self, user_id, connection_id):
+        """Remove a connection."""
+
+    @abstractmethod
+    def live_connections(self, user_id):
+        """Return the info of the user's live connections, keyed by connection id."""
+
+    @abstractmethod
+    def worker_counts(self):
+        """Return the number of live connections per worker."""
+
+
+class RedisPresenceRegistry(BasePresenceRegistry):
+    """
+    Presence registry in Redis.
+
+    Per user, a sorted set scores connection ids by last heartbeat and a hash
+    holds their info; per worker, a sorted set scores its connection ids the
+    same way so concurrent connections can be counted per worker.
+    """
+    key_prefix = 'presence'
+
+    # Prunes dead connections, enforces the cap and registers atomically so
+    # concurrent connects can't overshoot the cap.
+    REGISTER_SCRIPT = """
+        local stale = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+        for _, connection_id in ipairs(stale) do
+            redis.call('HDEL', KEYS[2], connection_id)
+        end
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+        local limit = tonumber(ARGV[3])
+        if limit > 0 and redis.call('ZCARD', KEYS[1]) >= limit then
+            return 0
+        end
+        redis.call('ZADD', KEYS[1], ARGV[1], ARGV[4])
+        redis.call('HSET', KEYS[2], ARGV[4], ARGV[5])
+        redis.call('ZADD', KEYS[3], ARGV[1], ARGV[4])
+        redis.call('SADD', KEYS[4], ARGV[7])
+        redis.call('EXPIRE', KEYS[1], ARGV[6])
+        redis.call('EXPIRE', KEYS[2], ARGV[6])
+        redis.call('EXPIRE', KEYS[3], ARGV[6])
+        return 1
+    """
+
+    def __init__(self, location, **kwargs):
+        super().__init__(**kwargs)
+        self.location = location
+        self._register = None
+
+    @property
+    def redis(self):
+        return get_redis_connection(self.location)
+
+    def user_keys(self, user_id):
+        return f"{self.key_prefix}:user:{user_id}:alive", f"{self.key_prefix}:user:{user_id}:info"
+
+    def worker_key(self, worker):
+        return f"{self.key_prefix}:worker:{worker}"
+
+    @property
+    def workers_key(self):
+        return f"{self.key_prefix}:workers"
+
+    def register(self, user_id, connection_id, info):
+        if self._register is None:
+            self._register = self.redis.register_script(self.REGISTER_SCRIPT)
+        alive_key, info_key = self.user_keys(user_id)
+        now = time.time()
+        return bool(self._register(
+            keys=[alive_key, info_key, self.worker_key(info['worker']), self.workers_key],
+            args=[now, now - self.timeout, self.max_connections_per_user, connection_id,
+                  json.dumps(info), self.timeout, info['worker']]
+        ))
+
+    def heartbeat(self, user_id, connection_id, info):
+        self.heartbeat_many([(user_id, connection_id, info)])
+
+    def heartbeat_many(self, entries, chunk_size=1000):
+        # One pipeline round trip per chunk instead of one per connection
+        now = time.time()
+        for start in range(0, len(entries), chunk_size):
+            pipe = self.redis.pipeline(transaction=False)
+            for user_id, connection_id, info in entries[start:start + chunk_size]:
+                alive_key, info_key = self.user_keys(user_id)
+                worker_key = self.worker_key(info['worker'])
+                pipe.zadd(alive_key, {connection_id: now})
+                pipe.zadd(worker_key, {connection_id: now})
+                pipe.hset(info_key, connection_id, json.dumps(info))
+                pipe.sadd(self.workers_key, info['worker'])
+                for key in (alive_key, info_key, worker_key):
+                    pipe.expire(key, self.timeout)
+            pipe.execute()
+
+    def unregister(self, user_id, connection_id):
+        alive_key, info_key = self.user_keys(user_id)
+        pipe = self.redis.pipeline()
+        pipe.zrem(alive_key, connection_id)
+        pipe.hdel(info_key, connection_id)
+        pipe.zrem(self.worker_key(settings.WORKER_ID), connection_id)
+        pipe.execute()
+
+    def live_connections(self, user_id):
+        alive_key, info_key = self.user_keys(user_id)
+        connection_ids = self.redis.zrangebyscore(alive_key, time.time() - self.timeout, '+inf')
+        if not connection_ids:
+            return {}
+        infos = self.redis.hmget(info_key, connection_ids)
+        return {
+            connection_id.decode(): json.loads(info)
+            for connection_id, info in zip(connection_ids, infos)
+            if info is not None
+        }
+
+    def worker_counts(self):
+        cutoff = time.time() - self.timeout
+        counts = {}
+        for worker in self.redis.smembers(self.workers_key):
+            worker = worker.decode()
+            key = self.worker_key(worker)
+            pipe = self.redis.pipeline()
+            pipe.zremrangebyscore(key, '-inf', cutoff)
+            pipe.zcard(key)
+            _, count = pipe.execute()
+            if count:
+                counts[worker] = count
+            else:
+                self.redis.srem(self.workers_key, worker)
+        return counts
+
+
+class InMemoryPresenceRegistry(BasePresenceRegistry):
+    """Process-local presence registry for tests and single-process development."""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, user_id):
+        cutoff = time.time() - self.timeout
+        connections = self._connections.setdefault(user_id, {})
+        for connection_id in [c for c, (seen, _) in connections.items() if seen < cutoff]:
+            del connections[connection_id]
+        return connections
+
+    def register(self, user_id, connection_id, info):
+        with self._lock:
+            connections = self._prune(user_id)
+            if self.max_connections_per_user and len(connections) >= self.max_connections_per_user:
+                return False
+            connections[connection_id] = (time.time(), info)
+            return True
+
+    def heartbeat(self, user_id, connection_id, info):
+        with self._lock:
+            self._connections.setdefault(user_id, {})[connection_id] = (time.time(), info)
+
+    def unregister(self, user_id, connection_id):
+        with self._lock:
+            self._connections.get(user_id, {}).pop(connection_id, None)
+
+    def live_connections(self, user_id):
+        with self._lock:
+            return {c: info for c, (_, info) in self._prune(user_id).items()}
+
+    def worker_counts(self):
+        counts = {}
+        with self._lock:
+            for user_id in list(self._connections):
+                for _, info in self._prune(user_id).values():
+                    counts[info['worker']] = counts.get(info['worker'], 0) + 1
+        return counts
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_presence_registry():
+    """Return the process-wide presence registry configured by PRESENCE."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                config = dict(settings.PRESENCE)
+                backend = import_string(config.pop('BACKEND'))
+                _registry = backend(**{key.lower(): value for key, value in config.items()})
+    return _registry
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.cache import cache
+
+# Rate limiting settings
+RATE_LIMIT_WINDOW = 60  # 1 minute window
+MAX_CONNECTIONS_PER_WINDOW = settings.WEBSOCKET_CONNECTIONS_PER_MINUTE  # Maximum connections per minute per IP
+
+
+def check_rate_limit(client_ip):
+    """
+    Count a new chat connection from an IP address; returns False once the
+    IP is over its limit for the window. WebSocket connections and HTTP
+    fallback requests share the same budget.
+    """
+    if not MAX_CONNECTIONS_PER_WINDOW:
+        return True
+    cache_key = f"ws_rate_limit_{client_ip}"
+
+    # Get current connection count
+    connection_count = cache.get(cache_key, 0)
+
+    if connection_count >= MAX_CONNECTIONS_PER_WINDOW:
+        return False
+
+    # Increment connection count
+    cache.set(cache_key, connection_count + 1, RATE_LIMIT_WINDOW)
+    return True
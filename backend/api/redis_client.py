@@ -0,0 +1,27 @@
+import logging
+import threading
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+_connections = {}
+_lock = threading.Lock()
+
+
+def get_redis_connection(url):
+    """
+    Return a shared Redis client for the given URL.
+
+    Clients are cached per URL so every caller in the process reuses the
+    same connection pool instead of opening a new socket per operation.
+    """
+    client = _connections.get(url)
+    if client is None:
+        with _lock:
+            client = _connections.get(url)
+            if client is None:
+                logger.info(f"Creating Redis connection pool for {url}")
+                client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+                _connections[url] = client
+    return client
@@ -0,0 +1,211 @@
+import logging
+import re
+
+from django.db import connection
+
+from .archive import read_archive
+from .models import ArchivedSession, Message
+
+logger = logging.getLogger(__name__)
+
+# The to_tsvector expression must match the GIN index from migration 0003
+POSTGRES_SEARCH_SQL = """
+    SELECT m.id, ts_rank(to_tsvector('english', m.content), query) AS rank
+    FROM api_message m
+    JOIN api_chatsession s ON s.id = m.session_id,
+         websearch_to_tsquery('english', %s) query
+    WHERE to_tsvector('english', m.content) @@ query {user_filter}
+    ORDER BY rank DESC, m.id DESC
+    LIMIT %s OFFSET %s
+"""
+
+SQLITE_SEARCH_SQL = """
+    SELECT m.id, -bm25(api_message_fts) AS rank
+    FROM api_message_fts
+    JOIN api_message m ON m.id = api_message_fts.rowid
+    JOIN api_chatsession s ON s.id = m.session_id
+    WHERE api_message_fts MATCH %s {user_filter}
+    ORDER BY rank DESC, m.id DESC
+    LIMIT %s OFFSET %s
+"""
+
+# Archived sessions, by the index over their search_text from migration 0006
+POSTGRES_ARCHIVE_SEARCH_SQL = """
+    SELECT a.session_id, ts_rank(to_tsvector('english', a.search_text), query) AS rank
+    FROM api_archivedsession a
+    JOIN api_chatsession s ON s.id = a.session_id,
+         websearch_to_tsquery('english', %s) query
+    WHERE to_tsvector('english', a.search_text) @@ query {user_filter}
+    ORDER BY rank DESC, a.session_id DESC
+    LIMIT %s OFFSET %s
+"""
+
+SQLITE_ARCHIVE_SEARCH_SQL = """
+    SELECT a.session_id, -bm25(api_archivedsession_fts) AS rank
+    FROM api_archivedsession_fts
+    JOIN api_archivedsession a ON a.id = api_archivedsession_fts.rowid
+    JOIN api_chatsession s ON s.id = a.session_id
+    WHERE api_archivedsession_fts MATCH %s {user_filter}
+    ORDER BY rank DESC, a.session_id DESC
+    LIMIT %s OFFSET %s
+"""
+
+# Positions (from 1) of the texts of an array that match a query
+POSTGRES_MATCHING_SQL = """
+    SELECT t.position
+    FROM unnest(%s::text[]) WITH ORDINALITY AS t(content, position),
+         websearch_to_tsquery('english', %s) query
+    WHERE to_tsvector('english', t.content) @@ query
+"""
+
+# Archived sessions whose messages are read per round while filling a page
+ARCHIVE_BATCH_SIZE = 50
+
+
+def _terms(query):
+    # FTS5's default tokenizer splits on everything but letters and digits
+    return re.findall(r'[^\W_]+', query)
+
+
+def _fts5_query(query):
+    """Quote each term so user input can't inject FTS5 query syntax."""
+    return ' '.join('"{}"'.format(term.replace('"', '""')) for term in _terms(query))
+
+
+def _ranked_ids(sql, query, user_id, limit, offset):
+    params = [query]
+    user_filter = ''
+    if user_id is not None:
+        user_filter = 'AND s.user_id = %s'
+        params.append(user_id)
+    params.extend([limit, offset])
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(user_filter=user_filter), params)
+        return cursor.fetchall()
+
+
+def search_messages(query, user_id=None, limit=20, offset=0):
+    """
+    Search message content, best matches first.
+
+    Uses the full-text index of the current database (PostgreSQL tsvector/GIN
+    or SQLite FTS5) and falls back to a substring scan elsewhere. Results are
+    restricted to sessions of `user_id` when it is given. Matches in archived
+    sessions follow the ones still in the hot table.
+
+    Returns a list of Message instances annotated with a `rank` attribute;
+    archived ones are unsaved and carry the rank of their session.
+    """
+    if connection.vendor == 'sqlite' and not _fts5_query(query):
+        return []
+    results = _search_hot(query, user_id, limit, offset)
+    if len(results) == limit:
+        return results
+    # The page reaches past the hot matches: fill it from the archives
+    if results or not offset:
+        hot_total = offset + len(results)
+    else:
+        hot_total = len(_hot_ranks(query, user_id, offset, 0))
+    return results + _search_archives(query, user_id, limit - len(results), max(offset - hot_total, 0))
+
+
+def _hot_ranks(query, user_id, limit, offset):
+    """`(message id, rank)` of the matching messages in the hot table."""
+    if connection.vendor == 'postgresql':
+        return _ranked_ids(POSTGRES_SEARCH_SQL, query, user_id, limit, offset)
+    if connection.vendor == 'sqlite':
+        return _ranked_ids(SQLITE_SEARCH_SQL, _fts5_query(query), user_id, limit, offset)
+    logger.warning(f"No full-text index for {connection.vendor}, falling back to a content scan")
+    messages = Message.objects.filter(content__icontains=query)
+    if user_id is not None:
+        messages = messages.filter(session__user_id=user_id)
+    message_ids = messages.order_by('-id').values_list('id', flat=True)[offset:offset + limit]
+    return [(message_id, None) for message_id in message_ids]
+
+
+def _search_hot(query, user_id, limit, offset):
+    rows = _hot_ranks(query, user_id, limit, offset)
+    messages = Message.objects.in_bulk([message_id for message_id, _ in rows])
+    results = []
+    for message_id, rank in rows:
+        message = messages.get(message_id)
+        if message is not None:
+            message.rank = rank
+            results.append(message)
+    return results
+
+
+def _archive_ranks(query, user_id, limit, offset):
+    """`(session id, rank)` of the archived sessions with matching messages."""
+    if connection.vendor == 'postgresql':
+        return _ranked_ids(POSTGRES_ARCHIVE_SEARCH_SQL, query, user_id, limit, offset)
+    if connection.vendor == 'sqlite':
+        return _ranked_ids(SQLITE_ARCHIVE_SEARCH_SQL, _fts5_query(query), user_id, limit, offset)
+    archives = ArchivedSession.objects.filter(search_text__icontains=query)
+    if user_id is not None:
+        archives = archives.filter(session__user_id=user_id)
+    session_ids = archives.order_by('-session_id').values_list('session_id', flat=True)[offset:offset + limit]
+    return [(session_id, None) for session_id in session_ids]
+
+
+def _matching(query, messages):
+    """The messages whose content matches the query, the way the index matches it."""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(POSTGRES_MATCHING_SQL, [[message['content'] for message in messages], query])
+            positions = {position for position, in cursor.fetchall()}
+        return [message for position, message in enumerate(messages, 1) if position in positions]
+    if connection.vendor == 'sqlite':
+        # The FTS5 query is every term, quoted: a message matches when it contains them all
+        terms = {term.casefold() for term in _terms(query)}
+        return [
+            message for message in messages
+            if terms <= {term.casefold() for term in _terms(message['content'])}
+        ]
+    return [message for message in messages if query.casefold() in message['content'].casefold()]
+
+
+def _search_archives(query, user_id, limit, offset):
+    """
+    Matching messages of archived sessions, best matching session first and
+    newest first within a session. Sessions are found through the index over
+    their search_text; their archives are then read to pick the messages.
+    """
+    results = []
+    start = 0
+    while len(results) < limit:
+        sessions = _archive_ranks(query, user_id, ARCHIVE_BATCH_SIZE, start)
+        if not sessions:
+            break
+        start += len(sessions)
+        archives = ArchivedSession.objects.in_bulk(
+            [session_id for session_id, _ in sessions], field_name='session_id'
+        )
+        matches = [
+            (session_id, rank, message)
+            for session_id, rank in sessions if session_id in archives
+            for message in reversed(_matching(query, read_archive(archives[session_id])))
+        ]
+        # Rows an interrupted archiving run left in the hot table were found there
+        still_hot = set(Message.objects.filter(
+            id__in=[message['id'] for _, _, message in matches]
+        ).values_list('id', flat=True))
+        for session_id, rank, message in matches:
+            if message['id'] in still_hot:
+                continue
+            if offset:
+                offset -= 1
+                continue
+            result = Message(
+                id=message['id'],
+                session_id=session_id,
+                content=message['content'],
+                is_from_user=message['is_from_user'],
+                created_at=message['created_at'],
+                sequence=message['sequence'],
+            )
+            result.rank = rank
+            results.append(result)
+            if len(results) == limit:
+                break
+    return results
@@ -4,13 +4,24 @@ from .models import ChatSession, Message
 class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
-        fields = ['id', 'content', 'is_from_user', 'created_at']
-        read_only_fields = ['id', 'created_at']
+        fields = ['id', 'content', 'is_from_user', 'created_at', 'sequence']
+        read_only_fields = ['id', 'created_at', 'sequence']
+
+class MessageSearchResultSerializer(MessageSerializer):
+    rank = serializers.FloatField(read_only=True, allow_null=True)
+
+    class Meta(MessageSerializer.Meta):
+        fields = MessageSerializer.Meta.fields + ['session', 'rank']
 
 class ChatSessionSerializer(serializers.ModelSerializer):
-    messages = MessageSerializer(many=True, read_only=True)
+    messages = serializers.SerializerMethodField()
     
     class Meta:
         model = ChatSession
-        fields = ['id', 'user', 'created_at', 'updated_at', 'is_active', 'messages']
-        read_only_fields = ['id', 'created_at', 'updated_at'] 
\ No newline at end of file
+        fields = ['id', 'user', 'created_at', 'updated_at', 'is_active', 'last_sequence', 'scope', 'messages']
+        read_only_fields = ['id', 'created_at', 'updated_at', 'last_sequence']
+
+    def get_messages(self, session):
+        # Imported here: the archive serializes its messages with this module
+        from .archive import get_session_messages
+        return get_session_messages(session) 
\ No newline at end of file
@@ -1,25 +1,37 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from .models import Message
+from django.db import transaction
+from .models import ChatSession, Message
+from .chat_sessions import forget_sessions
+from .history_cache import cache_message
+from .events import publish_message
 
 @receiver(post_save, sender=Message)
 def message_post_save(sender, instance, created, **kwargs):
     """
     Signal handler for when a message is saved.
-    Sends the message to the user's WebSocket channel.
+    Publishes the message to the user's WebSocket connections through the
+    event bus once the save is committed.
     """
     if created:
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"user_{instance.session.user.id}",
-            {
-                "type": "chat_message",
-                "message": {
-                    "content": instance.content,
-                    "is_from_user": instance.is_from_user,
-                    "created_at": instance.created_at.isoformat()
-                }
-            }
-        ) 
\ No newline at end of file
+        publish_message(instance, origin=getattr(instance, 'event_origin', None))
+
+@receiver(post_save, sender=Message)
+def message_hot_history(sender, instance, created, **kwargs):
+    """
+    Signal handler for when a message is saved.
+    Appends the message to the session's hot history once the save is committed.
+    """
+    if created:
+        transaction.on_commit(lambda: cache_message(instance))
+
+@receiver(post_save, sender=ChatSession)
+@receiver(post_delete, sender=ChatSession)
+def chat_session_changed(sender, instance, **kwargs):
+    """
+    Signal handler for when a chat session is saved or deleted.
+    Drops the user's cached session index once the change is committed, so
+    the next lookup reads it again.
+    """
+    user_id = instance.user_id
+    transaction.on_commit(lambda: forget_sessions(user_id))
@@ -0,0 +1,38 @@
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework_simplejwt.tokens import AccessToken
+from api.consumers import ChatConsumer
+
+User = get_user_model()
+
+
+class ChatConnectionMixin:
+    """
+    Opens chat WebSocket connections for `self.user`. The cache is cleared
+    around each test, so the per-IP connection rate limit hit by one test
+    doesn't refuse the connects of the next.
+    """
+    username = 'chatuser'
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username=self.username, password='pass')
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    async def connect(self, query='', token=None, auth_type='jwt'):
+        """Connect, by default with a JWT of `self.user`, and return the connection and its first frame."""
+        token = token or AccessToken.for_user(self.user)
+        communicator = WebsocketCommunicator(
+            ChatConsumer.as_asgi(), f"/ws/chat/?token={token}&auth_type={auth_type}{query}"
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator, await communicator.receive_json_from()
+
+    async def open_chat(self, query='', token=None):
+        """Connect and check the connection was let in, returning it."""
+        communicator, user_info = await self.connect(query, token)
+        self.assertEqual(user_info['type'], 'user_info')
+        return communicator
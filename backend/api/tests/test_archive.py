@@ -0,0 +1,99 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from django.contrib.auth import get_user_model
+from api import archive
+from api.archive import archive_session, compress, decompress, get_session_messages
+from api.history_cache import get_history_buffer, get_prompt_history
+from api.models import ArchivedSession, ChatSession, Message
+
+User = get_user_model()
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='archiveuser', password='pass')
+        self.session = ChatSession.objects.create(user=self.user)
+        get_history_buffer().clear(self.session.id)
+        self.addCleanup(get_history_buffer().clear, self.session.id)
+        for i in range(5):
+            Message.objects.create(session=self.session, content=f'old {i}', is_from_user=i % 2 == 0)
+
+    def test_compress_roundtrip(self):
+        codec, blob = compress(b'hello' * 100)
+        self.assertLess(len(blob), 500)
+        self.assertEqual(decompress(codec, blob), b'hello' * 100)
+
+    def test_archive_moves_messages_out_of_hot_table(self):
+        moved = archive_session(self.session.id, chunk_size=2)
+        self.assertEqual(moved, 5)
+        self.assertFalse(Message.objects.filter(session=self.session).exists())
+        archive = ArchivedSession.objects.get(session=self.session)
+        self.assertEqual((archive.message_count, archive.last_sequence), (5, 5))
+        self.assertEqual([m['content'] for m in get_session_messages(self.session)][0], 'old 0')
+
+    def test_rearchiving_merges_new_messages(self):
+        archive_session(self.session.id)
+        Message.objects.create(session=self.session, content='new')
+        self.assertEqual(get_session_messages(self.session)[-1]['sequence'], 6)
+        archive_session(self.session.id)
+        archive = ArchivedSession.objects.get(session=self.session)
+        self.assertEqual(archive.message_count, 6)
+
+    def test_history_api_reads_archived_sessions(self):
+        archive_session(self.session.id)
+        Message.objects.create(session=self.session, content='new')
+        self.client.force_authenticate(user=self.user)
+        url = f'/api/chat-sessions/{self.session.id}/messages/'
+        response = self.client.get(url, {'limit': 2})
+        self.assertEqual([m['content'] for m in response.data], ['old 4', 'new'])
+        response = self.client.get(url, {'before': 3})
+        self.assertEqual([m['content'] for m in response.data], ['old 0', 'old 1'])
+
+    def test_recent_messages_of_archived_session_are_decompressed_once(self):
+        archive_session(self.session.id)
+        self.client.force_authenticate(user=self.user)
+        url = f'/api/chat-sessions/{self.session.id}/messages/'
+        with mock.patch.object(archive, 'decompress', wraps=decompress) as decompressed:
+            for _ in range(3):
+                response = self.client.get(url, {'limit': 2})
+                self.assertEqual([m['content'] for m in response.data], ['old 3', 'old 4'])
+        # The tail read from the archive warmed the hot history buffer
+        self.assertEqual(decompressed.call_count, 1)
+
+    def test_archive_keeps_message_text_searchable(self):
+        archive_session(self.session.id)
+        archived = ArchivedSession.objects.get(session=self.session)
+        self.assertEqual(archived.search_text, '\n'.join(f'old {i}' for i in range(5)))
+
+    def test_every_read_path_includes_archived_messages(self):
+        archive_session(self.session.id)
+        Message.objects.create(session=self.session, content='new')
+        self.client.force_authenticate(user=self.user)
+        contents = ['old 0', 'old 1', 'old 2', 'old 3', 'old 4', 'new']
+        response = self.client.get('/api/chat-sessions/')
+        self.assertEqual([m['content'] for m in response.data[0]['messages']], contents)
+        response = self.client.get(f'/api/chat-sessions/{self.session.id}/')
+        self.assertEqual([m['content'] for m in response.data['messages']], contents)
+
+        # A learner coming back to an archived conversation keeps its context
+        get_history_buffer().clear(self.session.id)
+        self.addCleanup(get_history_buffer().clear, self.session.id)
+        history = get_prompt_history(self.session.id, 3)
+        self.assertEqual([turn['content'] for turn in history], ['old 3', 'old 4', 'new'])
+
+    def test_command_only_archives_inactive_sessions(self):
+        active = ChatSession.objects.create(user=self.user)
+        Message.objects.create(session=active, content='recent')
+        ChatSession.objects.filter(pk=self.session.pk).update(updated_at=timezone.now() - timedelta(days=100))
+        out = StringIO()
+        call_command('archive_sessions', days=90, stdout=out)
+        self.assertIn('Archived 5 messages from 1 sessions', out.getvalue())
+        self.assertTrue(Message.objects.filter(session=active).exists())
+        self.assertFalse(Message.objects.filter(session=self.session).exists())
@@ -0,0 +1,86 @@
+import json
+
+from django.test import TransactionTestCase
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.tokens import AccessToken
+from api.models import ChatSession, Message
+from api.views import ChatSessionViewSet
+
+User = get_user_model()
+
+
+class AsyncChatApiTests(TransactionTestCase):
+    """The chat REST API served from the event loop, through the async test client."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='asyncuser', email='async@example.com', password='pass')
+        self.session = ChatSession.objects.create(user=self.user)
+        Message.objects.create(session=self.session, content='Hello', is_from_user=True)
+        Message.objects.create(session=self.session, content='Hi there', is_from_user=False)
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    async def post(self, url, data):
+        return await self.async_client.post(
+            url, json.dumps(data), content_type='application/json', headers=self.headers
+        )
+
+    def test_views_are_async(self):
+        self.assertTrue(ChatSessionViewSet.view_is_async)
+
+    async def test_sessions_are_listed_with_their_messages(self):
+        other = await User.objects.acreate(username='other')
+        await ChatSession.objects.acreate(user=other)
+        response = await self.async_client.get('/api/chat-sessions/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([session['id'] for session in response.json()], [self.session.id])
+        self.assertEqual([m['content'] for m in response.json()[0]['messages']], ['Hello', 'Hi there'])
+
+        response = await self.async_client.get(f'/api/chat-sessions/{self.session.id}/', headers=self.headers)
+        self.assertEqual(response.json()['last_sequence'], 2)
+        self.assertEqual(len(response.json()['messages']), 2)
+
+    async def test_session_create_update_and_delete(self):
+        response = await self.post('/api/chat-sessions/', {'user': self.user.id})
+        self.assertEqual(response.status_code, 201)
+        session_id = response.json()['id']
+        self.assertEqual(response.json()['user'], self.user.id)
+
+        response = await self.async_client.patch(
+            f'/api/chat-sessions/{session_id}/', json.dumps({'is_active': False}),
+            content_type='application/json', headers=self.headers
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['is_active'])
+
+        response = await self.async_client.delete(f'/api/chat-sessions/{session_id}/', headers=self.headers)
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(await ChatSession.objects.filter(id=session_id).aexists())
+
+    async def test_send_message_and_page_history(self):
+        response = await self.post(f'/api/chat-sessions/{self.session.id}/send_message/', {'content': 'More'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json()['content'], response.json()['sequence']), ('More', 3))
+
+        response = await self.async_client.get(
+            f'/api/chat-sessions/{self.session.id}/messages/', {'before': 3}, headers=self.headers
+        )
+        self.assertEqual([m['sequence'] for m in response.json()], [1, 2])
+
+    async def test_xblock_send_message_and_current_user(self):
+        response = await self.post('/api/xblock/send-message/', {'chat_session_id': self.session.id, 'message': 'Hey'})
+        self.assertEqual(response.json(), {'status': 'success', 'sequence': 3})
+        response = await self.post('/api/xblock/send-message/', {'chat_session_id': 999999, 'message': 'Hey'})
+        self.assertEqual(response.status_code, 404)
+
+        response = await self.async_client.get('/api/auth/user/', headers=self.headers)
+        self.assertEqual(response.json()['username'], 'asyncuser')
+        response = await self.async_client.get('/api/auth/user/')
+        self.assertEqual(response.status_code, 401)
+
+    async def test_register_creates_user_session_and_tokens(self):
+        response = await self.async_client.post('/api/auth/register/', {
+            'username': 'newuser', 'email': 'new@example.com', 'password': 'pass1234'
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('access', response.json())
+        self.assertTrue(await ChatSession.objects.filter(id=response.json()['chat_session_id']).aexists())
@@ -0,0 +1,110 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+from django.contrib.auth import get_user_model
+from api.chat_sessions import ensure_active_session, get_session_index, resolve_session, sessions_key
+from api.consumers import UNKNOWN_SESSION_CODE
+from api.models import ChatSession
+from api.tests.mixins import ChatConnectionMixin
+
+User = get_user_model()
+
+
+class SessionIndexTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='indexuser', password='pass')
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_sessions_resolve_by_scope_and_id_without_queries(self):
+        general = ChatSession.objects.create(user=self.user)
+        unit = ChatSession.objects.create(user=self.user, scope='block-v1:unit1')
+        other = ChatSession.objects.create(user=User.objects.create_user(username='someone'))
+        get_session_index(self.user.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_session(self.user.id), general.id)
+            self.assertEqual(resolve_session(self.user.id, scope='block-v1:unit1'), unit.id)
+            self.assertEqual(resolve_session(self.user.id, str(general.id)), general.id)
+            self.assertIsNone(resolve_session(self.user.id, scope='block-v1:unit2'))
+        for session_id in (other.id, 'abc'):
+            with self.assertRaises(ChatSession.DoesNotExist):
+                resolve_session(self.user.id, session_id)
+
+    def test_index_follows_session_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            session_id = ensure_active_session(self.user.id, 'block-v1:unit1')
+        self.assertEqual(ensure_active_session(self.user.id, 'block-v1:unit1'), session_id)
+        self.assertEqual(resolve_session(self.user.id, scope='block-v1:unit1'), session_id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ChatSession.objects.filter(pk=session_id).first().delete()
+        self.assertIsNone(resolve_session(self.user.id, scope='block-v1:unit1'))
+
+    def test_sessions_created_by_another_worker_are_found(self):
+        stale_index = get_session_index(self.user.id)
+        general = ChatSession.objects.create(user=self.user)
+        unit = ChatSession.objects.create(user=self.user, scope='block-v1:unit1')
+        # The other worker's invalidation doesn't reach this process's cache
+        cache.set(sessions_key(self.user.id), stale_index)
+
+        self.assertEqual(resolve_session(self.user.id, str(general.id)), general.id)
+        # ... and the index is reloaded for the next lookups
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_session(self.user.id, str(unit.id)), unit.id)
+            self.assertEqual(resolve_session(self.user.id, scope='block-v1:unit1'), unit.id)
+        self.assertEqual(ensure_active_session(self.user.id), general.id)
+
+    def test_one_active_session_per_scope(self):
+        ChatSession.objects.create(user=self.user, scope='block-v1:unit1')
+        ChatSession.objects.create(user=self.user, scope='block-v1:unit1', is_active=False)
+        ChatSession.objects.create(user=self.user)
+        ChatSession.objects.create(user=self.user)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ChatSession.objects.create(user=self.user, scope='block-v1:unit1')
+
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.post('/api/chat-sessions/', {'user': self.user.id, 'scope': 'block-v1:unit1'})
+        self.assertEqual(response.status_code, 400)
+        response = client.post('/api/chat-sessions/', {'user': self.user.id, 'scope': 'block-v1:unit2'})
+        self.assertEqual((response.status_code, response.data['scope']), (201, 'block-v1:unit2'))
+
+
+class ScopedConnectionTests(ChatConnectionMixin, TransactionTestCase):
+    async def chat(self, communicator, content):
+        await communicator.send_json_to({'type': 'message', 'content': content})
+        await communicator.receive_json_from()  # ack
+        return await communicator.receive_json_from()
+
+    @mock.patch('api.turns.FlowiseClient.send_message', new_callable=mock.AsyncMock)
+    async def test_each_scope_has_its_own_conversation(self, send_message):
+        send_message.return_value = {'text': 'ok'}
+        # Several sessions used to break get_or_create on connect
+        await ChatSession.objects.acreate(user=self.user)
+        await ChatSession.objects.acreate(user=self.user)
+
+        unit1, _ = await self.connect('&scope=block-v1%3Aunit1')
+        unit2, _ = await self.connect('&scope=block-v1%3Aunit2')
+        first = await self.chat(unit1, 'Question on unit 1')
+        second = await self.chat(unit2, 'Question on unit 2')
+        self.assertNotEqual(first['session_id'], second['session_id'])
+        self.assertEqual((first['sequence'], second['sequence']), (2, 2))
+        await unit1.disconnect()
+        await unit2.disconnect()
+
+        session = await ChatSession.objects.aget(pk=first['session_id'])
+        self.assertEqual(session.scope, 'block-v1:unit1')
+        communicator, user_info = await self.connect(f'&session_id={session.id}')
+        self.assertEqual(user_info['last_sequence'], 2)
+        await communicator.disconnect()
+
+    async def test_unknown_session_is_refused(self):
+        other = await User.objects.acreate(username='scopeother')
+        session = await ChatSession.objects.acreate(user=other)
+        communicator, error = await self.connect(f'&session_id={session.id}')
+        self.assertEqual((error['type'], error['code']), ('error', UNKNOWN_SESSION_CODE))
+        await communicator.disconnect()
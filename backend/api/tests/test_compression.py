@@ -0,0 +1,88 @@
+import gzip
+import json
+
+import brotli
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from django.contrib.auth import get_user_model
+from api.middleware import CompressionMiddleware, accepted_encoding
+from api.models import ChatSession, Message
+
+User = get_user_model()
+
+
+class NegotiationTests(SimpleTestCase):
+    def test_accepted_encoding(self):
+        self.assertEqual(accepted_encoding('gzip, deflate, br'), 'br')
+        self.assertEqual(accepted_encoding('br;q=0.5, gzip'), 'gzip')
+        self.assertEqual(accepted_encoding('gzip;q=0, br;q=0'), None)
+        self.assertEqual(accepted_encoding('identity'), None)
+        self.assertEqual(accepted_encoding('*'), 'br')
+        self.assertEqual(accepted_encoding(''), None)
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    body = json.dumps([{'content': f'message {i}', 'sequence': i} for i in range(200)]).encode()
+
+    def request(self, encoding='gzip, br'):
+        return RequestFactory().get('/api/chat-sessions/', HTTP_ACCEPT_ENCODING=encoding)
+
+    def test_large_json_is_compressed(self):
+        middleware = CompressionMiddleware(lambda request: HttpResponse(self.body, content_type='application/json'))
+        response = middleware(self.request('gzip'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.body)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    @override_settings(API_COMPRESSION_MIN_BYTES=100_000)
+    def test_small_and_streaming_responses_are_left_alone(self):
+        middleware = CompressionMiddleware(lambda request: HttpResponse(self.body, content_type='application/json'))
+        self.assertFalse(middleware(self.request()).has_header('Content-Encoding'))
+
+        events = StreamingHttpResponse(iter([b'event: ack\ndata: {}\n\n']), content_type='text/event-stream')
+        middleware = CompressionMiddleware(lambda request: events)
+        self.assertFalse(middleware(self.request()).has_header('Content-Encoding'))
+
+    def test_pages_and_credential_responses_are_left_alone(self):
+        page = CompressionMiddleware(lambda request: HttpResponse(self.body, content_type='text/html'))
+        self.assertFalse(page(self.request()).has_header('Content-Encoding'))
+        api = CompressionMiddleware(lambda request: HttpResponse(self.body, content_type='application/json'))
+        for path in ('/oauth/callback/', '/api/oauth/token/', '/api/auth/login/', '/api/xblock/websocket-token/'):
+            request = RequestFactory().post(path, HTTP_ACCEPT_ENCODING='gzip, br')
+            self.assertFalse(api(request).has_header('Content-Encoding'), path)
+
+    async def test_async_stack(self):
+        async def get_response(request):
+            return HttpResponse(self.body * 200, content_type='application/json; charset=utf-8')
+
+        # Large enough to be compressed off the event loop
+        response = await CompressionMiddleware(get_response)(self.request('br'))
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), self.body * 200)
+
+
+class ApiCompressionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='gzipuser', password='pass')
+        self.session = ChatSession.objects.create(user=self.user)
+        for i in range(50):
+            Message.objects.create(session=self.session, content=f'A reasonably long message number {i}')
+        self.client.force_authenticate(user=self.user)
+
+    def test_history_is_compressed_and_revalidates(self):
+        url = f'/api/chat-sessions/{self.session.id}/messages/'
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(len(json.loads(brotli.decompress(response.content))), 50)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/'))
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='br', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_small_responses_are_not_compressed(self):
+        response = self.client.get('/api/auth/user/', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertFalse(response.has_header('Content-Encoding'))
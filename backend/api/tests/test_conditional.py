@@ -0,0 +1,77 @@
+from django.test import TestCase
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+from django.contrib.auth import get_user_model
+from api.models import ChatSession, Message
+
+User = get_user_model()
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='etaguser', password='pass')
+        self.session = ChatSession.objects.create(user=self.user)
+        for i in range(3):
+            Message.objects.create(session=self.session, content=f'msg {i}', is_from_user=i % 2 == 0)
+        self.client.force_authenticate(user=self.user)
+        self.url = f'/api/chat-sessions/{self.session.id}/messages/'
+
+    def test_history_is_revalidated_without_reading_messages(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('Authorization', response['Vary'])
+
+        # One query: the session row the validators come from
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        Message.objects.create(session=self.session, content='new', is_from_user=True)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.data), 4)
+
+    def test_if_modified_since(self):
+        response = self.client.get(self.url, {'limit': 2})
+        last_modified = response['Last-Modified']
+        response = self.client.get(self.url, {'limit': 2}, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(self.url, {'limit': 2}, HTTP_IF_MODIFIED_SINCE=http_date(0))
+        self.assertEqual(response.status_code, 200)
+
+    def test_session_list_and_detail_validators(self):
+        response = self.client.get('/api/chat-sessions/')
+        list_etag = response['ETag']
+        response = self.client.get(f'/api/chat-sessions/{self.session.id}/')
+        detail_etag = response['ETag']
+        self.assertEqual(self.client.get('/api/chat-sessions/', HTTP_IF_NONE_MATCH=list_etag).status_code, 304)
+        self.assertEqual(
+            self.client.get(f'/api/chat-sessions/{self.session.id}/', HTTP_IF_NONE_MATCH=detail_etag).status_code, 304
+        )
+
+        # A new session and a deleted one both change the list
+        other = ChatSession.objects.create(user=self.user)
+        response = self.client.get('/api/chat-sessions/', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+        list_etag = response['ETag']
+        other.delete()
+        self.assertEqual(self.client.get('/api/chat-sessions/', HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+
+        # Editing a session changes its validators
+        self.client.patch(f'/api/chat-sessions/{self.session.id}/', {'is_active': False})
+        response = self.client.get(f'/api/chat-sessions/{self.session.id}/', HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_other_users_sessions_are_not_found(self):
+        other = User.objects.create_user(username='etagother', password='pass')
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(self.client.get('/api/chat-sessions/abc/messages/').status_code, 404)
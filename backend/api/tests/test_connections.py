@@ -0,0 +1,141 @@
+import asyncio
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, TransactionTestCase
+from api.connections import (
+    EVICTED_CODE, IDLE_TIMEOUT_CODE, SERVER_BUSY_CODE, SERVICE_RESTART_CODE, AdmissionGate, connection_registry
+)
+from api.presence import get_presence_registry
+from api.tests.mixins import ChatConnectionMixin
+
+
+class AdmissionGateTests(SimpleTestCase):
+    async def test_connects_beyond_the_burst_wait_their_turn(self):
+        gate = AdmissionGate(rate=100, burst=2, max_wait=1)
+        started = time.monotonic()
+        self.assertEqual(await asyncio.gather(*(gate.admit() for _ in range(5))), [True] * 5)
+        # Three connects past the burst, 10ms apart
+        self.assertGreaterEqual(time.monotonic() - started, 0.025)
+
+    async def test_connect_is_refused_past_max_wait(self):
+        gate = AdmissionGate(rate=10, burst=1, max_wait=0.25)
+        connects = [asyncio.ensure_future(gate.admit()) for _ in range(5)]
+        await asyncio.sleep(0)
+        self.assertEqual(gate.load(), 1)
+        # Waits of 0, 0.1 and 0.2s are admitted, 0.3s is over the limit
+        self.assertEqual(await asyncio.gather(*connects), [True, True, True, False, False])
+
+
+class KeepaliveTests(ChatConnectionMixin, TransactionTestCase):
+    async def test_client_ping_gets_pong(self):
+        communicator = await self.open_chat()
+        await communicator.send_json_to({'type': 'ping'})
+        self.assertEqual((await communicator.receive_json_from())['type'], 'pong')
+        await communicator.disconnect()
+
+    async def test_quiet_connection_is_pinged_then_reaped(self):
+        communicator = await self.open_chat()
+        consumer = next(c for c in connection_registry.connections.values() if c.state.user_id == self.user.id)
+        reaped = connection_registry.counters['reaped_idle']
+
+        await connection_registry.check(consumer.state.last_activity + connection_registry.ping_interval)
+        self.assertEqual((await communicator.receive_json_from())['type'], 'ping')
+        await communicator.send_json_to({'type': 'pong'})
+        self.assertTrue(await communicator.receive_nothing(timeout=0.1))
+        # The pong counts as activity, so the connection survives the next check
+        await connection_registry.check(time.time())
+        self.assertIn(consumer.channel_name, connection_registry.connections)
+
+        await connection_registry.check(consumer.state.last_activity + connection_registry.idle_timeout)
+        self.assertEqual((await communicator.receive_json_from())['code'], IDLE_TIMEOUT_CODE)
+        self.assertEqual((await communicator.receive_output())['code'], IDLE_TIMEOUT_CODE)
+        self.assertNotIn(consumer.channel_name, connection_registry.connections)
+        self.assertEqual(connection_registry.counters['reaped_idle'], reaped + 1)
+
+    async def test_client_without_keepalive_is_reaped_after_silent_timeout(self):
+        communicator = await self.open_chat()
+        consumer = next(c for c in connection_registry.connections.values() if c.state.user_id == self.user.id)
+        await connection_registry.check(consumer.state.last_activity + connection_registry.idle_timeout)
+        self.assertEqual((await communicator.receive_json_from())['type'], 'ping')
+        self.assertIn(consumer.channel_name, connection_registry.connections)
+
+        await connection_registry.check(consumer.state.last_activity + connection_registry.silent_timeout)
+        self.assertEqual((await communicator.receive_json_from())['code'], IDLE_TIMEOUT_CODE)
+        self.assertNotIn(consumer.channel_name, connection_registry.connections)
+
+    async def test_full_worker_evicts_longest_idle_connection(self):
+        with mock.patch.object(connection_registry, 'max_connections', 2):
+            oldest = await self.open_chat()
+            newer = await self.open_chat()
+            await newer.send_json_to({'type': 'ping'})
+            await newer.receive_json_from()
+
+            latest = await self.open_chat()
+            self.assertEqual((await oldest.receive_json_from())['code'], EVICTED_CODE)
+            self.assertEqual(len(connection_registry), 2)
+            self.assertTrue(await newer.receive_nothing(timeout=0.1))
+        await newer.disconnect()
+        await latest.disconnect()
+
+    async def test_presence_heartbeat_is_batched_per_worker(self):
+        first = await self.open_chat()
+        second = await self.open_chat()
+        presence = get_presence_registry()
+        with mock.patch.object(presence, 'heartbeat_many', wraps=presence.heartbeat_many) as heartbeat_many:
+            await connection_registry.heartbeat()
+        entries = heartbeat_many.call_args.args[0]
+        self.assertEqual([user_id for user_id, _, _ in entries if user_id == self.user.id], [self.user.id] * 2)
+        self.assertEqual(heartbeat_many.call_count, 1)
+        await first.disconnect()
+        await second.disconnect()
+
+    @mock.patch('api.turns.FlowiseClient.send_message', new_callable=mock.AsyncMock)
+    async def test_drain_lets_running_answers_finish(self, send_message):
+        release = asyncio.Event()
+
+        async def answer(content, session_id=None, history=None):
+            await release.wait()
+            return {'text': 'done'}
+        send_message.side_effect = answer
+        self.addCleanup(setattr, connection_registry, 'draining', False)
+
+        idle = await self.open_chat()
+        busy = await self.open_chat()
+        await busy.send_json_to({'type': 'message', 'id': 'm1', 'content': 'q'})
+        await busy.receive_json_from()
+
+        drain = asyncio.ensure_future(connection_registry.drain(timeout=5, jitter=10))
+        for communicator in (idle, busy):
+            hint = await communicator.receive_json_from()
+            self.assertEqual(hint['type'], 'reconnect')
+            self.assertTrue(0 <= hint['delay_ms'] <= 10000)
+        self.assertEqual((await idle.receive_json_from())['code'], SERVICE_RESTART_CODE)
+        self.assertEqual((await idle.receive_output())['code'], SERVICE_RESTART_CODE)
+
+        # New messages are turned away while the running answer completes
+        await busy.send_json_to({'type': 'message', 'id': 'm2', 'content': 'late'})
+        rejected = await busy.receive_json_from()
+        self.assertEqual((rejected['code'], rejected['id']), (SERVICE_RESTART_CODE, 'm2'))
+        self.assertFalse(drain.done())
+
+        release.set()
+        self.assertEqual((await busy.receive_json_from())['content'], 'done')
+        self.assertEqual((await busy.receive_json_from())['code'], SERVICE_RESTART_CODE)
+        await asyncio.wait_for(drain, 1)
+        self.assertEqual(len(connection_registry), 0)
+        send_message.assert_awaited_once()
+
+    async def test_user_info_and_close_frames_advertise_reconnect_policy(self):
+        communicator, user_info = await self.connect()
+        policy = user_info['reconnect']
+        self.assertEqual(set(policy), {'min_delay_ms', 'max_delay_ms', 'load'})
+        self.assertLessEqual(policy['min_delay_ms'], policy['max_delay_ms'])
+        await communicator.disconnect()
+
+        with mock.patch.object(connection_registry, 'admission', AdmissionGate(rate=1, burst=1, max_wait=0)):
+            await connection_registry.admission.admit()
+            communicator, error = await self.connect()
+            self.assertEqual(error['code'], SERVER_BUSY_CODE)
+            self.assertGreater(error['reconnect']['min_delay_ms'], 0)
+            self.assertEqual((await communicator.receive_output())['code'], SERVER_BUSY_CODE)
@@ -0,0 +1,53 @@
+import asyncio
+from unittest import mock
+
+from channels.layers import get_channel_layer
+from django.test import TransactionTestCase
+from api.events import EventBus
+from api.models import ChatSession
+from api.presence import get_presence_registry
+from api.tests.mixins import ChatConnectionMixin
+
+
+class EventBusTests(TransactionTestCase):
+    async def test_events_within_window_are_batched(self):
+        layer = get_channel_layer()
+        channel = await layer.new_channel()
+        registry = get_presence_registry()
+        registry.register(-1, channel, {'device': 'web', 'worker': 'test'})
+        self.addCleanup(registry.unregister, -1, channel)
+        bus = EventBus(window=0.01)
+        for i in range(3):
+            await bus.enqueue(-1, {'frame': {'sequence': i}, 'origin': None})
+        event = await asyncio.wait_for(layer.receive(channel), 1)
+        self.assertEqual(event['type'], 'chat.events')
+        self.assertEqual([entry['frame']['sequence'] for entry in event['events']], [0, 1, 2])
+
+
+class ChatEventFanOutTests(ChatConnectionMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.session = ChatSession.objects.create(user=self.user)
+
+    @mock.patch('api.turns.FlowiseClient.send_message', new_callable=mock.AsyncMock)
+    async def test_other_connections_receive_turn_once(self, send_message):
+        send_message.return_value = {'text': 'an answer'}
+        sender = await self.open_chat()
+        other = await self.open_chat()
+
+        await sender.send_json_to({'type': 'message', 'id': 'client-1', 'content': 'a question'})
+        ack = await sender.receive_json_from()
+        self.assertEqual((ack['type'], ack['id'], ack['sequence']), ('ack', 'client-1', 1))
+        answer = await sender.receive_json_from()
+        self.assertEqual((answer['type'], answer['sequence'], answer['isUser']), ('message', 2, False))
+
+        frames = [await other.receive_json_from(timeout=1) for _ in range(2)]
+        self.assertEqual([(f['sequence'], f['isUser'], f['content']) for f in frames], [
+            (1, True, 'a question'),
+            (2, False, 'an answer'),
+        ])
+        # The sender already has both messages and must not get them again
+        self.assertTrue(await sender.receive_nothing(timeout=0.2))
+        self.assertTrue(await other.receive_nothing(timeout=0.2))
+        await sender.disconnect()
+        await other.disconnect()
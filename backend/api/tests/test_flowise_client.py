@@ -0,0 +1,47 @@
+import asyncio
+import threading
+
+from django.test import SimpleTestCase
+from api.flowise_client import FlowiseClient
+
+
+class FlowiseClientSessionTests(SimpleTestCase):
+    def test_session_of_a_finished_loop_is_closed(self):
+        client = FlowiseClient()
+
+        async def get_session():
+            session = client.get_session()
+            await asyncio.sleep(0)
+            return session
+
+        first = asyncio.run(get_session())
+        second = asyncio.run(get_session())
+        self.assertTrue(first.closed)
+        self.assertIsNot(first, second)
+        asyncio.run(client.close())
+
+    def test_session_of_a_running_loop_is_closed_on_that_loop(self):
+        client = FlowiseClient()
+        other_loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=other_loop.run_forever)
+        thread.start()
+        self.addCleanup(other_loop.close)
+        self.addCleanup(thread.join)
+        self.addCleanup(other_loop.call_soon_threadsafe, other_loop.stop)
+
+        async def get_session():
+            return client.get_session()
+
+        first = asyncio.run_coroutine_threadsafe(get_session(), other_loop).result(1)
+
+        async def replace_session():
+            client.get_session()
+            # The close runs on the other loop
+            for _ in range(100):
+                if first.closed:
+                    break
+                await asyncio.sleep(0.01)
+            await client.close()
+
+        asyncio.run(replace_session())
+        self.assertTrue(first.closed)
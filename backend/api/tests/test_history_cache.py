@@ -0,0 +1,91 @@
+from unittest import mock
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+from django.contrib.auth import get_user_model
+from api.models import ChatSession, Message
+from api.history_cache import (
+    InMemoryHistoryBuffer,
+    get_history_buffer,
+    get_recent_messages,
+    get_prompt_history,
+)
+
+User = get_user_model()
+
+
+class InMemoryHistoryBufferTests(TestCase):
+    def test_append_ignored_until_warm(self):
+        buffer = InMemoryHistoryBuffer(max_messages=3, timeout=60)
+        buffer.append(1, {'content': 'a'})
+        self.assertIsNone(buffer.get(1))
+
+    def test_buffer_is_capped(self):
+        buffer = InMemoryHistoryBuffer(max_messages=3, timeout=60)
+        buffer.warm(1, [{'content': 'a'}, {'content': 'b'}])
+        buffer.append(1, {'content': 'c'})
+        buffer.append(1, {'content': 'd'})
+        self.assertEqual([m['content'] for m in buffer.get(1)], ['b', 'c', 'd'])
+        self.assertEqual([m['content'] for m in buffer.get(1, 2)], ['c', 'd'])
+
+    def test_buffer_expires(self):
+        buffer = InMemoryHistoryBuffer(max_messages=3, timeout=-1)
+        buffer.warm(1, [{'content': 'a'}])
+        self.assertIsNone(buffer.get(1))
+
+
+class HotHistoryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='histuser', password='pass')
+        self.session = ChatSession.objects.create(user=self.user)
+        get_history_buffer().clear(self.session.id)
+        self.addCleanup(get_history_buffer().clear, self.session.id)
+        for i in range(5):
+            Message.objects.create(session=self.session, content=f'msg {i}', is_from_user=i % 2 == 0)
+
+    def test_miss_falls_back_to_database_and_warms(self):
+        messages = get_recent_messages(self.session.id, 3)
+        self.assertEqual([m['content'] for m in messages], ['msg 2', 'msg 3', 'msg 4'])
+        cached = get_history_buffer().get(self.session.id)
+        self.assertEqual(len(cached), 5)
+
+    def test_message_committed_during_miss_is_not_lost(self):
+        buffer = get_history_buffer()
+        warm = buffer.warm
+
+        def commit_then_warm(session_id, messages):
+            # Lands after the tail was read, while there's no buffer to append to
+            Message.objects.create(session=self.session, content='racing', is_from_user=True)
+            warm(session_id, messages)
+
+        with mock.patch.object(buffer, 'warm', side_effect=commit_then_warm):
+            get_recent_messages(self.session.id)
+        self.assertIsNone(buffer.get(self.session.id))
+        self.assertEqual(get_recent_messages(self.session.id)[-1]['content'], 'racing')
+
+    def test_new_messages_reach_warm_buffer_on_commit(self):
+        get_recent_messages(self.session.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(session=self.session, content='fresh', is_from_user=True)
+        self.assertEqual(get_history_buffer().get(self.session.id, 1)[0]['content'], 'fresh')
+
+    def test_prompt_history_format(self):
+        history = get_prompt_history(self.session.id, 2)
+        self.assertEqual(history, [
+            {'role': 'apiMessage', 'content': 'msg 3'},
+            {'role': 'userMessage', 'content': 'msg 4'},
+        ])
+
+    def test_messages_endpoint_pagination(self):
+        self.client.force_authenticate(user=self.user)
+        url = f'/api/chat-sessions/{self.session.id}/messages/'
+        response = self.client.get(url, {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([m['content'] for m in response.data], ['msg 3', 'msg 4'])
+
+        response = self.client.get(url, {'limit': 2, 'before': response.data[0]['sequence']})
+        self.assertEqual([m['content'] for m in response.data], ['msg 1', 'msg 2'])
+
+        response = self.client.get(url)
+        self.assertEqual(len(response.data), 5)
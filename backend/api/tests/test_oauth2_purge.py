@@ -0,0 +1,46 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from api.oauth2.models import OAuth2AuthorizationCode, OAuth2Client, OAuth2Token
+
+User = get_user_model()
+
+
+class PurgeOAuth2TokensTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='purgeuser', password='pass')
+        self.oauth_client = OAuth2Client.objects.create(
+            client_id='purge_client',
+            client_secret='secret',
+            redirect_uri='http://localhost:8000/callback'
+        )
+        now = timezone.now()
+        for i in range(5):
+            OAuth2Token.objects.create(
+                user=self.user, access_token=f'expired{i}', refresh_token=f'r-expired{i}',
+                expires_at=now - timedelta(hours=1)
+            )
+        OAuth2Token.objects.create(
+            user=self.user, access_token='live', refresh_token='r-live',
+            expires_at=now + timedelta(hours=1)
+        )
+        self.create_code('expired', now - timedelta(minutes=10), used=False)
+        self.create_code('used', now + timedelta(minutes=10), used=True)
+        self.create_code('fresh', now + timedelta(minutes=10), used=False)
+
+    def create_code(self, code, expires_at, used):
+        OAuth2AuthorizationCode.objects.create(
+            code=code, expires_at=expires_at, used=used,
+            user=self.user, client=self.oauth_client
+        )
+
+    def test_purge_removes_only_dead_rows(self):
+        out = StringIO()
+        call_command('purge_oauth2_tokens', batch_size=2, sleep=0, stdout=out)
+        self.assertEqual(list(OAuth2Token.objects.values_list('access_token', flat=True)), ['live'])
+        self.assertEqual(list(OAuth2AuthorizationCode.objects.values_list('code', flat=True)), ['fresh'])
+        self.assertIn('Removed 5 expired tokens, 1 expired codes, 1 used codes', out.getvalue())
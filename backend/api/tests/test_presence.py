@@ -0,0 +1,107 @@
+import asyncio
+from unittest import mock
+
+from channels.layers import get_channel_layer
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from api.consumers import TOO_MANY_CONNECTIONS_CODE
+from api.events import EventBus
+from api.presence import InMemoryPresenceRegistry, get_presence_registry
+from api.tests.mixins import ChatConnectionMixin
+
+User = get_user_model()
+
+
+class InMemoryPresenceRegistryTests(TestCase):
+    def setUp(self):
+        self.registry = InMemoryPresenceRegistry(timeout=90, max_connections_per_user=2)
+
+    def info(self, worker='w1'):
+        return {'device': 'web', 'worker': worker}
+
+    def test_register_enforces_cap(self):
+        self.assertTrue(self.registry.register(1, 'c1', self.info()))
+        self.assertTrue(self.registry.register(1, 'c2', self.info('w2')))
+        self.assertFalse(self.registry.register(1, 'c3', self.info()))
+        self.assertEqual(set(self.registry.live_connections(1)), {'c1', 'c2'})
+        self.assertEqual(self.registry.worker_counts(), {'w1': 1, 'w2': 1})
+
+        self.registry.unregister(1, 'c1')
+        self.assertTrue(self.registry.register(1, 'c3', self.info()))
+
+    def test_connections_without_heartbeat_expire(self):
+        with mock.patch('api.presence.time.time', return_value=1000):
+            self.registry.register(1, 'c1', self.info())
+            self.registry.register(1, 'c2', self.info())
+        with mock.patch('api.presence.time.time', return_value=1060):
+            self.registry.heartbeat(1, 'c2', self.info())
+        with mock.patch('api.presence.time.time', return_value=1120):
+            self.assertEqual(list(self.registry.live_connections(1)), ['c2'])
+            # The dead connection no longer counts towards the cap
+            self.assertTrue(self.registry.register(1, 'c3', self.info()))
+
+    def test_heartbeat_restores_pruned_connection(self):
+        with mock.patch('api.presence.time.time', return_value=1000):
+            self.registry.register(1, 'c1', self.info())
+        with mock.patch('api.presence.time.time', return_value=1200):
+            # The worker stalled past the timeout, but the socket is still open
+            self.assertEqual(self.registry.live_connections(1), {})
+            self.registry.heartbeat(1, 'c1', self.info())
+            self.assertEqual(list(self.registry.live_connections(1)), ['c1'])
+
+
+class PresenceConsumerTests(ChatConnectionMixin, TransactionTestCase):
+    async def test_connections_are_registered_and_capped(self):
+        registry = get_presence_registry()
+        # A cap below the per-IP connection rate limit, whatever PRESENCE says
+        patcher = mock.patch.object(registry, 'max_connections_per_user', 3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        communicators = []
+        for _ in range(registry.max_connections_per_user):
+            communicator = await self.open_chat('&device=mobile')
+            communicators.append(communicator)
+        connections = registry.live_connections(self.user.id)
+        self.assertEqual(len(connections), len(communicators))
+        self.assertTrue(all(info['device'] == 'mobile' for info in connections.values()))
+
+        rejected, error = await self.connect('&device=mobile')
+        self.assertEqual(error['code'], TOO_MANY_CONNECTIONS_CODE)
+        self.assertEqual((await rejected.receive_output())['code'], TOO_MANY_CONNECTIONS_CODE)
+
+        for communicator in communicators:
+            await communicator.disconnect()
+        self.assertEqual(registry.live_connections(self.user.id), {})
+
+    async def test_bus_falls_back_to_group_when_registry_fails(self):
+        layer = get_channel_layer()
+        channel = await layer.new_channel()
+        await layer.group_add(f"user_{self.user.id}", channel)
+        bus = EventBus(window=0)
+        with mock.patch('api.events.get_presence_registry', side_effect=ConnectionError('down')):
+            await bus.enqueue(self.user.id, {'frame': {'sequence': 1}, 'origin': None})
+            event = await asyncio.wait_for(layer.receive(channel), 1)
+        self.assertEqual(event['events'][0]['frame']['sequence'], 1)
+
+
+class PresenceStatsViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('presence_stats')
+        self.registry = get_presence_registry()
+        self.registry.register(-2, 'stats-channel', {'device': 'web', 'worker': 'stats-worker'})
+        self.addCleanup(self.registry.unregister, -2, 'stats-channel')
+
+    def test_staff_gets_counts_per_worker(self):
+        staff = User.objects.create_user(username='staff', password='pass', is_staff=True)
+        self.client.force_authenticate(staff)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['workers']['stats-worker'], 1)
+        self.assertEqual(response.data['total'], sum(response.data['workers'].values()))
+
+    def test_non_staff_is_forbidden(self):
+        self.client.force_authenticate(User.objects.create_user(username='plain', password='pass'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
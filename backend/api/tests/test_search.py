@@ -0,0 +1,77 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+from django.contrib.auth import get_user_model
+from api.archive import archive_session
+from api.models import ChatSession, Message
+from api.search import search_messages
+
+User = get_user_model()
+
+
+class MessageSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.learner = User.objects.create_user(username='learner', password='pass')
+        self.other = User.objects.create_user(username='other', password='pass')
+        self.staff = User.objects.create_user(username='staff', password='pass', is_staff=True)
+        self.learner_session = ChatSession.objects.create(user=self.learner)
+        other_session = ChatSession.objects.create(user=self.other)
+        Message.objects.create(session=self.learner_session, content='Why does step 2 of lab 3 fail?')
+        Message.objects.create(session=self.learner_session, content='Lab 3 needs the lab 3 dataset')
+        Message.objects.create(session=self.learner_session, content='Thanks, that helped')
+        Message.objects.create(session=other_session, content='Lab 3 question from someone else')
+
+    def test_index_is_maintained_on_insert_and_ranked(self):
+        results = search_messages('lab 3', user_id=self.learner.id)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0].content, 'Lab 3 needs the lab 3 dataset')
+        self.assertGreaterEqual(results[0].rank, results[1].rank)
+
+    def test_archived_conversations_stay_searchable(self):
+        recent = ChatSession.objects.create(user=self.learner)
+        Message.objects.create(session=recent, content='Lab 3 again, in a new conversation')
+        archive_session(self.learner_session.id)
+
+        results = search_messages('lab 3', user_id=self.learner.id)
+        self.assertEqual([result.content for result in results], [
+            'Lab 3 again, in a new conversation',
+            'Lab 3 needs the lab 3 dataset',
+            'Why does step 2 of lab 3 fail?',
+        ])
+        self.assertEqual({result.session_id for result in results[1:]}, {self.learner_session.id})
+        # Pages reaching into the archived matches
+        page = search_messages('lab 3', user_id=self.learner.id, limit=1, offset=2)
+        self.assertEqual([result.content for result in page], ['Why does step 2 of lab 3 fail?'])
+        self.assertEqual(search_messages('lab 3', user_id=self.learner.id, limit=1, offset=3), [])
+
+        self.client.force_authenticate(user=self.learner)
+        response = self.client.get('/api/chat-sessions/search/', {'q': 'dataset'})
+        result = response.data['results'][0]
+        self.assertEqual(
+            (result['content'], result['session']), ('Lab 3 needs the lab 3 dataset', self.learner_session.id)
+        )
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(len(search_messages('"lab* (', user_id=self.learner.id)), 2)
+        self.assertEqual(search_messages('***'), [])
+
+    def test_learners_only_see_their_own_messages(self):
+        self.client.force_authenticate(user=self.learner)
+        response = self.client.get('/api/chat-sessions/search/', {'q': 'lab', 'user': self.other.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertFalse(response.data['has_next'])
+
+    def test_staff_search_all_and_paginate(self):
+        self.client.force_authenticate(user=self.staff)
+        response = self.client.get('/api/chat-sessions/search/', {'q': 'lab', 'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertTrue(response.data['has_next'])
+        response = self.client.get('/api/chat-sessions/search/', {'q': 'lab', 'page_size': 2, 'page': 2})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertFalse(response.data['has_next'])
+
+    def test_missing_query(self):
+        self.client.force_authenticate(user=self.learner)
+        response = self.client.get('/api/chat-sessions/search/')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,79 @@
+from django.test import TestCase, TransactionTestCase
+from django.contrib.auth import get_user_model
+from channels.testing import WebsocketCommunicator
+from rest_framework_simplejwt.tokens import AccessToken
+from api.consumers import ChatConsumer
+from api.models import ChatSession, Message
+from api.history_cache import get_history_buffer, get_messages_since
+
+User = get_user_model()
+
+
+class MessageSequenceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='sequser', password='pass')
+        self.session = ChatSession.objects.create(user=self.user)
+        get_history_buffer().clear(self.session.id)
+        self.addCleanup(get_history_buffer().clear, self.session.id)
+
+    def test_sequences_are_per_session_and_monotonic(self):
+        other = ChatSession.objects.create(user=self.user)
+        first = Message.objects.create(session=self.session, content='a')
+        second = Message.objects.create(session=self.session, content='b')
+        third = Message.objects.create(session=other, content='c')
+        self.assertEqual((first.sequence, second.sequence, third.sequence), (1, 2, 1))
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.last_sequence, 2)
+
+    def test_messages_since_returns_only_missed(self):
+        for i in range(4):
+            Message.objects.create(session=self.session, content=f'm{i}')
+        messages, truncated = get_messages_since(self.session.id, 2)
+        self.assertEqual([m['sequence'] for m in messages], [3, 4])
+        self.assertFalse(truncated)
+        self.assertEqual(get_messages_since(self.session.id, 4), ([], False))
+
+    def test_messages_since_detects_stale_buffer(self):
+        Message.objects.create(session=self.session, content='old')
+        get_messages_since(self.session.id, 0)
+        # Saved without running on_commit hooks, so the warm buffer misses it
+        Message.objects.create(session=self.session, content='new')
+        messages, _ = get_messages_since(self.session.id, 1)
+        self.assertEqual([m['content'] for m in messages], ['new'])
+
+    def test_messages_since_truncates_to_window(self):
+        buffer = get_history_buffer()
+        for i in range(buffer.max_messages + 5):
+            Message.objects.create(session=self.session, content=f'm{i}')
+        messages, truncated = get_messages_since(self.session.id, 0)
+        self.assertEqual(len(messages), buffer.max_messages)
+        self.assertTrue(truncated)
+
+
+class ResumeConsumerTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='resumeuser', password='pass')
+        self.session = ChatSession.objects.create(user=self.user)
+        get_history_buffer().clear(self.session.id)
+        self.addCleanup(get_history_buffer().clear, self.session.id)
+        for i in range(3):
+            Message.objects.create(session=self.session, content=f'm{i}', is_from_user=i % 2 == 0)
+
+    async def test_resume_replays_missed_messages(self):
+        token = str(AccessToken.for_user(self.user))
+        communicator = WebsocketCommunicator(
+            ChatConsumer.as_asgi(),
+            f"/ws/chat/?token={token}&auth_type=jwt"
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        user_info = await communicator.receive_json_from()
+        self.assertEqual(user_info['type'], 'user_info')
+        self.assertEqual(user_info['last_sequence'], 3)
+
+        await communicator.send_json_to({'type': 'resume', 'last_sequence': 1})
+        history = await communicator.receive_json_from()
+        self.assertEqual(history['type'], 'history')
+        self.assertEqual([m['content'] for m in history['messages']], ['m1', 'm2'])
+        self.assertEqual(history['last_sequence'], 3)
+        await communicator.disconnect()
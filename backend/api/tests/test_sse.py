@@ -0,0 +1,80 @@
+import asyncio
+import json
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TransactionTestCase, override_settings
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.tokens import AccessToken
+from api.models import Message
+
+User = get_user_model()
+
+
+def parse_events(body):
+    events = []
+    for block in body.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+class ChatStreamTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='sseuser', password='pass')
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    async def post(self, data, **headers):
+        return await self.async_client.post(
+            '/api/chat/stream/', json.dumps(data), content_type='application/json', headers=headers
+        )
+
+    async def read_events(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        return parse_events(body)
+
+    @mock.patch('api.turns.FlowiseClient.send_message', new_callable=mock.AsyncMock)
+    async def test_message_is_answered_over_sse(self, send_message):
+        send_message.return_value = {'text': 'Hi there'}
+        events = await self.read_events(await self.post({'id': 'm1', 'content': 'Hello'}, **self.headers))
+
+        self.assertEqual([name for name, _ in events], ['ack', 'message'])
+        ack, answer = events[0][1], events[1][1]
+        self.assertEqual(ack['id'], 'm1')
+        self.assertEqual((answer['content'], answer['isUser'], answer['sequence']), ('Hi there', False, ack['sequence'] + 1))
+        self.assertEqual(send_message.call_args.args[0], 'Hello')
+        self.assertEqual(await Message.objects.filter(session__user=self.user).acount(), 2)
+
+    @override_settings(CHAT_STREAM_ANSWERS=True, CHAT_STREAM_FLUSH_MS=10)
+    async def test_streamed_answer_sends_chunks_before_the_message(self):
+        async def stream_message(self, content, session_id=None, history=None):
+            yield 'Hi '
+            await asyncio.sleep(0.05)
+            yield 'there'
+
+        with mock.patch('api.turns.FlowiseClient.stream_message', stream_message):
+            events = await self.read_events(await self.post({'content': 'Hello'}, **self.headers))
+        self.assertEqual([name for name, _ in events], ['ack', 'stream', 'message'])
+        self.assertEqual(events[1][1]['content'], 'Hi ')
+        self.assertEqual(events[2][1]['content'], 'Hi there')
+
+    async def test_requires_authentication_and_content(self):
+        response = await self.post({'content': 'Hello'})
+        self.assertEqual(response.status_code, 401)
+        response = await self.post({'content': 'Hello'}, Authorization='Bearer invalid')
+        self.assertEqual(response.status_code, 401)
+        response = await self.post({'content': ''}, **self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(WEBSOCKET_CONNECTIONS_PER_MINUTE=5)
+    @mock.patch('api.turns.FlowiseClient.send_message', new_callable=mock.AsyncMock)
+    async def test_shares_the_connection_rate_limit(self, send_message):
+        send_message.return_value = {'text': 'ok'}
+        cache.set('ws_rate_limit_127.0.0.1', 5, 60)
+        response = await self.post({'content': 'Hello'}, **self.headers)
+        self.assertEqual(response.status_code, 429)
+        send_message.assert_not_called()
@@ -0,0 +1,104 @@
+import asyncio
+from unittest import mock
+
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.tokens import AccessToken
+from api.consumers import ChatConsumer
+from api.connections import connection_registry
+from api.outbound import StreamBuffer
+
+User = get_user_model()
+
+
+class StreamBufferTests(SimpleTestCase):
+    async def test_chunks_are_coalesced_into_few_frames(self):
+        sent = []
+
+        async def send(text):
+            sent.append(text)
+
+        buffer = StreamBuffer(send, flush_interval=0.05, flush_bytes=1000)
+        for i in range(100):
+            buffer.add(f'{i} ')
+        await asyncio.sleep(0.1)
+        buffer.add('end')
+        await asyncio.sleep(0.1)
+        await buffer.finish()
+
+        self.assertEqual(''.join(sent), ''.join(f'{i} ' for i in range(100)) + 'end')
+        self.assertEqual((buffer.chunks_received, buffer.frames_sent), (101, 2))
+
+    async def test_size_threshold_flushes_early(self):
+        sent = []
+
+        async def send(text):
+            sent.append(text)
+
+        buffer = StreamBuffer(send, flush_interval=10, flush_bytes=10)
+        buffer.add('0123456789')
+        await asyncio.sleep(0.01)
+        self.assertEqual(sent, ['0123456789'])
+        await buffer.finish()
+
+    async def test_chunks_arriving_during_a_send_go_out_together(self):
+        release = asyncio.Event()
+        sent = []
+
+        async def send(text):
+            sent.append(text)
+            await release.wait()
+
+        buffer = StreamBuffer(send, flush_interval=0, flush_bytes=1)
+        buffer.add('first')
+        await asyncio.sleep(0.01)
+        # The first frame is still being sent; the rest waits for the next one
+        for i in range(10):
+            buffer.add(f' {i}')
+        release.set()
+        await asyncio.sleep(0.01)
+        await buffer.finish()
+        self.assertEqual(sent, ['first', ''.join(f' {i}' for i in range(10))])
+        self.assertEqual((buffer.chunks_received, buffer.frames_sent), (11, 2))
+
+
+class ConsumerStreamingTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='streamuser', password='pass')
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    @override_settings(CHAT_STREAM_ANSWERS=True, CHAT_STREAM_FLUSH_MS=30, CHAT_STREAM_FLUSH_BYTES=1000)
+    async def test_streamed_answer_is_coalesced_then_sent_in_full(self):
+        tokens = [f'word{i} ' for i in range(50)]
+
+        async def stream_message(self, content, session_id=None, history=None):
+            for token in tokens:
+                yield token
+
+        token = str(AccessToken.for_user(self.user))
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f"/ws/chat/?token={token}&auth_type=jwt")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from()
+        chunks_before = connection_registry.counters['stream_chunks']
+
+        with mock.patch('api.turns.FlowiseClient.stream_message', stream_message):
+            await communicator.send_json_to({'type': 'message', 'id': 'm1', 'content': 'Hello'})
+            self.assertEqual((await communicator.receive_json_from())['type'], 'ack')
+            frames = []
+            while True:
+                frame = await communicator.receive_json_from(timeout=2)
+                frames.append(frame)
+                if frame['type'] == 'message':
+                    break
+
+        answer = frames.pop()
+        self.assertEqual(answer['content'], ''.join(tokens))
+        # 50 chunks arrive within one flush interval: at most one stream frame
+        self.assertLessEqual(len(frames), 1)
+        self.assertTrue(all(frame['type'] == 'stream' and frame['id'] == 'm1' for frame in frames))
+        self.assertEqual(connection_registry.counters['stream_chunks'] - chunks_before, 50)
+        await communicator.disconnect()
@@ -0,0 +1,68 @@
+from unittest import mock
+
+from django.test import TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from api.models import ChatSession
+from api.tests.mixins import ChatConnectionMixin
+from api.tickets import issue_ticket
+
+
+class WebSocketTicketTests(ChatConnectionMixin, TransactionTestCase):
+    username = 'ticketuser'
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    async def connect_with_ticket(self, ticket):
+        return await self.connect(token=ticket, auth_type='ticket')
+
+    def test_page_views_write_nothing(self):
+        response = self.client.post('/api/xblock/websocket-token/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['auth_type'], response.data['chat_session_id']), ('ticket', None))
+
+        # The missing session is cached too: later page views don't query at all
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                self.client.post('/api/xblock/websocket-token/')
+        self.assertFalse(ChatSession.objects.filter(user=self.user).exists())
+
+    @mock.patch('api.turns.FlowiseClient.send_message', new_callable=mock.AsyncMock)
+    async def test_session_is_created_with_the_first_message(self, send_message):
+        send_message.return_value = {'text': 'Hi there'}
+        communicator, user_info = await self.connect_with_ticket(issue_ticket(self.user.id))
+        self.assertEqual((user_info['username'], user_info['last_sequence']), ('ticketuser', 0))
+        self.assertFalse(await ChatSession.objects.filter(user=self.user).aexists())
+
+        await communicator.send_json_to({'type': 'resume', 'last_sequence': 0})
+        self.assertEqual((await communicator.receive_json_from())['messages'], [])
+
+        await communicator.send_json_to({'type': 'message', 'id': 'm1', 'content': 'Hello'})
+        self.assertEqual((await communicator.receive_json_from())['sequence'], 1)
+        answer = await communicator.receive_json_from()
+        await communicator.disconnect()
+        session = await ChatSession.objects.aget(user=self.user)
+        self.assertEqual(answer['session_id'], session.id)
+
+        # The next ticket names the session, which a new connection picks up
+        response = await self.async_client.post('/api/xblock/websocket-token/', headers=self.headers)
+        self.assertEqual(response.json()['chat_session_id'], session.id)
+        communicator, user_info = await self.connect_with_ticket(response.json()['token'])
+        self.assertEqual(user_info['last_sequence'], 2)
+        await communicator.disconnect()
+
+    async def test_tampered_and_expired_tickets_are_rejected(self):
+        ticket = issue_ticket(self.user.id)
+        for bad in (ticket[:-2] + 'xx', issue_ticket(self.user.id).replace(':', ';', 1)):
+            communicator, error = await self.connect_with_ticket(bad)
+            self.assertEqual((error['type'], error['code']), ('error', 4001))
+            await communicator.disconnect()
+
+        with override_settings(WEBSOCKET_TICKET_MAX_AGE=-1):
+            communicator, error = await self.connect_with_ticket(ticket)
+        self.assertEqual(error['message'], 'Invalid or expired ticket provided')
+        await communicator.disconnect()
@@ -0,0 +1,73 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TransactionTestCase
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.tokens import AccessToken
+from api.consumers import TOKEN_REFRESH_MARGIN
+from api.connections import connection_registry
+from api.tests.mixins import ChatConnectionMixin
+
+User = get_user_model()
+
+
+def make_token(user, lifetime=timedelta(hours=1)):
+    token = AccessToken.for_user(user)
+    token.set_exp(lifetime=lifetime)
+    return token
+
+
+class TokenRefreshTests(ChatConnectionMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        # Checks below jump hours ahead; keep the idle reaper out of the way
+        for name in ('ping_interval', 'idle_timeout', 'silent_timeout'):
+            patcher = mock.patch.object(connection_registry, name, 10 ** 6)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def connect_with_token(self, token):
+        communicator, user_info = await self.connect(token=token)
+        self.assertEqual(user_info['type'], 'user_info')
+        self.assertEqual(user_info['token_expires_at'], token['exp'])
+        return communicator
+
+    async def test_refresh_token_extends_connection(self):
+        communicator = await self.connect_with_token(make_token(self.user, timedelta(minutes=2)))
+        new_token = make_token(self.user, timedelta(hours=2))
+        await communicator.send_json_to({'type': 'refresh_token', 'token': str(new_token)})
+        response = await communicator.receive_json_from()
+        self.assertEqual(response, {'type': 'token_refreshed', 'expires_at': new_token['exp']})
+
+        # The old expiry no longer applies
+        await connection_registry.check(new_token['exp'] - TOKEN_REFRESH_MARGIN - 1)
+        self.assertTrue(await communicator.receive_nothing(timeout=0.1))
+        await communicator.disconnect()
+
+    async def test_token_of_another_user_is_rejected(self):
+        other = await User.objects.acreate(username='otheruser')
+        communicator = await self.connect_with_token(make_token(self.user))
+        await communicator.send_json_to({'type': 'refresh_token', 'token': str(make_token(other))})
+        error = await communicator.receive_json_from()
+        self.assertEqual((error['type'], error['message']), ('error', 'Token belongs to another user'))
+
+        # The connection stays open on its current token
+        await communicator.send_json_to({'type': 'ping'})
+        self.assertEqual((await communicator.receive_json_from())['type'], 'pong')
+        await communicator.disconnect()
+
+    async def test_expiring_token_is_flagged_then_closed(self):
+        token = make_token(self.user, timedelta(minutes=30))
+        communicator = await self.connect_with_token(token)
+
+        await connection_registry.check(token['exp'] - TOKEN_REFRESH_MARGIN + 1)
+        notice = await communicator.receive_json_from()
+        self.assertEqual((notice['type'], notice['expires_at']), ('token_refresh_required', token['exp']))
+        # Asked only once
+        await connection_registry.check(token['exp'] - 10)
+        self.assertTrue(await communicator.receive_nothing(timeout=0.1))
+
+        await connection_registry.check(token['exp'])
+        error = await communicator.receive_json_from()
+        self.assertEqual((error['code'], error['message']), (4001, 'Token expired'))
+        self.assertEqual((await communicator.receive_output())['type'], 'websocket.close')
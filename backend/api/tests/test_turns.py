@@ -0,0 +1,185 @@
+import asyncio
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from api.consumers import TURN_QUEUE_FULL_CODE
+from api.models import Message
+from api.tests.mixins import ChatConnectionMixin
+from api.turns import Turn, TurnScheduler
+
+
+class TurnSchedulerTests(SimpleTestCase):
+    async def test_turns_run_in_order_up_to_the_limit(self):
+        done = []
+        release = asyncio.Event()
+
+        async def run_turn(turn):
+            await release.wait()
+            done.append(turn.ids)
+
+        scheduler = TurnScheduler(run_turn, max_outstanding=2)
+        self.assertTrue(scheduler.submit(Turn('a', 'first', 1)))
+        self.assertTrue(scheduler.submit(Turn('b', 'second', 2)))
+        self.assertFalse(scheduler.submit(Turn('c', 'third', 3)))
+        release.set()
+        while len(scheduler):
+            await asyncio.sleep(0)
+        self.assertEqual(done, [['a'], ['b']])
+
+    async def test_messages_within_debounce_window_are_merged(self):
+        done = []
+
+        async def run_turn(turn):
+            done.append((turn.ids, turn.content))
+
+        scheduler = TurnScheduler(run_turn, max_outstanding=5, debounce=0.05)
+        scheduler.submit(Turn('a', 'hi', 1))
+        await asyncio.sleep(0.02)
+        scheduler.submit(Turn('b', 'about lab 3', 2))
+        await asyncio.sleep(0.02)
+        scheduler.submit(Turn('c', 'why does step 2 fail', 3))
+        await asyncio.sleep(0.15)
+        scheduler.submit(Turn('d', 'thanks', 4))
+        while len(scheduler) or len(done) < 2:
+            await asyncio.sleep(0.01)
+        self.assertEqual(done, [
+            (['a', 'b', 'c'], 'hi\nabout lab 3\nwhy does step 2 fail'),
+            (['d'], 'thanks'),
+        ])
+
+    async def test_merged_messages_count_as_one_turn(self):
+        release = asyncio.Event()
+
+        async def run_turn(turn):
+            await release.wait()
+
+        scheduler = TurnScheduler(run_turn, max_outstanding=1, debounce=0.05)
+        for i in range(4):
+            self.assertFalse(scheduler.full(time.monotonic()))
+            self.assertTrue(scheduler.submit(Turn(str(i), 'part', i + 1)))
+        self.assertEqual(len(scheduler), 1)
+        await asyncio.sleep(0.1)
+        # Past the window a new message needs a turn of its own
+        self.assertTrue(scheduler.full(time.monotonic()))
+        self.assertFalse(scheduler.submit(Turn('4', 'next', 5)))
+        release.set()
+
+    async def test_cancel_drops_running_and_queued_turns(self):
+        started = asyncio.Event()
+
+        async def run_turn(turn):
+            started.set()
+            await asyncio.sleep(10)
+
+        scheduler = TurnScheduler(run_turn, max_outstanding=3)
+        scheduler.submit(Turn('a', 'first', 1))
+        scheduler.submit(Turn('b', 'second', 2))
+        await started.wait()
+        self.assertEqual([turn.ids for turn in scheduler.cancel()], [['a'], ['b']])
+        self.assertEqual(len(scheduler), 0)
+
+
+class ConsumerTurnTests(ChatConnectionMixin, TransactionTestCase):
+    @mock.patch('api.turns.FlowiseClient.send_message', new_callable=mock.AsyncMock)
+    async def test_frames_are_handled_while_answers_generate(self, send_message):
+        release = asyncio.Event()
+
+        async def answer(content, session_id=None, history=None):
+            await release.wait()
+            return {'text': f'answer to {content}'}
+        send_message.side_effect = answer
+
+        communicator = await self.open_chat()
+        for i in range(3):
+            await communicator.send_json_to({'type': 'message', 'id': f'm{i}', 'content': f'q{i}'})
+            self.assertEqual((await communicator.receive_json_from())['type'], 'ack')
+
+        # The first answer is still generating, yet pings are answered
+        await communicator.send_json_to({'type': 'ping'})
+        self.assertEqual((await communicator.receive_json_from())['type'], 'pong')
+
+        await communicator.send_json_to({'type': 'message', 'id': 'm3', 'content': 'q3'})
+        error = await communicator.receive_json_from()
+        self.assertEqual((error['type'], error['code'], error['id']), ('error', TURN_QUEUE_FULL_CODE, 'm3'))
+
+        release.set()
+        answers = [await communicator.receive_json_from(timeout=2) for _ in range(3)]
+        self.assertEqual([a['content'] for a in answers], ['answer to q0', 'answer to q1', 'answer to q2'])
+
+        # Each prompt sees earlier answers but not the questions queued behind it
+        second_history = send_message.call_args_list[1].kwargs['history']
+        self.assertEqual([h['content'] for h in second_history], ['q0', 'answer to q0'])
+        await communicator.disconnect()
+
+    @mock.patch.object(TurnScheduler, 'submit', return_value=False)
+    async def test_refused_turn_is_reported(self, submit):
+        communicator = await self.open_chat()
+        await communicator.send_json_to({'type': 'message', 'id': 'm1', 'content': 'q'})
+        self.assertEqual((await communicator.receive_json_from())['type'], 'ack')
+        error = await communicator.receive_json_from()
+        self.assertEqual((error['type'], error['code'], error['id']), ('error', TURN_QUEUE_FULL_CODE, 'm1'))
+        await communicator.disconnect()
+
+    @mock.patch('api.turns.FlowiseClient.send_message', new_callable=mock.AsyncMock)
+    async def test_cancel_stops_pending_turns(self, send_message):
+        started = asyncio.Event()
+
+        async def answer(content, session_id=None, history=None):
+            started.set()
+            await asyncio.sleep(10)
+        send_message.side_effect = answer
+
+        communicator = await self.open_chat()
+        for i in range(2):
+            await communicator.send_json_to({'type': 'message', 'id': f'm{i}', 'content': f'q{i}'})
+            await communicator.receive_json_from()
+        await started.wait()
+
+        await communicator.send_json_to({'type': 'cancel'})
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'cancelled', 'ids': ['m0', 'm1']})
+        self.assertTrue(await communicator.receive_nothing(timeout=0.1))
+        await communicator.disconnect()
+
+    @mock.patch('api.turns.FlowiseClient.send_message', new_callable=mock.AsyncMock)
+    async def test_outstanding_turns_are_answered_after_disconnect(self, send_message):
+        release = asyncio.Event()
+
+        async def answer(content, session_id=None, history=None):
+            await release.wait()
+            return {'text': f'answer to {content}'}
+        send_message.side_effect = answer
+
+        communicator = await self.open_chat()
+        for i in range(2):
+            await communicator.send_json_to({'type': 'message', 'id': f'm{i}', 'content': f'q{i}'})
+            await communicator.receive_json_from()
+        await communicator.disconnect()
+
+        # Both acked questions are answered for the client's resume
+        release.set()
+        replies = Message.objects.filter(session__user=self.user, is_from_user=False).order_by('sequence')
+        for _ in range(200):
+            if await replies.acount() == 2:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual([reply.content async for reply in replies], ['answer to q0', 'answer to q1'])
+        self.assertEqual(send_message.await_count, 2)
+
+    @override_settings(CHAT_DEBOUNCE_MS=100)
+    @mock.patch('api.turns.FlowiseClient.send_message', new_callable=mock.AsyncMock)
+    async def test_rapid_messages_get_one_answer(self, send_message):
+        send_message.return_value = {'text': 'step 2 needs the lab 3 dataset'}
+        communicator = await self.open_chat()
+        # More messages than CHAT_MAX_OUTSTANDING_TURNS, all in one turn
+        for i, content in enumerate(['hi', 'about lab 3', 'why does step 2 fail', 'in the notebook']):
+            await communicator.send_json_to({'type': 'message', 'id': f'm{i}', 'content': content})
+            self.assertEqual((await communicator.receive_json_from())['type'], 'ack')
+
+        answer = await communicator.receive_json_from(timeout=2)
+        self.assertEqual(answer['content'], 'step 2 needs the lab 3 dataset')
+        self.assertTrue(await communicator.receive_nothing(timeout=0.2))
+        send_message.assert_awaited_once()
+        self.assertEqual(send_message.call_args.args[0], 'hi\nabout lab 3\nwhy does step 2 fail\nin the notebook')
+        self.assertEqual(await Message.objects.filter(session__user=self.user, is_from_user=True).acount(), 4)
+        await communicator.disconnect()
@@ -0,0 +1,87 @@
+from unittest import mock
+
+import msgpack
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.test import SimpleTestCase, TransactionTestCase
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.tokens import AccessToken
+from api.consumers import ChatConsumer
+from api.wire import FrameDecodeError, MsgpackCodec, json_codec, negotiate
+
+User = get_user_model()
+
+
+class CodecTests(SimpleTestCase):
+    def test_negotiation_falls_back_to_json(self):
+        self.assertIs(negotiate([]), json_codec)
+        self.assertIs(negotiate(['ibal.unknown']), json_codec)
+        self.assertEqual(negotiate(['ibal.unknown', 'ibal.msgpack.v1']).subprotocol, 'ibal.msgpack.v1')
+
+    def test_msgpack_frames_use_compact_keys(self):
+        codec = MsgpackCodec()
+        frame = {
+            'type': 'message',
+            'id': 'a1',
+            'session_id': 7,
+            'sequence': 12,
+            'content': 'Hello',
+            'isUser': False,
+            'timestamp': '2024-05-01T10:00:00.250000+00:00',
+        }
+        packed = msgpack.unpackb(codec.encode(frame))
+        self.assertEqual(packed, {
+            't': 'message', 'i': 'a1', 's': 7, 'q': 12, 'c': 'Hello', 'u': False, 'ts': 1714557600250,
+        })
+        self.assertLess(len(codec.encode(frame)), len(json_codec.encode(frame)))
+        # Nested frames are compacted too, and decoding restores the long names
+        history = {'type': 'history', 'messages': [frame], 'truncated': False}
+        decoded = codec.decode(bytes_data=codec.encode(history))
+        self.assertEqual(decoded['messages'][0]['timestamp'], 1714557600250)
+        self.assertEqual(decoded['messages'][0]['session_id'], 7)
+
+    def test_invalid_frames_raise_decode_error(self):
+        with self.assertRaises(FrameDecodeError):
+            json_codec.decode('{not json')
+        with self.assertRaises(FrameDecodeError):
+            MsgpackCodec().decode(text_data='{"type": "ping"}')
+        with self.assertRaises(FrameDecodeError):
+            MsgpackCodec().decode(bytes_data=b'\xc1')
+
+
+class MsgpackConsumerTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='wireuser', password='pass')
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    async def receive(self, communicator):
+        return msgpack.unpackb(await communicator.receive_from(), raw=False)
+
+    @mock.patch('api.turns.FlowiseClient.send_message', new_callable=mock.AsyncMock)
+    async def test_chat_over_msgpack_subprotocol(self, send_message):
+        send_message.return_value = {'text': 'Hi there'}
+        token = str(AccessToken.for_user(self.user))
+        communicator = WebsocketCommunicator(
+            ChatConsumer.as_asgi(), f"/ws/chat/?token={token}&auth_type=jwt",
+            subprotocols=['ibal.msgpack.v1']
+        )
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, 'ibal.msgpack.v1')
+        user_info = await self.receive(communicator)
+        self.assertEqual((user_info['t'], user_info['n']), ('user_info', 'wireuser'))
+
+        await communicator.send_to(bytes_data=msgpack.packb({'t': 'message', 'i': 'm1', 'c': 'Hello'}))
+        ack = await self.receive(communicator)
+        self.assertEqual((ack['t'], ack['i']), ('ack', 'm1'))
+        answer = await self.receive(communicator)
+        self.assertEqual((answer['t'], answer['c'], answer['u']), ('message', 'Hi there', False))
+        self.assertIsInstance(answer['ts'], int)
+        send_message.assert_awaited_once()
+
+        # Text frames are not part of the binary protocol
+        await communicator.send_to(text_data='{"type": "ping"}')
+        error = await self.receive(communicator)
+        self.assertEqual((error['e'], error['msg']), (4001, 'Invalid msgpack format'))
+        await communicator.disconnect()
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from .flowise_client import FlowiseClient
+from .history_cache import get_prompt_history
+from .models import ChatSession, Message
+
+logger = logging.getLogger(__name__)
+
+# Sent in place of an answer when Flowise fails
+ERROR_ANSWER = "Sorry, there was an error getting a response from the AI.Try again later."
+
+# One client, and with it one pooled HTTP session, shared by every connection of the worker
+flowise_client = FlowiseClient()
+
+
+class Turn:
+    """
+    One or more consecutive user messages waiting for a single LLM answer.
+    A turn starts with one message; the scheduler merges messages sent in
+    quick succession into it.
+    """
+    __slots__ = ('ids', 'contents', 'sequences', 'received_at')
+
+    def __init__(self, id, content, sequence, received_at=None):
+        self.ids = [id]
+        self.contents = [content]
+        self.sequences = [sequence]
+        self.received_at = received_at or time.monotonic()
+
+    @property
+    def content(self):
+        return '\n'.join(self.contents)
+
+    def merge(self, other):
+        self.ids.extend(other.ids)
+        self.contents.extend(other.contents)
+        self.sequences.extend(other.sequences)
+        self.received_at = other.received_at
+
+
+class TurnScheduler:
+    """
+    Runs the LLM turns of one connection in arrival order, off the receive path.
+
+    The consumer hands turns to the scheduler and returns right away, so
+    pings, token refreshes and cancel requests are handled while an answer
+    is being generated. At most `max_outstanding` turns (queued plus the one
+    running) are accepted; `submit` returns False beyond that so the caller
+    can reject the message instead of letting work pile up in memory.
+
+    With a `debounce` window (in seconds), a turn waits until no further
+    message has arrived for that long before its answer starts, and a
+    message arriving within the window of the previous one is merged into
+    its turn when submitted. A question split over several quick messages
+    then costs one generation instead of one per message, and counts as one
+    turn towards the limit.
+    """
+    def __init__(self, run_turn, max_outstanding=3, debounce=0):
+        self.run_turn = run_turn
+        self.max_outstanding = max_outstanding
+        self.debounce = debounce
+        self.pending = deque()
+        self.current = None
+        self._task = None
+        # When the last accepted message arrived, for merging within the window
+        self._last_received = None
+
+    def __len__(self):
+        return len(self.pending) + (self.current is not None)
+
+    def merges(self, received_at):
+        """Whether a message arriving at `received_at` joins the previous message's turn."""
+        return bool(self.debounce) and self._last_received is not None and \
+            received_at - self._last_received <= self.debounce
+
+    def full(self, received_at):
+        """Whether a message arriving at `received_at` would be turned away."""
+        return not self.merges(received_at) and len(self) >= self.max_outstanding
+
+    def submit(self, turn):
+        """
+        Queue a turn; returns False when the connection has too many
+        outstanding turns. A turn within the debounce window of the previous
+        one is merged into it, or queued even at the limit if that turn's
+        answer started in the meantime.
+        """
+        if self.merges(turn.received_at):
+            self._last_received = turn.received_at
+            if self.pending:
+                self.pending[-1].merge(turn)
+                return True
+        elif len(self) >= self.max_outstanding:
+            return False
+        self._last_received = turn.received_at
+        self.pending.append(turn)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._drain())
+        return True
+
+    async def _drain(self):
+        while self.pending:
+            if self.debounce:
+                await self._settle()
+                if not self.pending:
+                    break
+            turn = self.pending.popleft()
+            self.current = turn
+            try:
+                await self.run_turn(turn)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Turn {turn.ids} failed: {str(e)}", exc_info=True)
+            finally:
+                self.current = None
+
+    async def _settle(self):
+        """Wait until no message has joined the turn at the head of the queue for the window."""
+        while self.pending:
+            remaining = self.pending[0].received_at + self.debounce - time.monotonic()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(remaining)
+
+    def cancel(self):
+        """Stop the running turn, drop the queued ones and return them all."""
+        dropped = ([self.current] if self.current is not None else []) + list(self.pending)
+        self.pending.clear()
+        self._last_received = None
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+        self.current = None
+        return dropped
+
+
+def save_message(session_id, user_id, content, is_from_user, origin=None):
+    """
+    Save a message to the database.
+    `origin` is the channel of the connection delivering the message itself,
+    so the event bus fan-out doesn't send it back there. The session is an
+    unsaved stub carrying the ids the save signals need, so callers don't
+    have to hold a model instance between messages.
+    """
+    message = Message(
+        session=ChatSession(id=session_id, user_id=user_id),
+        content=content,
+        is_from_user=is_from_user
+    )
+    message.event_origin = origin
+    message.save()
+    return message
+
+
+async def generate_answer(content, session_id, history, stream=None):
+    """
+    Ask Flowise for the answer to `content` and return its text.
+    With a StreamBuffer as `stream`, the answer is streamed and its chunks are
+    added to the buffer as they arrive.
+    """
+    if stream is None:
+        flowise_response = await flowise_client.send_message(
+            content,
+            session_id=str(session_id),
+            history=history
+        )
+        logger.info(f"flowise_client.send_message returned: {flowise_response}")
+        if isinstance(flowise_response, dict) and "text" in flowise_response:
+            return flowise_response["text"]
+        return str(flowise_response)
+
+    parts = []
+    try:
+        async for chunk in flowise_client.stream_message(
+            content,
+            session_id=str(session_id),
+            history=history
+        ):
+            parts.append(chunk)
+            stream.add(chunk)
+    finally:
+        await stream.finish()
+    return ''.join(parts)
+
+
+async def answer_turn(turn, session_id, user_id, exclude=(), stream=None, origin=None):
+    """
+    Generate and store the answer to a turn; returns the saved reply.
+
+    This is the chat pipeline shared by the WebSocket consumer and the HTTP
+    fallback: the prompt gets the session's recent history without the
+    turn's own messages and the sequences in `exclude` (messages queued
+    behind it), and a Flowise failure is answered with an apology rather
+    than raised.
+    """
+    history = await database_sync_to_async(get_prompt_history)(
+        session_id, settings.FLOWISE_HISTORY_TURNS, exclude=[*turn.sequences, *exclude]
+    )
+    try:
+        content = await generate_answer(turn.content, session_id, history, stream=stream)
+    except Exception as e:
+        logger.error(f"Error calling Flowise: {str(e)}")
+        content = ERROR_ANSWER
+    reply = await database_sync_to_async(save_message)(session_id, user_id, content, False, origin)
+    logger.info(f"Saved Flowise response: {content}")
+    return reply
@@ -1,5 +1,5 @@
 from django.urls import path, include
-from rest_framework.routers import DefaultRouter
+from adrf.routers import DefaultRouter
 from . import views
 from .oauth2.views import OAuth2AuthorizationView, oauth_token_view, OAuth2UserInfoView, OAuth2CallbackView
 
@@ -29,10 +29,14 @@ urlpatterns = [
     # XBlock specific endpoints
     path('xblock/websocket-token/', views.xblock_websocket_token, name='xblock_websocket_token'),
     path('xblock/send-message/', views.xblock_send_message, name='xblock_send_message'),
+
+    # Chat over Server-Sent Events, for clients that can't use WebSockets
+    path('chat/stream/', views.chat_stream, name='chat_stream'),
     
     # API endpoints
     path('', include(router.urls)),
     
     # Health check
     path('health/', views.health_check, name='health_check'),
+    path('admin/presence/', views.presence_stats, name='presence_stats'),
 ] 
\ No newline at end of file
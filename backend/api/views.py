@@ -1,20 +1,49 @@
+import asyncio
+import logging
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import aprefetch_related_objects
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.views.decorators.csrf import csrf_exempt
-from rest_framework.decorators import api_view, permission_classes, action
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from adrf import viewsets
+from adrf.decorators import api_view
+from rest_framework.decorators import permission_classes, action
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.response import Response
-from rest_framework import status, viewsets
-from .models import ChatSession, Message
-from .serializers import ChatSessionSerializer, MessageSerializer
+from rest_framework.request import Request
+from rest_framework.exceptions import APIException
+from rest_framework.settings import api_settings
+from rest_framework import status
+from .models import ChatSession, Message, ArchivedSession
+from .serializers import ChatSessionSerializer, MessageSerializer, MessageSearchResultSerializer
+from .history_cache import get_recent_messages
+from .search import search_messages
+from .archive import get_session_messages
+from .presence import get_presence_registry
+from .chat_sessions import ensure_active_session, resolve_session
+from .conditional import Validators
+from .connections import connection_registry
+from .events import message_frame
+from .outbound import StreamBuffer
+from .ratelimit import check_rate_limit
+from .tickets import issue_ticket
+from .turns import Turn, answer_turn, save_message
+from .wire import json_codec
 from django.contrib.auth.decorators import login_required
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-import json
 from django.contrib.auth.models import User
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import logout
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+logger = logging.getLogger(__name__)
+
+# Answers of HTTP chat requests still being generated; referenced here so
+# they run to completion even when the client has gone away
+_answers = set()
+
 def index(request):
     """Render the React frontend template."""
     return render(request, 'react/index.html')
@@ -34,29 +63,48 @@ def health_check(request):
     """Health check endpoint."""
     return Response({'status': 'healthy'}, status=status.HTTP_200_OK)
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def presence_stats(request):
+    """
+    Report the number of live WebSocket connections per worker (staff only),
+    plus the keepalive counters of the worker serving the request.
+    """
+    workers = get_presence_registry().worker_counts()
+    return Response({
+        'total': sum(workers.values()),
+        'workers': workers,
+        'this_worker': {'id': settings.WORKER_ID, **connection_registry.stats()},
+    })
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
-def xblock_websocket_token(request):
+async def xblock_websocket_token(request):
     """
-    Generate a WebSocket token for XBlock integration.
-    This token will be used to authenticate the WebSocket connection.
+    Issue a WebSocket ticket for XBlock integration.
+    The ticket is signed and short-lived: the XBlock connects with
+    `?token=<ticket>&auth_type=ticket` right after fetching it. It is bound
+    to the conversation picked by `session_id` or `scope` (typically the
+    XBlock's usage id) and names its session if there is one yet; otherwise
+    the session is created with the first message. The XBlock calls this on
+    every page view, so it writes nothing and finds the session through the
+    cached session index.
     """
     try:
-        # Create a new chat session for the user
-        chat_session = ChatSession.objects.create(user=request.user)
-        
-        # Generate a token that includes the chat session ID
-        token_data = {
-            'user_id': request.user.id,
-            'chat_session_id': chat_session.id,
-            'is_xblock': True
-        }
-        
-        # In a real implementation, you would sign this token
-        # For now, we'll just return it as is
+        scope = str(request.data.get('scope') or '')[:255]
+        try:
+            session_id = await sync_to_async(resolve_session)(
+                request.user.id, request.data.get('session_id'), scope
+            )
+        except ChatSession.DoesNotExist:
+            return Response({'error': 'Chat session not found'}, status=status.HTTP_404_NOT_FOUND)
+        scheme = 'wss' if request.is_secure() else 'ws'
         return Response({
-            'token': json.dumps(token_data),
-            'ws_url': f"ws://{request.get_host()}/ws/chat/"
+            'token': issue_ticket(request.user.id, session_id, scope),
+            'auth_type': 'ticket',
+            'expires_in': settings.WEBSOCKET_TICKET_MAX_AGE,
+            'chat_session_id': session_id,
+            'ws_url': f"{scheme}://{request.get_host()}/ws/chat/"
         })
     except Exception as e:
         return Response(
@@ -66,7 +114,7 @@ def xblock_websocket_token(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
-def xblock_send_message(request):
+async def xblock_send_message(request):
     """
     Send a message from the XBlock to the WebSocket.
     This is a fallback method in case the WebSocket connection fails.
@@ -81,33 +129,19 @@ def xblock_send_message(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
             
-        chat_session = ChatSession.objects.get(
+        chat_session = await ChatSession.objects.aget(
             id=chat_session_id,
             user=request.user
         )
         
-        # Create the message
-        message = Message.objects.create(
+        # Create the message; the event bus delivers it to the user's sockets
+        message = await Message.objects.acreate(
             session=chat_session,
             content=message_content,
             is_from_user=True
         )
         
-        # Send the message through the channel layer
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"user_{request.user.id}",
-            {
-                'type': 'chat_message',
-                'message': {
-                    'content': message_content,
-                    'is_from_user': True,
-                    'created_at': message.created_at.isoformat()
-                }
-            }
-        )
-        
-        return Response({'status': 'success'})
+        return Response({'status': 'success', 'sequence': message.sequence})
     except ChatSession.DoesNotExist:
         return Response(
             {'error': 'Chat session not found'},
@@ -119,8 +153,104 @@ def xblock_send_message(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+def authenticate_request(request):
+    """Authenticate a plain Django request with the REST framework authentication classes."""
+    return Request(
+        request,
+        parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+        authenticators=[authenticator() for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    ).user
+
+def sse_event(frame):
+    return f"event: {frame['type']}\ndata: {json_codec.encode(frame)}\n\n"
+
+async def answer_events(turn, session_id, user_id):
+    """Generate the answer to a turn and yield it as Server-Sent Events."""
+    frames = asyncio.Queue()
+    stream = None
+    if settings.CHAT_STREAM_ANSWERS:
+        async def send_chunk(text):
+            await frames.put({'type': 'stream', 'id': turn.ids[-1], 'content': text})
+        stream = StreamBuffer.from_settings(send_chunk)
+
+    async def answer():
+        try:
+            reply = await answer_turn(turn, session_id, user_id, stream=stream)
+            await frames.put(message_frame(reply))
+        except Exception as e:
+            logger.error(f"Error answering HTTP chat message: {str(e)}", exc_info=True)
+            await frames.put({'type': 'error', 'code': 4001, 'message': f"Message processing error: {str(e)}"})
+        finally:
+            await frames.put(None)
+
+    task = asyncio.ensure_future(answer())
+    _answers.add(task)
+    task.add_done_callback(_answers.discard)
+
+    yield sse_event({'type': 'ack', 'id': turn.ids[0], 'sequence': turn.sequences[0]})
+    while (frame := await frames.get()) is not None:
+        yield sse_event(frame)
+
+@csrf_exempt
+async def chat_stream(request):
+    """
+    Chat over plain HTTP, for networks that break WebSockets.
+    POST `{"content": ..., "id": ...}` to get the answer as a Server-Sent
+    Events stream of the frames the chat socket sends: an `ack` with the
+    message's sequence, `stream` chunks while the answer is generated (when
+    streaming is on), then the answer `message`. Messages go through the
+    socket's pipeline and rate limit, and the answer is saved even if the
+    client disconnects before it is complete. Like on the socket, `session_id`
+    or `scope` pick the conversation; the general chat is used without either.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    try:
+        user = await sync_to_async(authenticate_request)(request)
+    except APIException as e:
+        return JsonResponse({'error': str(e.detail)}, status=e.status_code)
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    if not await sync_to_async(check_rate_limit)(request.META.get('REMOTE_ADDR', '0.0.0.0')):
+        return JsonResponse(
+            {'error': 'Rate limit exceeded. Please try again later.'},
+            status=status.HTTP_429_TOO_MANY_REQUESTS
+        )
+
+    try:
+        data = json_codec.decode(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON format'}, status=status.HTTP_400_BAD_REQUEST)
+    content = data.get('content') if isinstance(data, dict) else None
+    if not isinstance(content, str) or not content:
+        return JsonResponse({'error': 'Missing required fields'}, status=status.HTTP_400_BAD_REQUEST)
+    message_id = data.get('id') or str(uuid.uuid4())
+
+    scope = str(data.get('scope') or '')[:255]
+    try:
+        session_id = await sync_to_async(resolve_session)(user.id, data.get('session_id'), scope)
+    except ChatSession.DoesNotExist:
+        return JsonResponse({'error': 'Chat session not found'}, status=status.HTTP_404_NOT_FOUND)
+    if session_id is None:
+        session_id = await sync_to_async(ensure_active_session)(user.id, scope)
+    user_message = await sync_to_async(save_message)(session_id, user.id, content, True)
+    response = StreamingHttpResponse(
+        answer_events(Turn(message_id, content, user_message.sequence), session_id, user.id),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 class ChatSessionViewSet(viewsets.ModelViewSet):
-    """ViewSet for managing chat sessions."""
+    """
+    ViewSet for managing chat sessions.
+    The actions are coroutines running on the server's event loop, like the
+    WebSocket consumers: database work goes through the async ORM, and only
+    the sync helpers (search, history cache, archive) hop to a thread.
+    """
     serializer_class = ChatSessionSerializer
     permission_classes = [IsAuthenticated]
 
@@ -128,32 +258,143 @@ class ChatSessionViewSet(viewsets.ModelViewSet):
         """Return chat sessions for the authenticated user."""
         return ChatSession.objects.filter(user=self.request.user)
 
-    def perform_create(self, serializer):
+    # The nested messages, archived ones included, are loaded up front so
+    # serializing doesn't query lazily; archives are decompressed in a thread
+    async def alist(self, request, *args, **kwargs):
+        validators = await Validators.for_sessions(self.get_queryset(), request.user.id)
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        sessions = [
+            session async for session in
+            self.get_queryset().select_related('archive').prefetch_related('messages')
+        ]
+        data = await sync_to_async(lambda: self.get_serializer(sessions, many=True).data)()
+        return validators.apply(Response(data))
+
+    async def aretrieve(self, request, *args, **kwargs):
+        validators = await Validators.for_session(self.get_queryset(), kwargs['pk'])
+        if validators is not None:
+            not_modified = validators.not_modified(request)
+            if not_modified is not None:
+                return not_modified
+        session = await self.aget_object()
+        await aprefetch_related_objects([session], 'messages')
+        data = await sync_to_async(lambda: self.get_serializer(session).data)()
+        return validators.apply(Response(data))
+
+    async def perform_acreate(self, serializer):
         """Create a new chat session for the authenticated user."""
-        serializer.save(user=self.request.user)
+        await sync_to_async(serializer.save)(user=self.request.user)
+
+    async def perform_aupdate(self, serializer):
+        await sync_to_async(serializer.save)()
 
     @action(detail=True, methods=['post'])
-    def send_message(self, request, pk=None):
+    async def send_message(self, request, pk=None):
         """Send a message in a chat session."""
-        session = self.get_object()
+        session = await self.aget_object()
         serializer = MessageSerializer(data=request.data)
         
         if serializer.is_valid():
-            serializer.save(session=session)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            message = await Message.objects.acreate(session=session, **serializer.validated_data)
+            return Response(MessageSerializer(message).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['get'])
+    async def search(self, request):
+        """
+        Full-text search over chat messages, best matches first.
+        Regular users search their own conversations; staff can search all
+        conversations or narrow to one learner with `user=<id>`.
+        Paginated with `page` and `page_size` (max 100).
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {'error': 'Missing search query'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+            page_size = min(max(int(request.query_params.get('page_size', 20)), 1), 100)
+            user_id = int(request.query_params['user']) if 'user' in request.query_params else None
+        except ValueError:
+            return Response(
+                {'error': 'page, page_size and user must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not request.user.is_staff:
+            user_id = request.user.id
+
+        # Fetch one extra row to know whether another page exists without counting
+        messages = await sync_to_async(search_messages)(
+            query, user_id=user_id, limit=page_size + 1, offset=(page - 1) * page_size
+        )
+        serializer = MessageSearchResultSerializer(messages[:page_size], many=True)
+        return Response({
+            'page': page,
+            'has_next': len(messages) > page_size,
+            'results': serializer.data
+        })
+
     @action(detail=True, methods=['get'])
-    def messages(self, request, pk=None):
-        """Get all messages in a chat session."""
-        session = self.get_object()
+    async def messages(self, request, pk=None):
+        """
+        Get messages in a chat session.
+        Without parameters all messages are returned. With `limit` only the most
+        recent messages are returned (served from the hot history buffer), and
+        `before=<sequence>` pages backwards through older messages.
+        Archived sessions are read back from cold storage transparently.
+        Responses carry an ETag and Last-Modified; a conditional request for
+        a session without new messages gets a 304 without reading any.
+        """
+        validators = await Validators.for_session(self.get_queryset(), pk)
+        if validators is not None:
+            not_modified = validators.not_modified(request)
+            if not_modified is not None:
+                return not_modified
+        session = await self.aget_object()
+        try:
+            limit = int(request.query_params['limit']) if 'limit' in request.query_params else None
+            before = int(request.query_params['before']) if 'before' in request.query_params else None
+        except ValueError:
+            return Response(
+                {'error': 'limit and before must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if limit is not None and limit <= 0:
+            return Response(
+                {'error': 'limit must be positive'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # The hot history buffer also holds the tail of archived sessions, so
+        # their archive isn't decompressed for every recent-messages request
+        if limit and before is None:
+            return validators.apply(Response(await sync_to_async(get_recent_messages)(session.id, limit)))
+
+        if await ArchivedSession.objects.filter(session=session).aexists():
+            messages = await sync_to_async(get_session_messages)(session)
+            if before is not None:
+                messages = [message for message in messages if message['sequence'] < before]
+            if limit:
+                messages = messages[-limit:]
+            return validators.apply(Response(messages))
+
         messages = Message.objects.filter(session=session)
+        if before is not None:
+            messages = messages.filter(sequence__lt=before)
+        if limit:
+            messages = [message async for message in messages.order_by('-sequence')[:limit]][::-1]
+        else:
+            messages = [message async for message in messages]
         serializer = MessageSerializer(messages, many=True)
-        return Response(serializer.data)
+        return validators.apply(Response(serializer.data))
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
-def register(request):
+async def register(request):
     try:
         username = request.data.get('username')
         email = request.data.get('email')
@@ -165,26 +406,28 @@ def register(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        if User.objects.filter(username=username).exists():
+        if await User.objects.filter(username=username).aexists():
             return Response(
                 {'error': 'Username already exists'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        if User.objects.filter(email=email).exists():
+        if await User.objects.filter(email=email).aexists():
             return Response(
                 {'error': 'Email already exists'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        user = User.objects.create_user(
+        # Password hashing is slow on purpose; keep it off the event loop
+        user = await sync_to_async(User.objects.create_user)(
             username=username,
             email=email,
             password=password
         )
         # Create a new chat session for the user
-        chat_session = ChatSession.objects.create(user=user)
-        refresh = RefreshToken.for_user(user)
+        chat_session = await ChatSession.objects.acreate(user=user)
+        # Records the outstanding token for the blacklist app
+        refresh = await sync_to_async(RefreshToken.for_user)(user)
         
         return Response({
             'user': {
@@ -224,7 +467,7 @@ class CustomTokenRefreshView(TokenRefreshView):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def current_user(request):
+async def current_user(request):
     """
     Return the current authenticated user's info.
     """
@@ -0,0 +1,111 @@
+from datetime import datetime
+
+import msgpack
+import orjson
+
+# Field names shortened on the compact protocol, and their reverse mapping
+COMPACT_KEYS = {
+    'type': 't',
+    'id': 'i',
+    'ids': 'is',
+    'session_id': 's',
+    'sequence': 'q',
+    'last_sequence': 'l',
+    'content': 'c',
+    'isUser': 'u',
+    'timestamp': 'ts',
+    'messages': 'm',
+    'truncated': 'tr',
+    'message': 'msg',
+    'code': 'e',
+    'username': 'n',
+    'token': 'k',
+    'auth_type': 'a',
+    'expires_at': 'x',
+    'token_expires_at': 'tx',
+    'delay_ms': 'd',
+    'reconnect': 'r',
+    'min_delay_ms': 'mn',
+    'max_delay_ms': 'mx',
+    'load': 'ld',
+}
+EXPANDED_KEYS = {short: key for key, short in COMPACT_KEYS.items()}
+
+
+class FrameDecodeError(ValueError):
+    """Raised when an incoming frame can't be decoded by the connection's codec."""
+
+
+class JSONCodec:
+    """The default protocol: JSON text frames, encoded with orjson."""
+    name = 'JSON'
+    subprotocol = None
+    binary = False
+
+    def encode(self, frame):
+        return orjson.dumps(frame).decode()
+
+    def decode(self, text_data=None, bytes_data=None):
+        try:
+            return orjson.loads(text_data if text_data is not None else bytes_data)
+        except orjson.JSONDecodeError as e:
+            raise FrameDecodeError(str(e)) from e
+
+
+class MsgpackCodec:
+    """
+    The `ibal.msgpack.v1` protocol: binary msgpack frames with the short field
+    names of COMPACT_KEYS and timestamps as integer epoch milliseconds.
+    Frames are otherwise identical to the JSON protocol.
+    """
+    name = 'msgpack'
+    subprotocol = 'ibal.msgpack.v1'
+    binary = True
+
+    def encode(self, frame):
+        return msgpack.packb(compact(frame))
+
+    def decode(self, text_data=None, bytes_data=None):
+        if bytes_data is None:
+            raise FrameDecodeError('Expected a binary frame')
+        try:
+            return expand(msgpack.unpackb(bytes_data))
+        except ValueError as e:
+            raise FrameDecodeError(str(e)) from e
+
+
+def compact(value):
+    if isinstance(value, dict):
+        return {
+            COMPACT_KEYS.get(key, key): epoch_ms(item) if key == 'timestamp' else compact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [compact(item) for item in value]
+    return value
+
+
+def expand(value):
+    if isinstance(value, dict):
+        return {EXPANDED_KEYS.get(key, key): expand(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [expand(item) for item in value]
+    return value
+
+
+def epoch_ms(timestamp):
+    if isinstance(timestamp, str):
+        return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+    return timestamp
+
+
+json_codec = JSONCodec()
+CODECS = {codec.subprotocol: codec for codec in (MsgpackCodec(),)}
+
+
+def negotiate(subprotocols):
+    """Pick the codec for the first supported subprotocol the client asked for."""
+    for subprotocol in subprotocols:
+        if subprotocol in CODECS:
+            return CODECS[subprotocol]
+    return json_codec
@@ -0,0 +1,144 @@
+"""
+Channel layer group_send benchmark.
+
+Subscribes one receiver per group (like the per-user groups the chat uses),
+then fires group_send at random groups and reports send throughput,
+end-to-end delivery throughput and delivery latency percentiles for each
+layer configuration: the core Redis layer and the pub/sub layer, on a single
+host and sharded across every host given, at 1k and 10k groups.
+
+Run from the backend directory against disposable Redis instances:
+
+    python benchmarks/channel_layer_benchmark.py --hosts redis://localhost:6379
+    python benchmarks/channel_layer_benchmark.py \\
+        --hosts redis://redis-a:6379,redis://redis-b:6379 --groups 1000 10000 --messages 20000
+    python benchmarks/channel_layer_benchmark.py --in-memory --groups 1000   # no Redis, smoke test only
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+
+from django.utils.module_loading import import_string
+
+PREFIX = 'layer_bench'
+
+
+def configurations(args):
+    """Yield (label, backend, config) for every layer configuration to measure."""
+    hosts = [host.strip() for host in args.hosts.split(',') if host.strip()]
+    core_options = {
+        'prefix': PREFIX,
+        'capacity': args.capacity,
+        'expiry': args.expiry,
+        'group_expiry': args.group_expiry,
+    }
+    if args.in_memory:
+        yield 'in-memory', 'channels.layers.InMemoryChannelLayer', {
+            'capacity': args.capacity, 'expiry': args.expiry, 'group_expiry': args.group_expiry,
+        }
+        return
+    host_sets = [('1 host', hosts[:1])]
+    if len(hosts) > 1:
+        host_sets.append((f'{len(hosts)} shards', hosts))
+    for host_label, host_list in host_sets:
+        yield f'core, {host_label}', 'channels_redis.core.RedisChannelLayer', {
+            'hosts': host_list, **core_options,
+        }
+        yield f'pubsub, {host_label}', 'channels_redis.pubsub.RedisPubSubChannelLayer', {
+            'hosts': host_list, 'prefix': PREFIX,
+        }
+
+
+async def gather_in_chunks(coroutines, chunk_size=500):
+    results = []
+    for start in range(0, len(coroutines), chunk_size):
+        results.extend(await asyncio.gather(*coroutines[start:start + chunk_size]))
+    return results
+
+
+async def run(label, backend, config, groups, messages, concurrency, timeout):
+    layer = import_string(backend)(**config)
+    group_names = [f'{PREFIX}_{i}' for i in range(groups)]
+
+    setup_started = time.perf_counter()
+    channels = await gather_in_chunks([layer.new_channel() for _ in group_names])
+    await gather_in_chunks([layer.group_add(group, channel) for group, channel in zip(group_names, channels)])
+    setup = time.perf_counter() - setup_started
+
+    latencies = []
+    all_received = asyncio.Event()
+
+    async def receiver(channel):
+        while True:
+            message = await layer.receive(channel)
+            latencies.append((time.perf_counter() - message['sent']) * 1000)
+            if len(latencies) >= messages:
+                all_received.set()
+
+    receivers = [asyncio.ensure_future(receiver(channel)) for channel in channels]
+    # Let the receivers subscribe before anything is published
+    await asyncio.sleep(0.5)
+
+    async def send(group):
+        await layer.group_send(group, {'type': 'bench.message', 'sent': time.perf_counter()})
+
+    started = time.perf_counter()
+    for start in range(0, messages, concurrency):
+        await asyncio.gather(*(
+            send(random.choice(group_names)) for _ in range(min(concurrency, messages - start))
+        ))
+    sent = time.perf_counter() - started
+    try:
+        await asyncio.wait_for(all_received.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    delivered = time.perf_counter() - started
+
+    for task in receivers:
+        task.cancel()
+    await asyncio.gather(*receivers, return_exceptions=True)
+    await gather_in_chunks([layer.group_discard(group, channel) for group, channel in zip(group_names, channels)])
+    if hasattr(layer, 'flush'):
+        await layer.flush()
+
+    if not latencies:
+        print(f'{label:<22} {groups:>6,} groups  nothing delivered within {timeout}s')
+        return
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(
+        f'{label:<22} {groups:>6,} groups  setup={setup:6.2f}s  '
+        f'send={messages / sent:9,.0f}/s  delivered={len(latencies) / delivered:9,.0f}/s '
+        f'({len(latencies) / messages:6.1%})  '
+        f'p50={statistics.median(latencies):7.2f}ms  p95={p95:7.2f}ms  p99={p99:7.2f}ms'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hosts', default='redis://localhost:6379', help='comma-separated Redis URLs')
+    parser.add_argument('--in-memory', action='store_true', help='benchmark the in-memory layer instead')
+    parser.add_argument('--groups', type=int, nargs='+', default=[1_000, 10_000])
+    parser.add_argument('--messages', type=int, default=10_000)
+    parser.add_argument('--concurrency', type=int, default=100, help='group_send calls in flight')
+    parser.add_argument('--capacity', type=int, default=100)
+    parser.add_argument('--expiry', type=int, default=60)
+    parser.add_argument('--group-expiry', type=int, default=86400)
+    parser.add_argument('--timeout', type=float, default=30, help='seconds to wait for deliveries')
+    args = parser.parse_args()
+
+    print(f'{args.messages:,} group_send calls per run, {args.concurrency} in flight')
+    for label, backend, config in configurations(args):
+        for groups in args.groups:
+            try:
+                asyncio.run(run(label, backend, config, groups, args.messages, args.concurrency, args.timeout))
+            except (OSError, ConnectionError) as e:
+                print(f'{label:<22} {groups:>6,} groups  failed: {e}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
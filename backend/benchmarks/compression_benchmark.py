@@ -0,0 +1,86 @@
+"""
+API response compression benchmark.
+
+Builds chat history responses shaped like the messages endpoint returns them,
+at several sizes, and reports for gzip and brotli at a few levels the bytes
+saved and the CPU time each response costs to compress. Use it to pick
+API_COMPRESSION_MIN_BYTES and the levels in settings: below the threshold the
+bytes saved aren't worth the time, and past a certain level the ratio barely
+improves while the time keeps growing.
+
+    python benchmarks/compression_benchmark.py
+    python benchmarks/compression_benchmark.py --messages 5 20 100 500 --repeat 200
+"""
+import argparse
+import gzip
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+WORDS = (
+    'the a learner course module question answer explain example function variable python loop '
+    'because however which should could would data model lesson quiz result error value list '
+    'dictionary string number step first then finally understand practice exercise chapter'
+).split()
+
+
+def history(messages, seed=0):
+    """JSON body of a history response with `messages` messages, as DRF renders it."""
+    rng = random.Random(seed)
+    start = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    body = [
+        {
+            'id': 1000 + i,
+            'content': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 120))).capitalize() + '.',
+            'is_from_user': i % 2 == 0,
+            'created_at': (start + timedelta(seconds=37 * i)).isoformat().replace('+00:00', 'Z'),
+            'sequence': i + 1,
+        }
+        for i in range(messages)
+    ]
+    return json.dumps(body, separators=(',', ':')).encode()
+
+
+def codecs():
+    yield 'gzip 1', lambda body: gzip.compress(body, compresslevel=1, mtime=0)
+    yield 'gzip 6', lambda body: gzip.compress(body, compresslevel=6, mtime=0)
+    yield 'gzip 9', lambda body: gzip.compress(body, compresslevel=9, mtime=0)
+    if brotli is None:
+        print('brotli is not installed, skipping it')
+        return
+    for quality in (1, 4, 6, 11):
+        yield f'br {quality}', lambda body, q=quality: brotli.compress(body, mode=brotli.MODE_TEXT, quality=q)
+
+
+def measure(compress, body, repeat):
+    compressed = compress(body)
+    started = time.process_time()
+    for _ in range(repeat):
+        compress(body)
+    return len(compressed), (time.process_time() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, nargs='+', default=[1, 5, 20, 100, 500])
+    parser.add_argument('--repeat', type=int, default=100, help='compressions timed per body')
+    args = parser.parse_args()
+
+    print(f'{"messages":>8} {"raw":>9} {"codec":>7} {"compressed":>10} {"saved":>6} {"CPU/resp":>10} {"MB/s":>7}')
+    for count in args.messages:
+        body = history(count)
+        for name, compress in codecs():
+            size, seconds = measure(compress, body, args.repeat)
+            print(f'{count:>8} {len(body):>9,} {name:>7} {size:>10,} {1 - size / len(body):>6.0%} '
+                  f'{seconds * 1e6:>8.0f}us {len(body) / seconds / 1e6:>7.1f}')
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Idle WebSocket connection memory benchmark.
+
+Opens many idle chat connections (50k by default) against one running worker,
+answers its keepalive pings like a learner with the XBlock open, and reports
+the worker's resident memory per connection. Exits with status 1 when the
+cost per connection is above --target-kb, so it can be tracked as a regression
+target.
+
+Start a single worker with the per-IP and per-user connection limits lifted,
+then point the benchmark at it:
+
+    WEBSOCKET_CONNECTIONS_PER_MINUTE=0 MAX_CONNECTIONS_PER_USER=0 \\
+        daphne -b 127.0.0.1 -p 8001 llm_websocket_api.asgi:application &
+    python benchmarks/idle_connections_benchmark.py --url ws://127.0.0.1:8001/ws/chat/ --pid $!
+
+The benchmark creates its users and signs their tokens with the same settings
+and database as the worker. Both processes need a file descriptor limit above
+the connection count (ulimit -n).
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'llm_websocket_api.settings')
+
+import django
+
+django.setup()
+
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.tokens import AccessToken
+from websockets.asyncio.client import connect
+
+User = get_user_model()
+
+USER_PREFIX = 'idle_bench_'
+
+
+def rss_kb(pid):
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    raise RuntimeError(f'No VmRSS for process {pid}')
+
+
+def create_tokens(users):
+    """Create the benchmark users and return one access token per user."""
+    existing = User.objects.filter(username__startswith=USER_PREFIX)
+    missing = users - existing.count()
+    if missing > 0:
+        start = existing.count()
+        User.objects.bulk_create(
+            [User(username=f'{USER_PREFIX}{i}') for i in range(start, start + missing)],
+            batch_size=5000
+        )
+    bench_users = User.objects.filter(username__startswith=USER_PREFIX).order_by('id')[:users]
+    return [str(AccessToken.for_user(user)) for user in bench_users]
+
+
+async def keep_alive(websocket):
+    """Answer the worker's pings until the connection closes."""
+    try:
+        async for frame in websocket:
+            if json.loads(frame).get('type') == 'ping':
+                await websocket.send('{"type": "pong"}')
+    except Exception:
+        pass
+
+
+async def open_connection(url, token, connections, tasks):
+    try:
+        websocket = await connect(f'{url}?token={token}&auth_type=jwt', ping_interval=None, open_timeout=60)
+        frame = json.loads(await websocket.recv())
+    except Exception:
+        return False
+    if frame.get('type') != 'user_info':
+        await websocket.close()
+        return False
+    connections.append(websocket)
+    tasks.append(asyncio.ensure_future(keep_alive(websocket)))
+    return True
+
+
+async def open_connections(url, tokens, count, concurrency, connections, tasks):
+    failed = 0
+    opened_before = len(connections)
+    started = time.perf_counter()
+    for start in range(0, count, concurrency):
+        results = await asyncio.gather(*(
+            open_connection(url, tokens[i % len(tokens)], connections, tasks)
+            for i in range(start, min(start + concurrency, count))
+        ))
+        failed += results.count(False)
+        print(f'\r  open {len(connections) - opened_before:,}/{count:,} (failed {failed:,}) '
+              f'in {time.perf_counter() - started:.0f}s', end='', flush=True)
+    print()
+    return failed
+
+
+async def run(args, tokens):
+    connections, tasks = [], []
+
+    await open_connections(args.url, tokens, args.warmup, args.concurrency, connections, tasks)
+    await asyncio.sleep(args.settle)
+    baseline = rss_kb(args.pid)
+    warm = len(connections)
+    print(f'Baseline after {warm:,} warm-up connections: {baseline / 1024:,.1f} MiB')
+
+    failed = await open_connections(
+        args.url, tokens, args.connections - args.warmup, args.concurrency, connections, tasks
+    )
+    await asyncio.sleep(args.settle)
+    after = rss_kb(args.pid)
+    opened = len(connections) - warm
+
+    for task in tasks:
+        task.cancel()
+    for start in range(0, len(connections), args.concurrency):
+        await asyncio.gather(*(ws.close() for ws in connections[start:start + args.concurrency]),
+                             return_exceptions=True)
+
+    if not opened:
+        print('No connections could be opened')
+        return False
+    per_connection = (after - baseline) / opened
+    print(f'{opened:,} idle connections ({failed:,} failed): '
+          f'{after / 1024:,.1f} MiB RSS, {per_connection:.1f} KiB per connection '
+          f'(target {args.target_kb:.1f} KiB)')
+    return per_connection <= args.target_kb
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='ws://127.0.0.1:8001/ws/chat/')
+    parser.add_argument('--pid', type=int, required=True, help='process id of the worker under test')
+    parser.add_argument('--connections', type=int, default=50_000)
+    parser.add_argument('--connections-per-user', type=int, default=1)
+    parser.add_argument('--warmup', type=int, default=500, help='connections opened before the baseline')
+    parser.add_argument('--concurrency', type=int, default=200, help='handshakes in flight')
+    parser.add_argument('--settle', type=float, default=5, help='seconds to wait before reading RSS')
+    parser.add_argument('--target-kb', type=float, default=64, help='maximum RSS per connection')
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = args.connections + 1024
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+
+    tokens = create_tokens(-(-args.connections // args.connections_per_user))
+    passed = asyncio.run(run(args, tokens))
+    print('PASS' if passed else 'FAIL')
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
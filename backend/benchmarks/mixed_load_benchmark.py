@@ -0,0 +1,158 @@
+"""
+Mixed REST and WebSocket load benchmark.
+
+Keeps a set of chat connections busy with round trips (pings, and resumes
+that read the message history) and measures their latency, first on their
+own and then while concurrent HTTP clients hammer the chat REST API (session
+history, session list and the current user). Reports WebSocket latency
+percentiles for both phases and REST throughput and latency, so a regression
+where REST traffic starves the socket path (or the other way round) shows up
+as a widening gap between the two phases.
+
+Start a worker with the per-IP connection limit lifted, then point the
+benchmark at it:
+
+    WEBSOCKET_CONNECTIONS_PER_MINUTE=0 \\
+        python -m llm_websocket_api.server -b 127.0.0.1 -p 8001 llm_websocket_api.asgi:application &
+    python benchmarks/mixed_load_benchmark.py --host 127.0.0.1:8001
+    python benchmarks/mixed_load_benchmark.py --host 127.0.0.1:8001 --sockets 200 --http-clients 100 --duration 30
+
+The benchmark creates its users, sessions and messages with the same settings
+and database as the worker.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'llm_websocket_api.settings')
+
+import django
+
+django.setup()
+
+import aiohttp
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.tokens import AccessToken
+from websockets.asyncio.client import connect
+
+from api.models import ChatSession, Message
+
+User = get_user_model()
+
+USER_PREFIX = 'mixed_bench_'
+
+
+def create_fixtures(users, messages):
+    """Create the benchmark users with one session of history each; return (token, session id) pairs."""
+    fixtures = []
+    for i in range(users):
+        user, _ = User.objects.get_or_create(username=f'{USER_PREFIX}{i}')
+        session = ChatSession.objects.filter(user=user).first() or ChatSession.objects.create(user=user)
+        for n in range(Message.objects.filter(session=session).count(), messages):
+            Message.objects.create(session=session, content=f'Benchmark message {n}', is_from_user=n % 2 == 0)
+        fixtures.append((str(AccessToken.for_user(user)), session.id))
+    return fixtures
+
+
+def percentiles(samples):
+    if not samples:
+        return 'no samples'
+    samples = sorted(samples)
+    pick = lambda q: samples[min(int(len(samples) * q), len(samples) - 1)] * 1000
+    return (f'p50 {pick(0.5):.1f} ms, p95 {pick(0.95):.1f} ms, p99 {pick(0.99):.1f} ms, '
+            f'mean {statistics.fmean(samples) * 1000:.1f} ms')
+
+
+async def socket_client(url, token, stop, latencies):
+    """Alternate pings and resumes, timing the reply to each."""
+    async with connect(f'{url}?token={token}&auth_type=jwt', ping_interval=None, open_timeout=60) as websocket:
+        await websocket.recv()  # user_info
+        requests = [({'type': 'ping'}, 'pong'), ({'type': 'resume', 'last_sequence': 0}, 'history')]
+        turn = 0
+        while not stop.is_set():
+            frame, expected = requests[turn % 2]
+            turn += 1
+            started = time.perf_counter()
+            await websocket.send(json.dumps(frame))
+            while json.loads(await websocket.recv()).get('type') != expected:
+                pass
+            latencies.append(time.perf_counter() - started)
+
+
+async def http_client(http, base_url, token, session_id, stop, latencies, errors):
+    """Cycle through the read endpoints of the chat REST API."""
+    headers = {'Authorization': f'Bearer {token}'}
+    paths = [f'/api/chat-sessions/{session_id}/messages/?limit=20', '/api/chat-sessions/', '/api/auth/user/']
+    turn = 0
+    while not stop.is_set():
+        path = paths[turn % len(paths)]
+        turn += 1
+        started = time.perf_counter()
+        try:
+            async with http.get(base_url + path, headers=headers) as response:
+                await response.read()
+                if response.status != 200:
+                    errors.append(response.status)
+                    continue
+        except aiohttp.ClientError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def phase(args, fixtures, with_http):
+    stop = asyncio.Event()
+    socket_latencies, http_latencies, http_errors = [], [], []
+    tasks = [
+        asyncio.ensure_future(socket_client(f'ws://{args.host}/ws/chat/', token, stop, socket_latencies))
+        for token, _ in fixtures[:args.sockets]
+    ]
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=args.http_clients)) as http:
+        if with_http:
+            tasks += [
+                asyncio.ensure_future(http_client(
+                    http, f'http://{args.host}', *fixtures[i % len(fixtures)], stop, http_latencies, http_errors
+                ))
+                for i in range(args.http_clients)
+            ]
+        await asyncio.sleep(args.duration)
+        stop.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    failures = [result for result in results if isinstance(result, Exception)]
+    if failures:
+        print(f'  {len(failures)} clients failed, first error: {failures[0]!r}')
+    return socket_latencies, http_latencies, http_errors
+
+
+async def run(args, fixtures):
+    socket_latencies, _, _ = await phase(args, fixtures, with_http=False)
+    print(f'WebSocket only, {args.sockets} connections: {len(socket_latencies) / args.duration:,.0f} round trips/s')
+    print(f'  {percentiles(socket_latencies)}')
+
+    socket_latencies, http_latencies, http_errors = await phase(args, fixtures, with_http=True)
+    print(f'WebSocket with {args.http_clients} REST clients: {len(socket_latencies) / args.duration:,.0f} round trips/s')
+    print(f'  {percentiles(socket_latencies)}')
+    print(f'REST: {len(http_latencies) / args.duration:,.0f} requests/s ({len(http_errors)} errors)')
+    print(f'  {percentiles(http_latencies)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1:8001', help='host:port of the worker under test')
+    parser.add_argument('--sockets', type=int, default=100, help='busy WebSocket connections')
+    parser.add_argument('--http-clients', type=int, default=50, help='concurrent REST clients')
+    parser.add_argument('--messages', type=int, default=50, help='history messages per session')
+    parser.add_argument('--duration', type=float, default=15, help='seconds per phase')
+    args = parser.parse_args()
+
+    fixtures = create_fixtures(max(args.sockets, args.http_clients), args.messages)
+    asyncio.run(run(args, fixtures))
+
+
+if __name__ == '__main__':
+    main()
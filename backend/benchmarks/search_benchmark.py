@@ -0,0 +1,138 @@
+"""
+Full-text search benchmark for chat history.
+
+Fills the configured database with synthetic conversations (10M messages by
+default) and measures ranked search latency through api.search, per learner
+and across all learners, optionally against the old `icontains` scan.
+
+Run from the backend directory against a disposable database:
+
+    DATABASE_URL=postgres://... python benchmarks/search_benchmark.py
+    python benchmarks/search_benchmark.py --messages 100000 --baseline
+    python benchmarks/search_benchmark.py --reuse   # skip data generation
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'llm_websocket_api.settings')
+
+import django
+
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+
+from api.models import ChatSession, Message
+from api.search import search_messages
+
+User = get_user_model()
+
+USER_PREFIX = 'search_bench_'
+VOCABULARY = [f'word{i}' for i in range(5000)]
+# Zipf-like word frequencies so common and rare terms both get exercised
+WEIGHTS = [1.0 / (rank + 1) for rank in range(len(VOCABULARY))]
+
+
+def generate(total_messages, users, batch_size):
+    """Create benchmark users, one session each, and `total_messages` messages."""
+    existing = User.objects.filter(username__startswith=USER_PREFIX)
+    ChatSession.objects.filter(user__in=existing).delete()
+    existing.delete()
+
+    bench_users = User.objects.bulk_create(
+        [User(username=f'{USER_PREFIX}{i}') for i in range(users)]
+    )
+    sessions = ChatSession.objects.bulk_create(
+        [ChatSession(user=user) for user in bench_users]
+    )
+
+    start = time.perf_counter()
+    sequences = [0] * len(sessions)
+    created = 0
+    while created < total_messages:
+        batch = []
+        for _ in range(min(batch_size, total_messages - created)):
+            index = random.randrange(len(sessions))
+            sequences[index] += 1
+            words = random.choices(VOCABULARY, weights=WEIGHTS, k=random.randint(5, 40))
+            batch.append(Message(
+                session=sessions[index],
+                content=' '.join(words),
+                is_from_user=sequences[index] % 2 == 1,
+                sequence=sequences[index],
+            ))
+        with transaction.atomic():
+            Message.objects.bulk_create(batch)
+        created += len(batch)
+        elapsed = time.perf_counter() - start
+        print(f'\r  inserted {created:,}/{total_messages:,} ({created / elapsed:,.0f} msg/s)', end='', flush=True)
+    print()
+
+    for session, sequence in zip(sessions, sequences):
+        ChatSession.objects.filter(pk=session.pk).update(last_sequence=sequence)
+
+
+def measure(label, queries, run):
+    timings = []
+    for query, user_id in queries:
+        start = time.perf_counter()
+        run(query, user_id)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(f'{label:<40} p50={statistics.median(timings):8.2f}ms  p95={p95:8.2f}ms  p99={p99:8.2f}ms')
+
+
+def icontains_scan(query, user_id):
+    messages = Message.objects.filter(content__icontains=query)
+    if user_id is not None:
+        messages = messages.filter(session__user_id=user_id)
+    return list(messages.order_by('-id')[:20])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=10_000_000)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--reuse', action='store_true', help='reuse previously generated data')
+    parser.add_argument('--baseline', action='store_true', help='also measure the icontains scan')
+    args = parser.parse_args()
+
+    print(f'Database vendor: {connection.vendor}')
+    if not args.reuse:
+        print(f'Generating {args.messages:,} messages for {args.users:,} users...')
+        generate(args.messages, args.users, args.batch_size)
+
+    user_ids = list(User.objects.filter(username__startswith=USER_PREFIX).values_list('id', flat=True))
+    total = Message.objects.filter(session__user_id__in=user_ids).count()
+    print(f'Benchmarking over {total:,} messages, {args.queries} queries per scenario')
+
+    common = [random.choice(VOCABULARY[:50]) for _ in range(args.queries)]
+    rare = [random.choice(VOCABULARY[-1000:]) for _ in range(args.queries)]
+    phrases = [' '.join(random.sample(VOCABULARY[:500], 2)) for _ in range(args.queries)]
+
+    scenarios = [
+        ('common term, per learner', [(q, random.choice(user_ids)) for q in common]),
+        ('rare term, per learner', [(q, random.choice(user_ids)) for q in rare]),
+        ('two terms, per learner', [(q, random.choice(user_ids)) for q in phrases]),
+        ('common term, all learners', [(q, None) for q in common]),
+        ('rare term, all learners', [(q, None) for q in rare]),
+    ]
+    for label, queries in scenarios:
+        measure(label, queries, lambda query, user_id: search_messages(query, user_id=user_id))
+    if args.baseline:
+        for label, queries in scenarios:
+            measure(f'icontains: {label}', queries[:max(args.queries // 10, 1)], icontains_scan)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+WebSocket wire protocol benchmark.
+
+Encodes the frames of typical chat answers and of a history replay with the
+original `json.dumps` encoder, the orjson JSON protocol and the compact
+`ibal.msgpack.v1` protocol, and reports frames encoded per second and bytes
+on the wire per answer, with and without permessage-deflate as negotiated by
+llm_websocket_api.server (no context takeover, small window, frames below the
+compression threshold sent as they are).
+
+No server or database is needed:
+
+    python benchmarks/wire_protocol_benchmark.py --answers 20000 --history 50
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.wire import MsgpackCodec, json_codec
+from llm_websocket_api.server import MEM_LEVEL, WINDOW_BITS
+
+ANSWER = (
+    "To fix step 2, load the lab 3 dataset before calling fit(): the model "
+    "expects the training features as a 2D array. Reshape the column with "
+    "X.reshape(-1, 1) and run the cell again."
+)
+
+
+def answer_frames(sequence, session_id=42):
+    """The frames one answered question costs: the ack and the answer."""
+    now = datetime.now(timezone.utc)
+    return [
+        {'type': 'ack', 'id': str(uuid.uuid4()), 'sequence': sequence},
+        {
+            'type': 'message',
+            'id': str(uuid.uuid4()),
+            'session_id': session_id,
+            'sequence': sequence + 1,
+            'content': ANSWER,
+            'isUser': False,
+            'timestamp': now.isoformat(),
+        },
+    ]
+
+
+def history_frame(messages, session_id=42):
+    start = datetime.now(timezone.utc) - timedelta(hours=1)
+    return {
+        'type': 'history',
+        'messages': [
+            {
+                'id': str(uuid.uuid4()),
+                'session_id': session_id,
+                'sequence': i + 1,
+                'content': f'Question {i} about the lab?' if i % 2 == 0 else ANSWER,
+                'isUser': i % 2 == 0,
+                'timestamp': (start + timedelta(seconds=30 * i)).isoformat(),
+            }
+            for i in range(messages)
+        ],
+        'truncated': False,
+        'last_sequence': messages,
+    }
+
+
+def deflated_size(payload, threshold):
+    """Bytes on the wire under permessage-deflate, without frame headers."""
+    if len(payload) < threshold:
+        return len(payload)
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -WINDOW_BITS, MEM_LEVEL)
+    # The trailing empty block is stripped from each message (RFC 7692)
+    return len(compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4
+
+
+def as_bytes(encoded):
+    return encoded.encode() if isinstance(encoded, str) else encoded
+
+
+def measure(name, encode, frames, history, threshold):
+    started = time.perf_counter()
+    encoded = [as_bytes(encode(frame)) for answer in frames for frame in answer]
+    elapsed = time.perf_counter() - started
+    per_answer = sum(len(payload) for payload in encoded) / len(frames)
+    deflated = sum(deflated_size(payload, threshold) for payload in encoded) / len(frames)
+    replay = as_bytes(encode(history))
+    return {
+        'name': name,
+        'frames_per_sec': len(encoded) / elapsed,
+        'bytes_per_answer': per_answer,
+        'deflated_per_answer': deflated,
+        'history': len(replay),
+        'history_deflated': deflated_size(replay, threshold),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--answers', type=int, default=20_000)
+    parser.add_argument('--history', type=int, default=50, help='messages in the replayed history')
+    parser.add_argument('--threshold', type=int, default=1024, help='WEBSOCKET_COMPRESSION_THRESHOLD')
+    args = parser.parse_args()
+
+    frames = [answer_frames(2 * i + 1) for i in range(args.answers)]
+    history = history_frame(args.history)
+    msgpack_codec = MsgpackCodec()
+    results = [
+        measure('json.dumps', json.dumps, frames, history, args.threshold),
+        measure('orjson', json_codec.encode, frames, history, args.threshold),
+        measure('msgpack compact', msgpack_codec.encode, frames, history, args.threshold),
+    ]
+
+    print(f'{args.answers:,} answers (ack + message), history replay of {args.history} messages, '
+          f'deflate threshold {args.threshold} bytes')
+    print(f'{"protocol":<16} {"frames/s":>12} {"B/answer":>9} {"deflated":>9} {"history B":>10} {"deflated":>9}')
+    for result in results:
+        print(f'{result["name"]:<16} {result["frames_per_sec"]:>12,.0f} {result["bytes_per_answer"]:>9.0f} '
+              f'{result["deflated_per_answer"]:>9.0f} {result["history"]:>10,} {result["history_deflated"]:>9,}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Daphne entrypoint with WebSocket compression and graceful shutdown.
+
+This module runs the regular daphne command line with a server that:
+
+- accepts the client's permessage-deflate offer, so history replays and long
+  answers go out compressed. Daphne doesn't negotiate compression on its own.
+  Frames smaller than WEBSOCKET_COMPRESSION_THRESHOLD bytes are sent as they
+  are: pings, acks and other short frames gain nothing from deflate.
+  Compression state is not kept between frames (no context takeover) and uses
+  a small window, so an idle connection doesn't hold a zlib context.
+- drains the worker on SIGTERM: it stops listening, asks clients to reconnect
+  after a random delay and lets running answers finish for up to
+  WEBSOCKET_DRAIN_TIMEOUT seconds before daphne cancels what is left.
+
+Start it like daphne itself:
+
+    python -m llm_websocket_api.server -b 0.0.0.0 -p 8000 llm_websocket_api.asgi:application
+"""
+import asyncio
+import logging
+
+from autobahn.websocket.compress import PerMessageDeflateOffer, PerMessageDeflateOfferAccept
+from daphne.cli import CommandLineInterface
+from daphne.server import Server
+from daphne.ws_protocol import WebSocketProtocol
+from django.conf import settings
+from twisted.internet import defer, reactor
+
+logger = logging.getLogger(__name__)
+
+# zlib settings for the frames the server compresses
+WINDOW_BITS = 11
+MEM_LEVEL = 4
+
+# Seconds a drained worker waits for clients to complete the close handshake
+CLOSE_GRACE = 2
+
+
+def accept_deflate(offers):
+    """Accept the first permessage-deflate offer of a client, if any."""
+    for offer in offers:
+        if isinstance(offer, PerMessageDeflateOffer):
+            return PerMessageDeflateOfferAccept(
+                offer,
+                request_no_context_takeover=offer.accept_no_context_takeover,
+                request_max_window_bits=WINDOW_BITS if offer.accept_max_window_bits else 0,
+                no_context_takeover=True,
+                window_bits=min(WINDOW_BITS, offer.request_max_window_bits or WINDOW_BITS),
+                mem_level=MEM_LEVEL,
+            )
+    return None
+
+
+class CompressingWebSocketProtocol(WebSocketProtocol):
+    """Daphne's WebSocket protocol, leaving frames below the threshold uncompressed."""
+
+    def sendMessage(self, payload, isBinary=False, fragmentSize=None, sync=False, doNotCompress=False):
+        if len(payload) < settings.WEBSOCKET_COMPRESSION_THRESHOLD:
+            doNotCompress = True
+        super().sendMessage(payload, isBinary, fragmentSize, sync, doNotCompress)
+
+
+class ChatServer(Server):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ports = []
+
+    def run(self):
+        # The WebSocket factory only exists once Server.run has started
+        reactor.callWhenRunning(self.enable_compression)
+        super().run()
+
+    def enable_compression(self):
+        if not settings.WEBSOCKET_COMPRESSION:
+            return
+        self.ws_factory.protocol = CompressingWebSocketProtocol
+        self.ws_factory.setProtocolOptions(perMessageCompressionAccept=accept_deflate)
+        logger.info("WebSocket permessage-deflate enabled for frames of %s bytes or more",
+                    settings.WEBSOCKET_COMPRESSION_THRESHOLD)
+
+    def listen_success(self, port):
+        self.ports.append(port)
+        super().listen_success(port)
+
+    def kill_all_applications(self):
+        """
+        Daphne's before-shutdown trigger, which cancels every connection.
+        Drain the connections first so running answers can finish.
+        """
+        for port in self.ports:
+            port.stopListening()
+        drained = defer.Deferred.fromFuture(asyncio.ensure_future(self.drain()))
+        drained.addErrback(lambda failure: logger.error("Drain failed: %s", failure.getErrorMessage()))
+        drained.addCallback(lambda _: super(ChatServer, self).kill_all_applications())
+        return drained
+
+    async def drain(self):
+        # Imported here: the app modules need Django set up by the daphne CLI first
+        from api.connections import connection_registry
+
+        await connection_registry.drain(
+            timeout=settings.WEBSOCKET_DRAIN_TIMEOUT,
+            jitter=settings.WEBSOCKET_RECONNECT_JITTER,
+        )
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + CLOSE_GRACE
+        while loop.time() < deadline and any(
+            'disconnected' not in details for details in self.connections.values()
+        ):
+            await asyncio.sleep(0.05)
+
+
+class CommandLine(CommandLineInterface):
+    server_class = ChatServer
+
+
+if __name__ == '__main__':
+    CommandLine.entrypoint()
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import socket
 from pathlib import Path
 from dotenv import load_dotenv
 from datetime import timedelta
@@ -56,6 +57,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',  # brotli/gzip for API responses; static files come precompressed
     'whitenoise.middleware.WhiteNoiseMiddleware', # its for serving static files that are not in docker container
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -108,6 +110,16 @@ else:
         }
     }
 
+# Cache shared by all workers: the chat session index and the connection rate
+# limits are kept here, and must be invalidated and counted across workers
+# https://docs.djangoproject.com/en/5.2/ref/settings/#caches
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_REDIS_URL', 'redis://redis:6379/2'),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -195,14 +207,119 @@ if os.getenv('TESTING', 'False') == 'True':
         }
     }
 else:
-    CHANNEL_LAYERS = {
-        'default': {
-            'BACKEND': 'channels_redis.core.RedisChannelLayer',
-            'CONFIG': {
-                "hosts": [('redis', 6379)],
-            },
+    # Comma-separated Redis URLs; with several hosts channels are sharded across them
+    CHANNEL_REDIS_HOSTS = [
+        host.strip() for host in os.getenv('CHANNEL_REDIS_HOSTS', 'redis://redis:6379').split(',') if host.strip()
+    ]
+    # 'core' queues messages in Redis lists with capacity and expiry; 'pubsub' uses
+    # Redis pub/sub, which is cheaper for group fan-out but drops messages for
+    # consumers that aren't listening. See benchmarks/channel_layer_benchmark.py.
+    if os.getenv('CHANNEL_LAYER_TYPE', 'core') == 'pubsub':
+        CHANNEL_LAYERS = {
+            'default': {
+                'BACKEND': 'channels_redis.pubsub.RedisPubSubChannelLayer',
+                'CONFIG': {
+                    "hosts": CHANNEL_REDIS_HOSTS,
+                },
+            }
         }
-    }
+    else:
+        CHANNEL_LAYERS = {
+            'default': {
+                'BACKEND': 'channels_redis.core.RedisChannelLayer',
+                'CONFIG': {
+                    "hosts": CHANNEL_REDIS_HOSTS,
+                    "capacity": int(os.getenv('CHANNEL_LAYER_CAPACITY', 100)),
+                    "expiry": int(os.getenv('CHANNEL_LAYER_EXPIRY', 60)),
+                    "group_expiry": int(os.getenv('CHANNEL_LAYER_GROUP_EXPIRY', 86400)),
+                },
+            }
+        }
+
+# Hot history ring buffer: the most recent messages of each active chat session
+# are kept in Redis so history reads and prompt construction skip the database.
+HOT_HISTORY = {
+    'BACKEND': 'api.history_cache.RedisHistoryBuffer',
+    'LOCATION': os.getenv('HOT_HISTORY_REDIS_URL', 'redis://redis:6379/1'),
+    'MAX_MESSAGES': int(os.getenv('HOT_HISTORY_MAX_MESSAGES', 50)),
+    'TIMEOUT': int(os.getenv('HOT_HISTORY_TIMEOUT', 3600)),  # expire idle sessions after 1 hour
+}
+
+# Number of recent turns sent to Flowise as conversation history (0 disables)
+FLOWISE_HISTORY_TURNS = int(os.getenv('FLOWISE_HISTORY_TURNS', 20))
+
+# Messages per connection that may wait for an answer (including the one being
+# answered) before new ones are rejected
+CHAT_MAX_OUTSTANDING_TURNS = int(os.getenv('CHAT_MAX_OUTSTANDING_TURNS', 3))
+
+# Messages sent within this many milliseconds of each other, before their answer
+# has started, are answered as one turn (0 answers every message separately)
+CHAT_DEBOUNCE_MS = int(os.getenv('CHAT_DEBOUNCE_MS', 0))
+
+# Stream answers from Flowise to the client as they are generated. Chunks are
+# sent every CHAT_STREAM_FLUSH_MS, or sooner once CHAT_STREAM_FLUSH_BYTES are
+# waiting
+CHAT_STREAM_ANSWERS = os.getenv('CHAT_STREAM_ANSWERS', 'False') == 'True'
+CHAT_STREAM_FLUSH_MS = int(os.getenv('CHAT_STREAM_FLUSH_MS', 20))
+CHAT_STREAM_FLUSH_BYTES = int(os.getenv('CHAT_STREAM_FLUSH_BYTES', 512))
+
+# Compression of API responses, brotli or gzip as the client accepts.
+# Responses smaller than API_COMPRESSION_MIN_BYTES and streaming responses
+# are sent as they are
+API_COMPRESSION = os.getenv('API_COMPRESSION', 'True') == 'True'
+API_COMPRESSION_MIN_BYTES = int(os.getenv('API_COMPRESSION_MIN_BYTES', 1024))
+API_COMPRESSION_GZIP_LEVEL = int(os.getenv('API_COMPRESSION_GZIP_LEVEL', 6))
+API_COMPRESSION_BROTLI_QUALITY = int(os.getenv('API_COMPRESSION_BROTLI_QUALITY', 4))
+
+# Sessions inactive for this many days are moved to compressed cold storage
+# by `python manage.py archive_sessions`
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 90))
+
+# Chat events published within this window are sent to a user's connections as one batch
+CHAT_EVENTS_BATCH_WINDOW_MS = int(os.getenv('CHAT_EVENTS_BATCH_WINDOW_MS', 20))
+
+# Identifies this server process in the presence registry
+WORKER_ID = os.getenv('WORKER_ID') or f"{socket.gethostname()}:{os.getpid()}"
+
+# WebSocket connections accepted per client IP per minute (0 disables the limit)
+WEBSOCKET_CONNECTIONS_PER_MINUTE = int(os.getenv('WEBSOCKET_CONNECTIONS_PER_MINUTE', 5))
+
+# Application-level keepalive: quiet connections are pinged every interval, and
+# those whose client answers pings are closed after the idle timeout without
+# any frame from the client. Clients that never answer pings are closed after
+# the silent timeout instead
+WEBSOCKET_PING_INTERVAL = int(os.getenv('WEBSOCKET_PING_INTERVAL', 25))
+WEBSOCKET_IDLE_TIMEOUT = int(os.getenv('WEBSOCKET_IDLE_TIMEOUT', 75))
+WEBSOCKET_SILENT_TIMEOUT = int(os.getenv('WEBSOCKET_SILENT_TIMEOUT', 900))
+# Open connections per worker before the longest idle one is evicted (0 disables)
+WEBSOCKET_MAX_CONNECTIONS_PER_WORKER = int(os.getenv('WEBSOCKET_MAX_CONNECTIONS_PER_WORKER', 0))
+# On shutdown, a worker gives outstanding answers this many seconds to finish.
+# Clients reconnecting are asked to spread out over the jitter window
+WEBSOCKET_DRAIN_TIMEOUT = int(os.getenv('WEBSOCKET_DRAIN_TIMEOUT', 30))
+WEBSOCKET_RECONNECT_JITTER = int(os.getenv('WEBSOCKET_RECONNECT_JITTER', 10))
+# Connects processed per second per worker (0 disables the gate); connects
+# beyond the rate and burst wait for their turn, up to the max wait in seconds
+WEBSOCKET_ADMISSION_RATE = int(os.getenv('WEBSOCKET_ADMISSION_RATE', 100))
+WEBSOCKET_ADMISSION_BURST = int(os.getenv('WEBSOCKET_ADMISSION_BURST', 200))
+WEBSOCKET_ADMISSION_MAX_WAIT = int(os.getenv('WEBSOCKET_ADMISSION_MAX_WAIT', 30))
+# permessage-deflate for frames of at least the threshold size, when the
+# server is started through llm_websocket_api.server
+WEBSOCKET_COMPRESSION = os.getenv('WEBSOCKET_COMPRESSION', 'True') == 'True'
+WEBSOCKET_COMPRESSION_THRESHOLD = int(os.getenv('WEBSOCKET_COMPRESSION_THRESHOLD', 1024))
+# Seconds a signed WebSocket ticket from /api/xblock/websocket-token/ can be
+# used to connect
+WEBSOCKET_TICKET_MAX_AGE = int(os.getenv('WEBSOCKET_TICKET_MAX_AGE', 60))
+# Seconds the index of a user's chat sessions stays cached
+CHAT_SESSION_CACHE_TIMEOUT = int(os.getenv('CHAT_SESSION_CACHE_TIMEOUT', 3600))
+
+# Registry of live WebSocket connections per user, used for event fan-out
+PRESENCE = {
+    'BACKEND': 'api.presence.RedisPresenceRegistry',
+    'LOCATION': os.getenv('PRESENCE_REDIS_URL', 'redis://redis:6379/1'),
+    'HEARTBEAT_INTERVAL': int(os.getenv('PRESENCE_HEARTBEAT_INTERVAL', 30)),
+    'TIMEOUT': int(os.getenv('PRESENCE_TIMEOUT', 90)),  # connections missing 3 heartbeats are dead
+    'MAX_CONNECTIONS_PER_USER': int(os.getenv('MAX_CONNECTIONS_PER_USER', 10)),  # 0 disables the cap
+}
 
 # Logging configuration
 LOGGING = {
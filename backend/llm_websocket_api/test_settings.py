@@ -8,6 +8,13 @@ DATABASES = {
     }
 }
 
+# Use the process-local cache for testing
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 # Use InMemoryChannelLayer for testing
 CHANNEL_LAYERS = {
     'default': {
@@ -15,6 +22,20 @@ CHANNEL_LAYERS = {
     }
 }
 
+# Use the process-local hot history buffer for testing
+HOT_HISTORY = {
+    'BACKEND': 'api.history_cache.InMemoryHistoryBuffer',
+    'MAX_MESSAGES': 50,
+    'TIMEOUT': 3600,
+}
+
+PRESENCE = {
+    'BACKEND': 'api.presence.InMemoryPresenceRegistry',
+    'HEARTBEAT_INTERVAL': 30,
+    'TIMEOUT': 90,
+    'MAX_CONNECTIONS_PER_USER': 3,
+}
+
 # Disable Flowise for testing
 FLOWISE_URL = None
 FLOWISE_FLOW_ID = None
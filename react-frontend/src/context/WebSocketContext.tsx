@@ -132,6 +132,13 @@ export const WebSocketProvider = ({ children }: WebSocketProviderProps) => {
     ws.current.onmessage = (event) => {
       try {
         const message = JSON.parse(event.data);
+
+        // Keepalive: the server closes connections that stop answering
+        if (message.type === 'ping') {
+          ws.current?.send(JSON.stringify({ type: 'pong' }));
+          return;
+        }
+
         console.log('[WebSocket] Message received:', {
           type: message.type,
           timestamp: new Date().toISOString()
@@ -47,6 +47,10 @@ export class WebSocketService {
         
         // Handle different message types
         switch (data.type) {
+          case 'ping':
+            // Keepalive: the server closes connections that stop answering
+            this.ws?.send(JSON.stringify({ type: 'pong' }));
+            break;
           case 'message':
             // Map backend 'isUser' to frontend 'is_user_message' for consistency
             const mappedMessage = {
@@ -23,4 +23,16 @@ hooks.Filters.ENV_TEMPLATE_VARIABLES.add_items(
         ("LLM_SERVICE_HOST", "{{ LLM_SERVICE_HOST }}"),
         ("LLM_SERVICE_PORT", "{{ LLM_SERVICE_PORT }}"),
     ]
-) 
\ No newline at end of file
+) 
+
+# Cache the chat XBlock's CSS and JS for good. The LMS collects them into its
+# static files, and the block links them by fingerprinted URLs that change with
+# every release, so browsers never need to check them again.
+hooks.Filters.ENV_PATCHES.add_item(
+    (
+        "caddyfile-lms",
+        """@ibalxbloc_assets path /static/xblock/resources/ibalxbloc*
+header @ibalxbloc_assets Cache-Control "public, max-age=31536000, immutable"
+""",
+    )
+)
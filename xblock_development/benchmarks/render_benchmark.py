@@ -0,0 +1,117 @@
+"""
+XBlock render benchmark.
+
+Renders a unit page with many IbalXBlocks, as the LMS does when a learner
+opens it, and reports the time spent in student_view per page and per block,
+and the bytes of HTML the page carries. It compares the old view, which read
+the HTML, CSS and JS from the package and rebuilt the HTML on every render,
+then inlined the CSS and JS into the page, with the current one, which loads
+them once per process, only fills in the username and links the CSS and JS
+by fingerprinted URLs that browsers cache across units.
+
+Run it in the XBlock environment with the ibalxbloc package installed:
+
+    python benchmarks/render_benchmark.py
+    python benchmarks/render_benchmark.py --blocks 1 10 50 --pages 200
+"""
+import argparse
+import time
+from importlib.resources import files
+from types import SimpleNamespace
+
+from web_fragments.fragment import Fragment
+from xblock.field_data import DictFieldData
+from xblock.fields import ScopeIds
+from xblock.test.tools import TestRuntime
+
+from ibalxbloc.ibalxbloc import IbalXBlock
+
+
+def legacy_student_view(block, context=None):
+    """student_view as it was before resources were cached."""
+    def resource_string(path):
+        return files('ibalxbloc').joinpath(path).read_text(encoding="utf-8")
+
+    client_id = "n9svQOtyYCkUZLLvPgH1LpEMuSynpO7VMSVeoFl5"
+    client_secret = "HuGrd4T9qmCPvZxkvcHehLYrn4mnYrRAyoN9VHb9ZqNM9aRY3msrrsUX5cQ0gyQR0pyWxz44zXKGHNGXQVxUwnRLdYxrGcaN6xOpf0ia5cAn2J8yUBi2HbikyJqA8cUG"
+    auth_url = "http://local.openedx.io/oauth2/authorize/"
+    token_url = "http://local.openedx.io/oauth2/access_token/"
+    redirect_uri = "http://mylocal.test:8000/api/oauth/callback/"
+    html_str = resource_string('static/html/ibalxbloc.html')
+    html_str = html_str.replace(
+        '<div class="ibalxbloc-container"',
+        f'<div class="ibalxbloc-container" data-client-id="{client_id}" data-client-secret="{client_secret}" data-auth-url="{auth_url}" data-token-url="{token_url}" data-redirect-uri="{redirect_uri}"',
+        1
+    )
+    user = context.get('user') if context else None
+    username = user.username if user else "Unknown User"
+    html_str += f"<script>window.IBAL_USERNAME = '{username}';</script>"
+    frag = Fragment(html_str.format(self=block))
+    frag.add_css(resource_string('public/css/ibalxbloc.css'))
+    frag.add_javascript(resource_string('public/js/ibalxbloc.js'))
+    frag.initialize_js('IbalXBlock')
+    return frag
+
+
+class LMSRuntime(TestRuntime):
+    """A runtime serving public/ resources as static files, like the LMS."""
+
+    def local_resource_url(self, block, uri):
+        return f'/static/xblock/resources/ibalxbloc/{uri}'
+
+
+def make_blocks(count):
+    runtime = LMSRuntime(services={'field-data': DictFieldData({})})
+    return [
+        runtime.construct_xblock_from_class(
+            IbalXBlock, ScopeIds('learner', 'ibalxbloc', f'def-{i}', f'block-v1:unit+type@ibalxbloc+block@{i}')
+        )
+        for i in range(count)
+    ]
+
+
+def measure(render, blocks, pages):
+    """Seconds per page, rendering every block once per page for a new learner."""
+    render(blocks[0], {'user': SimpleNamespace(username='warmup')})
+    started = time.perf_counter()
+    for page in range(pages):
+        context = {'user': SimpleNamespace(username=f'learner{page}')}
+        for block in blocks:
+            render(block, context)
+    return (time.perf_counter() - started) / pages
+
+
+def page_bytes(render, blocks):
+    """Size of the page's block HTML with its resources, each included once."""
+    page = Fragment()
+    context = {'user': SimpleNamespace(username='learner')}
+    for block in blocks:
+        frag = render(block, context)
+        page.add_content(frag.content)
+        page.add_fragment_resources(frag)
+    return sum(len(html.encode()) for html in (
+        page.content, page.head_html(), page.foot_html()
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--blocks', type=int, nargs='+', default=[1, 10, 50], help='blocks on the page')
+    parser.add_argument('--pages', type=int, default=100, help='page renders timed per size')
+    args = parser.parse_args()
+
+    views = (('before', legacy_student_view), ('after', IbalXBlock.student_view))
+    print(f'{"blocks":>6} {"view":>7} {"per page":>10} {"per block":>10} {"page bytes":>11}')
+    for count in args.blocks:
+        blocks = make_blocks(count)
+        timings = {}
+        for name, render in views:
+            timings[name] = measure(render, blocks, args.pages)
+            print(f'{count:>6} {name:>7} {timings[name] * 1e3:>8.2f}ms {timings[name] / count * 1e6:>8.1f}us '
+                  f'{page_bytes(render, blocks):>11,}')
+        print(f'{"":>6} {"speedup":>7} {timings["before"] / timings["after"]:>9.1f}x')
+        print()
+
+
+if __name__ == '__main__':
+    main()
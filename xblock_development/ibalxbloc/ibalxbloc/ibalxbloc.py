@@ -1,9 +1,43 @@
+import hashlib
+import json
+from functools import lru_cache
 from importlib.resources import files
 from xblock.core import XBlock
 from xblock.fields import Scope, String
 from web_fragments.fragment import Fragment
 
 
+@lru_cache(maxsize=None)
+def load_resource(path):
+    """Read a resource from the package, once per process."""
+    return files(__package__).joinpath(path).read_text(encoding="utf-8")
+
+
+@lru_cache(maxsize=None)
+def resource_version(path):
+    """Short hash of a resource's content, which fingerprints its URL."""
+    return hashlib.sha256(files(__package__).joinpath(path).read_bytes()).hexdigest()[:12]
+
+
+@lru_cache(maxsize=None)
+def fragment_html():
+    """
+    The block's HTML with the OAuth2 settings filled in. They are the same for
+    every block and learner, so this is built once per process and
+    student_view only adds the username.
+    """
+    # Updated OAuth2 values for production
+    client_id = "n9svQOtyYCkUZLLvPgH1LpEMuSynpO7VMSVeoFl5"
+    client_secret = "HuGrd4T9qmCPvZxkvcHehLYrn4mnYrRAyoN9VHb9ZqNM9aRY3msrrsUX5cQ0gyQR0pyWxz44zXKGHNGXQVxUwnRLdYxrGcaN6xOpf0ia5cAn2J8yUBi2HbikyJqA8cUG"
+    auth_url = "http://local.openedx.io/oauth2/authorize/"
+    token_url = "http://local.openedx.io/oauth2/access_token/"
+    redirect_uri = "http://mylocal.test:8000/api/oauth/callback/"
+    return load_resource('static/html/ibalxbloc.html').replace(
+        '<div class="ibalxbloc-container"',
+        f'<div class="ibalxbloc-container" data-client-id="{client_id}" data-client-secret="{client_secret}" data-auth-url="{auth_url}" data-token-url="{token_url}" data-redirect-uri="{redirect_uri}"',
+        1
+    )
+
 
 # Define the IbalXBlock class
 class IbalXBlock(XBlock):
@@ -12,32 +46,45 @@ class IbalXBlock(XBlock):
 
     def resource_string(self, path):
         """Handy helper for getting resources from our kit."""
-        return files(__package__).joinpath(path).read_text(encoding="utf-8")
+        return load_resource(path)
+
+    def asset_url(self, path):
+        """
+        URL of a file under public/, fingerprinted with its content hash so it
+        can be cached for good: a new release changes the URL. Returns None
+        in the workbench, and with runtimes that can't serve resources, where
+        the file is inlined instead.
+        """
+        if type(self.runtime).__module__.startswith('workbench.'):
+            return None
+        try:
+            url = self.runtime.local_resource_url(self, path)
+        except NotImplementedError:
+            return None
+        separator = '&' if '?' in url else '?'
+        return f"{url}{separator}v={resource_version(path)}"
 
     def student_view(self, context=None):
         """
         The primary view of the IBALXBlock, shown to students
         when viewing courses.
         """
-        # Updated OAuth2 values for production
-        client_id = "n9svQOtyYCkUZLLvPgH1LpEMuSynpO7VMSVeoFl5"
-        client_secret = "HuGrd4T9qmCPvZxkvcHehLYrn4mnYrRAyoN9VHb9ZqNM9aRY3msrrsUX5cQ0gyQR0pyWxz44zXKGHNGXQVxUwnRLdYxrGcaN6xOpf0ia5cAn2J8yUBi2HbikyJqA8cUG"
-        auth_url = "http://local.openedx.io/oauth2/authorize/"
-        token_url = "http://local.openedx.io/oauth2/access_token/"
-        redirect_uri = "http://mylocal.test:8000/api/oauth/callback/"
-        html_str = self.resource_string('static/html/ibalxbloc.html')
-        html_str = html_str.replace(
-            '<div class="ibalxbloc-container"',
-            f'<div class="ibalxbloc-container" data-client-id="{client_id}" data-client-secret="{client_secret}" data-auth-url="{auth_url}" data-token-url="{token_url}" data-redirect-uri="{redirect_uri}"',
-            1
-        )
-        # Inject username as a JS variable
+        # Inject username as a JS variable, escaped so it can't close the script
         user = context.get('user') if context else None
         username = user.username if user else "Unknown User"
-        html_str += f"<script>window.IBAL_USERNAME = '{username}';</script>"
-        frag = Fragment(html_str.format(self=self))
-        frag.add_css(self.resource_string('static/css/ibalxbloc.css'))
-        frag.add_javascript(self.resource_string('static/js/src/ibalxbloc.js'))
+        username_js = json.dumps(username).replace('</', '<\\/')
+        frag = Fragment(f"{fragment_html()}<script>window.IBAL_USERNAME = {username_js};</script>")
+        # Link the CSS and JS so browsers cache them across units, rather than
+        # downloading them again inside every page
+        for path, add_url, add_inline in (
+            ('public/css/ibalxbloc.css', frag.add_css_url, frag.add_css),
+            ('public/js/ibalxbloc.js', frag.add_javascript_url, frag.add_javascript),
+        ):
+            url = self.asset_url(path)
+            if url:
+                add_url(url)
+            else:
+                add_inline(load_resource(path))
         frag.initialize_js('IbalXBlock')
         return frag
 
@@ -12,6 +12,8 @@ function IbalXBlock(runtime, element) {
     $container.data("redirect-uri") ||
     "http://mylocal.test:8000/api/oauth/callback/";
   const websocketUrl = "ws://localhost:8000/ws/chat/";
+  // Each instance of the block keeps its own conversation
+  const chatScope = $(element).data("usage-id") || "";
 
   // Chat state variables
   let websocket = null;
@@ -143,16 +145,12 @@ function IbalXBlock(runtime, element) {
 
     try {
       console.log("[IbalXBlock] Using access_token for WebSocket:", token);
-      console.log(
-        "[IbalXBlock] Opening WebSocket connection to:",
-        `${websocketUrl}?token=${token}&auth_type=oauth2`
-      );
+      const chatUrl = `${websocketUrl}?token=${token}&auth_type=oauth2&scope=${encodeURIComponent(chatScope)}`;
+      console.log("[IbalXBlock] Opening WebSocket connection to:", chatUrl);
 
       updateConnectionStatus("connecting", "Connecting...");
 
-      websocket = new WebSocket(
-        `${websocketUrl}?token=${token}&auth_type=oauth2`
-      );
+      websocket = new WebSocket(chatUrl);
 
       websocket.onopen = function () {
         console.log("[IbalXBlock] WebSocket connection opened");
@@ -176,7 +174,10 @@ function IbalXBlock(runtime, element) {
         try {
           const data = JSON.parse(event.data);
 
-          if (data.type === "message") {
+          if (data.type === "ping") {
+            // Keepalive: the server closes connections that stop answering
+            websocket.send(JSON.stringify({ type: "pong" }));
+          } else if (data.type === "message") {
             const isOwnMessage = data.sender === currentUsername;
             addMessage(data.content, data.sender, isOwnMessage);
           } else if (data.type === "user_info") {
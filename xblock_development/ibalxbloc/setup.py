@@ -16,9 +16,9 @@ setup(
     },
     package_data={
         'ibalxbloc': [
-            'static/css/*.css',
             'static/html/*.html',
-            'static/js/src/*.js',
+            'public/css/*.css',
+            'public/js/*.js',
             'static/README.txt',
             'translations/README.txt',
         ]
@@ -1,5 +1,6 @@
 """TO-DO: Write a description of what this XBlock is."""
 
+from functools import lru_cache
 from importlib.resources import files
 
 from web_fragments.fragment import Fragment
@@ -7,6 +8,12 @@ from xblock.core import XBlock
 from xblock.fields import Integer, Scope
 
 
+@lru_cache(maxsize=None)
+def load_resource(path):
+    """Read a resource from the package, once per process."""
+    return files(__package__).joinpath(path).read_text(encoding="utf-8")
+
+
 class TestXBlock(XBlock):
     """
     TO-DO: document what your XBlock does.
@@ -23,7 +30,7 @@ class TestXBlock(XBlock):
 
     def resource_string(self, path):
         """Handy helper for getting resources from our kit."""
-        return files(__package__).joinpath(path).read_text(encoding="utf-8")
+        return load_resource(path)
 
     # TO-DO: change this view to display your data your own way.
     def student_view(self, context=None):
@@ -31,10 +38,10 @@ class TestXBlock(XBlock):
         The primary view of the TestXBlock, shown to students
         when viewing courses.
         """
-        html = self.resource_string("static/html/testxbloc.html")
+        html = load_resource("static/html/testxbloc.html")
         frag = Fragment(html.format(self=self))
-        frag.add_css(self.resource_string("static/css/testxbloc.css"))
-        frag.add_javascript(self.resource_string("static/js/src/testxbloc.js"))
+        frag.add_css(load_resource("static/css/testxbloc.css"))
+        frag.add_javascript(load_resource("static/js/src/testxbloc.js"))
         frag.initialize_js('TestXBlock')
         return frag
 